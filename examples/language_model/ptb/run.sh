@@ -49,6 +49,9 @@ dropout_hidden=0.65
 dropout_out=0.0
 dropout_emb=0.2
 weight_decay=1e-6
+output_loss=softmax
+n_samples=1024
+sampling_proposal=log_uniform
 
 ### path to save the model
 model=/n/sd3/inaguma/result/ptb
@@ -164,6 +167,9 @@ if [ ${stage} -le 3 ]; then
         --dropout_out ${dropout_out} \
         --dropout_emb ${dropout_emb} \
         --weight_decay ${weight_decay} \
+        --output_loss ${output_loss} \
+        --n_samples ${n_samples} \
+        --sampling_proposal ${sampling_proposal} \
         --resume ${resume} || exit 1;
 
     echo "Finish LM training (stage: 3)." && exit 1;
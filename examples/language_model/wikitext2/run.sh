@@ -50,6 +50,9 @@ dropout_out=0.0
 dropout_emb=0.2
 weight_decay=1e-6
 adaptive_softmax=false
+output_loss=softmax
+n_samples=1024
+sampling_proposal=log_uniform
 
 ### path to save the model
 model=/n/sd3/inaguma/result/wikitext2
@@ -166,6 +169,9 @@ if [ ${stage} -le 3 ]; then
         --dropout_emb ${dropout_emb} \
         --weight_decay ${weight_decay} \
         --adaptive_softmax ${adaptive_softmax} \
+        --output_loss ${output_loss} \
+        --n_samples ${n_samples} \
+        --sampling_proposal ${sampling_proposal} \
         --resume ${resume} || exit 1;
 
     echo "Finish LM training (stage: 3)." && exit 1;
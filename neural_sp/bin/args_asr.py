@@ -10,7 +10,7 @@ import argparse
 from distutils.util import strtobool
 
 
-def parse():
+def parse(argv=None):
     parser = argparse.ArgumentParser()
     # general
     parser.add_argument('--corpus', type=str,
@@ -21,6 +21,10 @@ def parse():
                         help='directory to save a model')
     parser.add_argument('--resume', type=str, default=False, nargs='?',
                         help='path to the model to resume training')
+    parser.add_argument('--async_checkpoint', type=strtobool, default=True,
+                        help='save checkpoints on a background thread')
+    parser.add_argument('--n_keep_checkpoints', type=int, default=1,
+                        help='number of the latest checkpoints to keep in addition to the best one')
     parser.add_argument('--job_name', type=str, default='',
                         help='name of job')
     # dataset
@@ -65,6 +69,27 @@ def parse():
     parser.add_argument('--input_type', type=str, default='speech',
                         choices=['speech', 'text'],
                         help='type of input features')
+    parser.add_argument('--frontend', type=str, default='kaldi',
+                        choices=['kaldi', 'logmel'],
+                        help='kaldi: read features dumped by Kaldi, logmel: compute log-mel features from wav files in feat_path')
+    parser.add_argument('--sample_rate', type=int, default=16000,
+                        help='sampling rate of wav files (for the logmel frontend)')
+    parser.add_argument('--n_mels', type=int, default=80,
+                        help='number of mel bins (for the logmel frontend)')
+    parser.add_argument('--add_deltas', type=strtobool, default=False,
+                        help='append delta and delta-delta features (for the logmel frontend)')
+    parser.add_argument('--cmvn_path', type=str, default=None, nargs='?',
+                        help='global CMVN statistics computed by neural_sp/bin/compute_cmvn.py (for the logmel frontend)')
+    parser.add_argument('--n_ques', type=int, default=None, nargs='?',
+                        help='number of mini-batches made at once by a preloading process (None means loading in the main process)')
+    parser.add_argument('--feat_cache_size', type=int, default=0,
+                        help='size of the LRU cache of features in MB (0 means no cache)')
+    parser.add_argument('--feat_cache_dir', type=str, default='/dev/shm',
+                        help='directory to cache features dumped by Kaldi (shared by preloading processes)')
+    parser.add_argument('--speed_perturb', type=strtobool, default=False,
+                        help='perturb speed of training utterances on the fly')
+    parser.add_argument('--speed_factors', type=str, default='0.9_1.0_1.1',
+                        help='speed factors for speed perturbation (separated by "_")')
     parser.add_argument('--n_splices', type=int, default=1,
                         help='number of input frames to splice (both for left and right frames)')
     parser.add_argument('--n_stacks', type=int, default=1,
@@ -75,6 +100,8 @@ def parse():
                         help='maximum number of input frames')
     parser.add_argument('--min_n_frames', type=int, default=40,
                         help='minimum number of input frames')
+    parser.add_argument('--collate_batch', type=strtobool, default=False,
+                        help='pad mini-batches into pinned tensors in the data loader')
     parser.add_argument('--dynamic_batching', type=strtobool, default=True,
                         help='')
     parser.add_argument('--sequence_summary_network', type=strtobool, default=False,
@@ -157,6 +184,8 @@ def parse():
                         help='residual connection between each decoder layer')
     parser.add_argument('--input_feeding', type=strtobool, default=False, nargs='?',
                         help='')
+    parser.add_argument('--dec_jit_step', type=strtobool, default=False, nargs='?',
+                        help='run the RNN decoder step compiled by TorchScript (loop_type=normal without LM fusion)')
     parser.add_argument('--dec_bottleneck_dim', type=int, default=1024,
                         help='number of dimensions of the bottleneck layer before the softmax layer')
     parser.add_argument('--emb_dim', type=int, default=512,
@@ -169,6 +198,9 @@ def parse():
                         help='')
     parser.add_argument('--ctc_fc_list_sub2', type=str, default="", nargs='?',
                         help='')
+    parser.add_argument('--ctc_loss_type', type=str, default='warpctc',
+                        choices=['warpctc', 'pytorch'],
+                        help='implementation of CTC loss (pytorch computes on the device of logits)')
     # optimization
     parser.add_argument('--batch_size', type=int, default=50,
                         help='size of mini-batch')
@@ -185,6 +217,12 @@ def parse():
                         help='')
     parser.add_argument('--print_step', type=int, default=200,
                         help='step to print log')
+    parser.add_argument('--profile', type=strtobool, default=False,
+                        help='measure time and memory of each part of training steps')
+    parser.add_argument('--profile_trace_start', type=int, default=100,
+                        help='step to start capturing torch.profiler traces')
+    parser.add_argument('--profile_trace_n_steps', type=int, default=0,
+                        help='number of steps to capture torch.profiler traces')
     parser.add_argument('--metric', type=str, default='edit_distance',
                         choices=['edit_distance', 'loss', 'acc', 'ppl', 'bleu'],
                         help='metric for evaluation during training')
@@ -255,6 +293,8 @@ def parse():
                         help='total loss weight for the 2nd auxiliary task')
     parser.add_argument('--mtl_per_batch', type=strtobool, default=False, nargs='?',
                         help='change mini-batch per task')
+    parser.add_argument('--mtl_shared_encoder', type=strtobool, default=False, nargs='?',
+                        help='share the encoder outputs among tasks in mtl_per_batch training and update all tasks at once')
     parser.add_argument('--task_specific_layer', type=strtobool, default=False, nargs='?',
                         help='insert a task-specific encoder layer per task')
     # foroward-backward
@@ -318,6 +358,10 @@ def parse():
                         help='recognize by teacher-forcing')
     parser.add_argument('--recog_batch_size', type=int, default=1,
                         help='size of mini-batch in evaluation')
+    parser.add_argument('--recog_window', type=int, default=2000,
+                        help='number of input frames in each window for long-form decoding')
+    parser.add_argument('--recog_window_overlap', type=int, default=400,
+                        help='number of input frames shared by adjacent windows for long-form decoding')
     parser.add_argument('--recog_beam_width', type=int, default=1,
                         help='size of beam')
     parser.add_argument('--recog_max_len_ratio', type=float, default=1,
@@ -338,6 +382,14 @@ def parse():
                         help='weight of LM score')
     parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
                         help='weight of CTC score')
+    parser.add_argument('--recog_shortlist', type=strtobool, default=False,
+                        help='restrict the output layers to a per-utterance shortlist in beam search')
+    parser.add_argument('--recog_shortlist_topk', type=int, default=10,
+                        help='number of tokens taken from each frame of CTC posteriors for the shortlist')
+    parser.add_argument('--recog_shortlist_n_frequent', type=int, default=1000,
+                        help='number of the first (most frequent) tokens in the dictionary added to the shortlist')
+    parser.add_argument('--recog_shortlist_min_mass', type=float, default=0.95,
+                        help='use the full vocabulary if the shortlist covers less CTC posterior mass than this value')
     parser.add_argument('--recog_lm', type=str, default=None, nargs='?',
                         help='path to the RMMLM')
     parser.add_argument('--recog_lm_bwd', type=str, default=None, nargs='?',
@@ -383,6 +435,21 @@ def parse():
                         help='threshold of word frequency for the dynamic cache')
     parser.add_argument('--recog_static_cache_set', type=str, default=False, nargs='?',
                         help='path to a tsv file for the training set')
+    parser.add_argument('--recog_n_jobs', type=int, default=1,
+                        help='number of CPU worker processes for sharded evaluation')
+    parser.add_argument('--recog_n_threads', type=int, default=1,
+                        help='number of intra-op threads per worker in sharded evaluation')
+    # server related
+    parser.add_argument('--server_host', type=str, default='localhost',
+                        help='host name of the local ASR server')
+    parser.add_argument('--server_port', type=int, default=8080,
+                        help='port of the local ASR server')
+    parser.add_argument('--server_max_batch_size', type=int, default=16,
+                        help='maximum number of requests decoded in a mini-batch')
+    parser.add_argument('--server_max_frames', type=int, default=30000,
+                        help='maximum number of padded input frames in a mini-batch')
+    parser.add_argument('--server_max_wait_ms', type=float, default=20,
+                        help='maximum time to wait for following requests to make a mini-batch')
     # distillation related
     parser.add_argument('--recog_nbest', type=float, default=1,
                         help='N-best list for sampling')
@@ -392,5 +459,5 @@ def parse():
                         choices=['teacher_forcing', 'beam_search'],
                         help='')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
@@ -10,7 +10,7 @@ import argparse
 from distutils.util import strtobool
 
 
-def parse():
+def parse(argv=None):
     parser = argparse.ArgumentParser()
     # general
     parser.add_argument('--corpus', type=str,
@@ -21,6 +21,10 @@ def parse():
                         help='directory to save a model')
     parser.add_argument('--resume', type=str, default=False, nargs='?',
                         help='path to the model to resume training')
+    parser.add_argument('--async_checkpoint', type=strtobool, default=True,
+                        help='save checkpoints on a background thread')
+    parser.add_argument('--n_keep_checkpoints', type=int, default=1,
+                        help='number of the latest checkpoints to keep in addition to the best one')
     parser.add_argument('--job_name', type=str, default='',
                         help='name of job')
     # dataset
@@ -82,6 +86,12 @@ def parse():
                         help='')
     parser.add_argument('--print_step', type=int, default=100,
                         help='step to print log')
+    parser.add_argument('--profile', type=strtobool, default=False,
+                        help='measure time and memory of each part of training steps')
+    parser.add_argument('--profile_trace_start', type=int, default=100,
+                        help='step to start capturing torch.profiler traces')
+    parser.add_argument('--profile_trace_n_steps', type=int, default=0,
+                        help='number of steps to capture torch.profiler traces')
     parser.add_argument('--decay_type', type=str, default='epoch',
                         choices=['epoch', 'metric'],
                         help='')
@@ -121,6 +131,14 @@ def parse():
                         help='')
     parser.add_argument('--adaptive_softmax', type=strtobool, default=False,
                         help='use adaptive softmax')
+    parser.add_argument('--output_loss', type=str, default='softmax',
+                        choices=['softmax', 'sampled_softmax', 'nce'],
+                        help='training objective of the output layer (the exact softmax is used for evaluation)')
+    parser.add_argument('--n_samples', type=int, default=1024,
+                        help='number of negative samples per mini-batch for sampled_softmax and nce')
+    parser.add_argument('--sampling_proposal', type=str, default='log_uniform',
+                        choices=['log_uniform', 'unigram'],
+                        help='proposal distribution of negative samples')
     # contextualization
     parser.add_argument('--serialize', type=strtobool, default=False, nargs='?',
                         help='serialize text according to onset in dialogue')
@@ -140,5 +158,5 @@ def parse():
                         help='theta paramter for cache')
     parser.add_argument('--recog_cache_lambda', type=float, default=0.2,
                         help='lambda paramter for cache')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Benchmark the RNN decoder step compiled by TorchScript."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from distutils.util import strtobool
+import numpy as np
+import time
+import torch
+
+from neural_sp.models.seq2seq.decoders.rnn import RNNDecoder
+
+
+def build_decoder(args):
+    return RNNDecoder(eos=2, unk=1, pad=3, blank=0,
+                      enc_n_units=args.enc_n_units,
+                      attn_type=args.attn_type,
+                      attn_dim=args.attn_dim,
+                      attn_sharpening_factor=1.0,
+                      attn_conv_out_channels=10,
+                      attn_conv_kernel_size=100,
+                      attn_n_heads=1,
+                      rnn_type=args.dec_type,
+                      n_units=args.dec_n_units,
+                      n_projs=args.dec_n_projs,
+                      n_layers=args.dec_n_layers,
+                      residual=args.dec_residual,
+                      loop_type='normal',
+                      bottleneck_dim=args.dec_n_units,
+                      emb_dim=args.emb_dim,
+                      tie_embedding=False,
+                      vocab=args.vocab,
+                      dropout=args.dropout,
+                      dropout_att=args.dropout)
+
+
+def measure(fn, n_iters, cuda):
+    if cuda:
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(n_iters):
+        out = fn()
+    if cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start_time) / n_iters * 1000, out
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--xmax', type=int, default=200,
+                        help='length of the encoder outputs')
+    parser.add_argument('--ymax', type=int, default=50,
+                        help='length of the label sequences')
+    parser.add_argument('--enc_n_units', type=int, default=512)
+    parser.add_argument('--attn_type', type=str, default='location')
+    parser.add_argument('--attn_dim', type=int, default=512)
+    parser.add_argument('--dec_type', type=str, default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--dec_n_units', type=int, default=512)
+    parser.add_argument('--dec_n_projs', type=int, default=0)
+    parser.add_argument('--dec_n_layers', type=int, default=1)
+    parser.add_argument('--dec_residual', type=strtobool, default=False)
+    parser.add_argument('--emb_dim', type=int, default=256)
+    parser.add_argument('--vocab', type=int, default=1000)
+    parser.add_argument('--dropout', type=float, default=0.0)
+    parser.add_argument('--n_iters', type=int, default=10)
+    parser.add_argument('--n_threads', type=int, default=1)
+    parser.add_argument('--gpu', type=strtobool, default=False)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.n_threads)
+    torch.manual_seed(1)
+    dec = build_decoder(args)
+    cuda = args.gpu and torch.cuda.is_available()
+    if cuda:
+        dec.cuda()
+
+    eouts = next(dec.parameters()).new_zeros(
+        (args.batch_size, args.xmax, args.enc_n_units)).uniform_(-1, 1)
+    elens = [args.xmax - b * (args.xmax // (args.batch_size * 2)) for b in range(args.batch_size)]
+    ys = [np.random.randint(4, args.vocab, size=args.ymax - b).tolist() for b in range(args.batch_size)]
+
+    def train_step():
+        dec.zero_grad()
+        loss, _, _ = dec.forward_att(eouts, elens, ys, None)
+        loss.backward()
+        return loss.item(), [p.grad.clone() for p in dec.parameters() if p.grad is not None]
+
+    def greedy():
+        with torch.no_grad():
+            return dec.greedy(eouts, elens, max_len_ratio=args.ymax / args.xmax)[0]
+
+    results = {}
+    for jit_step in [False, True]:
+        dec.jit_step = jit_step
+        dec.train()
+        if jit_step:
+            # compile
+            train_step()
+        torch.manual_seed(1)
+        time_train, (loss, grads) = measure(train_step, args.n_iters, cuda)
+        dec.eval()
+        time_greedy, hyps = measure(greedy, args.n_iters, cuda)
+        results[jit_step] = (loss, grads, hyps)
+        print('jit_step=%s: train %.2f [ms/batch], greedy %.2f [ms/batch]' %
+              (jit_step, time_train, time_greedy))
+
+    loss, grads, hyps = results[False]
+    loss_jit, grads_jit, hyps_jit = results[True]
+    max_diff = max((g - g_jit).abs().max().item() for g, g_jit in zip(grads, grads_jit))
+    print('loss: %.6f / %.6f (diff: %.3e)' % (loss, loss_jit, abs(loss - loss_jit)))
+    print('max difference of gradients: %.3e' % max_diff)
+    print('same hypotheses: %s' % all(np.array_equal(h, h_jit) for h, h_jit in zip(hyps, hyps_jit)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Benchmark the dynamic int8 quantization against float32 on CPU."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import io
+import multiprocessing as mp
+import resource
+import time
+import torch
+
+from neural_sp.bin.asr.export import load_dev_subset
+from neural_sp.bin.asr.export import load_inputs
+from neural_sp.bin.asr.export import token_error_rate
+from neural_sp.bin.asr.recognizer import Recognizer
+
+
+def model_size(model):
+    """Size of the serialized parameters in bytes."""
+    f = io.BytesIO()
+    torch.save(model.state_dict(), f)
+    return f.tell()
+
+
+def run(args, quantize, queue):
+    torch.set_num_threads(args.n_threads)
+    feat_paths, refs = load_dev_subset(args.dev_set, args.n_dev_utts)
+    results = {}
+    for beam_width in [1, args.beam_width]:
+        recog_params = {'recog_beam_width': beam_width, 'recog_lm': args.lm,
+                        'recog_lm_weight': args.lm_weight if args.lm is not None else 0.}
+        recognizer = Recognizer(args.model, recog_params, batch_size=args.batch_size,
+                                frame_shift=args.frame_shift, quantize=quantize)
+        xs = load_inputs(feat_paths, recognizer.frontend)
+        duration = sum(len(x) for x in xs) * args.frame_shift
+        start_time = time.time()
+        hyps = [r['token_ids'] for r in recognizer(xs)]
+        results[beam_width] = {'rtf': (time.time() - start_time) / duration,
+                               'ter': token_error_rate(refs, hyps)}
+        results['size'] = model_size(recognizer.model)
+        del recognizer
+    # NOTE: kilobytes on Linux
+    results['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put(results)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True,
+                        help='path to the saved model (model.epoch-*)')
+    parser.add_argument('--dev_set', type=str, required=True,
+                        help='dataset tsv file')
+    parser.add_argument('--n_dev_utts', type=int, default=100)
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='size of mini-batch for greedy decoding')
+    parser.add_argument('--beam_width', type=int, default=4)
+    parser.add_argument('--lm', type=str, default=None,
+                        help='path to the LM for shallow fusion (quantized as well)')
+    parser.add_argument('--lm_weight', type=float, default=0.1)
+    parser.add_argument('--frame_shift', type=float, default=0.01,
+                        help='frame shift of input features in seconds')
+    parser.add_argument('--n_threads', type=int, default=1)
+    args = parser.parse_args()
+
+    # NOTE: each setting runs in a new process to measure the peak memory separately
+    results = {}
+    for quantize in [False, True]:
+        queue = mp.Queue()
+        p = mp.Process(target=run, args=(args, quantize, queue))
+        p.start()
+        results[quantize] = queue.get()
+        p.join()
+
+    print('%-8s %10s %12s %10s %10s %10s %10s' % ('', 'size[MB]', 'peak RSS[MB]',
+                                                  'RTF(greedy)', 'TER(greedy)',
+                                                  'RTF(beam)', 'TER(beam)'))
+    for quantize in [False, True]:
+        r = results[quantize]
+        print('%-8s %10.1f %12.1f %10.3f %10.2f %10.3f %10.2f' % (
+            'int8' if quantize else 'float32',
+            r['size'] / 1024 ** 2, r['peak_rss'] / 1024 ** 2,
+            r[1]['rtf'], r[1]['ter'], r[args.beam_width]['rtf'], r[args.beam_width]['ter']))
+    for beam_width in [1, args.beam_width]:
+        print('speedup (beam=%d): %.2fx' % (beam_width, results[False][beam_width]['rtf'] /
+                                            results[True][beam_width]['rtf']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Client of the local ASR server (neural_sp/bin/asr/server.py)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import numpy as np
+
+try:
+    from urllib.request import Request
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import Request
+    from urllib2 import urlopen
+
+from utils import kaldi_io
+
+
+def recognize(url, x=None, wav_path=None, timeout=600):
+    """Send an utterance to the server.
+
+    Args:
+        url (str): e.g., http://localhost:8080
+        x (np.ndarray): features of size `[T, input_dim]`
+        wav_path (str): path to a wav file (instead of x)
+        timeout (float):
+    Returns:
+        result (dict): text, token_ids and latency
+
+    """
+    if wav_path is not None:
+        with open(wav_path, 'rb') as f:
+            data = f.read()
+        content_type = 'audio/wav'
+    else:
+        buf = io.BytesIO()
+        np.save(buf, np.asarray(x, dtype=np.float32))
+        data = buf.getvalue()
+        content_type = 'application/octet-stream'
+    request = Request(url.rstrip('/') + '/recognize', data=data,
+                      headers={'Content-Type': content_type})
+    return json.loads(urlopen(request, timeout=timeout).read().decode('utf-8'))
+
+
+def metrics(url):
+    return json.loads(urlopen(url.rstrip('/') + '/metrics').read().decode('utf-8'))
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', type=str, default='http://localhost:8080')
+    parser.add_argument('--feat_path', type=str, default=None,
+                        help='Kaldi feature (e.g., foo.ark:123) or .npy file')
+    parser.add_argument('--wav', type=str, default=None,
+                        help='wav file (for the server with the logmel frontend)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='show metrics of the server')
+    args = parser.parse_args()
+
+    if args.metrics:
+        print(json.dumps(metrics(args.url), indent=2))
+    elif args.wav is not None:
+        print(json.dumps(recognize(args.url, wav_path=args.wav)))
+    elif args.feat_path is not None:
+        x = np.load(args.feat_path) if args.feat_path.endswith('.npy') else kaldi_io.read_mat(args.feat_path)
+        print(json.dumps(recognize(args.url, x=x)))
+    else:
+        parser.error('--feat_path, --wav or --metrics is required')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Decode long-form recordings (e.g., whole talks) by overlapping windows."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+
+from neural_sp.bin.args_asr import parse
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.bin.train_utils import set_logger
+from neural_sp.datasets.frontend import build_frontend
+from neural_sp.datasets.loader_asr import Dataset
+from neural_sp.evaluators.edit_distance import compute_edit_distance
+from neural_sp.models.seq2seq.long_form import LongFormRecognizer
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+from neural_sp.utils import mkdir_join
+
+
+def main():
+
+    args = parse()
+
+    # Load a conf file
+    dir_name = os.path.dirname(args.recog_model[0])
+    conf = load_config(os.path.join(dir_name, 'conf.yml'))
+
+    # Overwrite conf
+    for k, v in conf.items():
+        if 'recog' not in k:
+            setattr(args, k, v)
+    recog_params = vars(args)
+
+    # Setting for logging
+    if os.path.isfile(os.path.join(args.recog_dir, 'decode.log')):
+        os.remove(os.path.join(args.recog_dir, 'decode.log'))
+    logger = set_logger(os.path.join(args.recog_dir, 'decode.log'), key='decoding')
+
+    # Load the ASR model
+    model = Seq2seq(args)
+    model, checkpoint = load_checkpoint(model, args.recog_model[0])
+    model.save_path = dir_name
+    model.cuda()
+
+    logger.info('window: %d frames' % args.recog_window)
+    logger.info('window overlap: %d frames' % args.recog_window_overlap)
+    logger.info('number of windows per batch: %d' % args.recog_batch_size)
+    logger.info('beam width: %d' % args.recog_beam_width)
+    logger.info('CTC weight: %.3f' % args.recog_ctc_weight)
+
+    wer_avg = 0
+    for s in args.recog_sets:
+        # NOTE: each row of the tsv file is a whole recording
+        dataset = Dataset(corpus=args.corpus,
+                          tsv_path=s,
+                          dict_path=os.path.join(dir_name, 'dict.txt'),
+                          nlsyms=os.path.join(dir_name, 'nlsyms.txt'),
+                          wp_model=os.path.join(dir_name, 'wp.model'),
+                          unit=args.unit,
+                          batch_size=1,
+                          is_test=True,
+                          frontend=build_frontend(args, cmvn_path=os.path.join(dir_name, 'cmvn.npz') if os.path.isfile(
+                              os.path.join(dir_name, 'cmvn.npz')) else None))
+        recognizer = LongFormRecognizer(model, recog_params, dataset.idx2token[0],
+                                        window=args.recog_window,
+                                        overlap=args.recog_window_overlap,
+                                        batch_size=args.recog_batch_size)
+
+        start_time = time.time()
+        wer, n_word, n_frames = 0, 0, 0
+        recog_dir = mkdir_join(args.recog_dir, dataset.set)
+        with open(os.path.join(recog_dir, 'hyp.trn'), 'w') as f_hyp, \
+                open(os.path.join(recog_dir, 'ref.trn'), 'w') as f_ref:
+            while True:
+                batch, is_new_epoch = dataset.next(1)
+                best_hyp_id, _ = recognizer(batch['xs'][0])
+                ref = batch['text'][0]
+                hyp = dataset.idx2token[0](best_hyp_id)
+                n_frames += len(batch['xs'][0])
+
+                # Write to trn
+                utt_id = str(batch['utt_ids'][0])
+                speaker = str(batch['speakers'][0]).replace('-', '_')
+                f_ref.write(ref + ' (' + speaker + '-' + utt_id + ')\n')
+                f_hyp.write(hyp + ' (' + speaker + '-' + utt_id + ')\n')
+                logger.info('utt-id: %s' % utt_id)
+                logger.info('Hyp: %s' % hyp)
+
+                # Compute WER
+                # NOTE: compute_wer keeps the whole DP matrix, which is too large for recordings
+                wer += compute_edit_distance(ref=ref.split(' '), hyp=hyp.split(' ')) * 100
+                n_word += len(ref.split(' '))
+
+                if is_new_epoch:
+                    break
+
+        wer /= n_word
+        wer_avg += wer
+        logger.info('WER (%s): %.2f %%' % (dataset.set, wer))
+        logger.info('Elasped time: %.2f [sec] (%d frames)' % (time.time() - start_time, n_frames))
+
+    logger.info('WER (avg.): %.2f %%\n' % (wer_avg / len(args.recog_sets)))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,23 +11,24 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import argparse
 import copy
 import os
 import time
 
 from neural_sp.bin.args_asr import parse
+from neural_sp.bin.inference_utils import build_lm
+from neural_sp.bin.inference_utils import load_args
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
 from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.datasets.frontend import build_frontend
 from neural_sp.datasets.loader_asr import Dataset
 from neural_sp.evaluators.character import eval_char
 from neural_sp.evaluators.phone import eval_phone
 from neural_sp.evaluators.ppl import eval_ppl
+from neural_sp.evaluators.sharding import eval_sharded
 from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
-from neural_sp.models.lm.gated_convlm import GatedConvLM
-from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.seq2seq import Seq2seq
 from neural_sp.models.seq2seq.skip_thought import SkipThought
 
@@ -73,7 +74,9 @@ def main():
                           unit_sub2=args.unit_sub2,
                           batch_size=args.recog_batch_size,
                           skip_thought=skip_thought,
-                          is_test=True)
+                          is_test=True,
+                          frontend=build_frontend(args, cmvn_path=os.path.join(dir_name, 'cmvn.npz') if os.path.isfile(
+                              os.path.join(dir_name, 'cmvn.npz')) else None))
 
         if i == 0:
             # Load the ASR model
@@ -100,7 +103,8 @@ def main():
 
                     model_e = Seq2seq(args_e)
                     model_e, _ = load_checkpoint(model_e, recog_model_e)
-                    model_e.cuda()
+                    if args.recog_n_jobs <= 1:
+                        model_e.cuda()
                     ensemble_models += [model_e]
 
             # For shallow fusion
@@ -109,16 +113,11 @@ def main():
                     # Load a LM conf file
                     conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
 
-                    # Merge conf with args
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
+                    # Merge conf with the default options
+                    args_lm = load_args(conf_lm)
 
                     # Load the pre-trianed LM
-                    if args_lm.lm_type == 'gated_cnn':
-                        lm = GatedConvLM(args_lm)
-                    else:
-                        lm = RNNLM(args_lm)
+                    lm = build_lm(args_lm)
                     lm, _ = load_checkpoint(lm, args.recog_lm)
                     if args_lm.backward:
                         model.lm_bwd = lm
@@ -130,16 +129,11 @@ def main():
                     # Load a LM conf file
                     conf_lm = load_config(os.path.join(args.recog_lm_bwd, 'conf.yml'))
 
-                    # Merge conf with args
-                    args_lm_bwd = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm_bwd, k, v)
+                    # Merge conf with the default options
+                    args_lm_bwd = load_args(conf_lm)
 
                     # Load the pre-trianed LM
-                    if args_lm_bwd.lm_type == 'gated_cnn':
-                        lm_bwd = GatedConvLM(args_lm_bwd)
-                    else:
-                        lm_bwd = RNNLM(args_lm_bwd)
+                    lm_bwd = build_lm(args_lm_bwd)
                     lm_bwd, _ = load_checkpoint(lm_bwd, args.recog_lm_bwd)
                     model.lm_bwd = lm_bwd
 
@@ -175,44 +169,47 @@ def main():
             logger.info('cache lambda (speech): %.3f' % (args.recog_cache_lambda_speech))
             logger.info('cache theta (lm): %.3f' % (args.recog_cache_theta_lm))
             logger.info('cache lambda (lm): %.3f' % (args.recog_cache_lambda_lm))
+            logger.info('number of jobs: %d' % (args.recog_n_jobs))
 
             # GPU setting
-            model.cuda()
+            # NOTE: sharded evaluation runs on CPU
+            if args.recog_n_jobs <= 1:
+                model.cuda()
 
         start_time = time.time()
 
         if args.recog_metric == 'edit_distance':
             if args.recog_unit in ['word', 'word_char']:
-                wer, cer, _ = eval_word(ensemble_models, dataset, recog_params,
-                                        epoch=epoch - 1,
-                                        recog_dir=args.recog_dir,
-                                        progressbar=True)
-                wer_avg += wer
-                cer_avg += cer
+                eval_fn, eval_kwargs = eval_word, {}
             elif args.recog_unit == 'wp':
-                wer, cer = eval_wordpiece(ensemble_models, dataset, recog_params,
-                                          epoch=epoch - 1,
-                                          recog_dir=args.recog_dir,
-                                          progressbar=True)
-                wer_avg += wer
-                cer_avg += cer
+                eval_fn, eval_kwargs = eval_wordpiece, {}
             elif 'char' in args.recog_unit:
-                wer, cer = eval_char(ensemble_models, dataset, recog_params,
-                                     epoch=epoch - 1,
-                                     recog_dir=args.recog_dir,
-                                     progressbar=True,
-                                     task_idx=0)
+                eval_fn, eval_kwargs = eval_char, {'task_idx': 0}
                 #  task_idx=1 if args.recog_unit and 'char' in args.recog_unit else 0)
-                wer_avg += wer
-                cer_avg += cer
             elif 'phone' in args.recog_unit:
-                per = eval_phone(ensemble_models, dataset, recog_params,
-                                 epoch=epoch - 1,
-                                 recog_dir=args.recog_dir,
-                                 progressbar=True)[0]
-                per_avg += per
+                eval_fn, eval_kwargs = eval_phone, {}
             else:
                 raise ValueError(args.recog_unit)
+
+            if args.recog_n_jobs > 1:
+                results = eval_sharded(eval_fn, ensemble_models, dataset, recog_params,
+                                       epoch=epoch - 1,
+                                       recog_dir=args.recog_dir,
+                                       n_jobs=args.recog_n_jobs,
+                                       n_threads=args.recog_n_threads,
+                                       **eval_kwargs)
+            else:
+                results = eval_fn(ensemble_models, dataset, recog_params,
+                                  epoch=epoch - 1,
+                                  recog_dir=args.recog_dir,
+                                  progressbar=True,
+                                  **eval_kwargs)
+
+            if eval_fn is eval_phone:
+                per_avg += results
+            else:
+                wer_avg += results[0]
+                cer_avg += results[1]
         elif args.recog_metric == 'acc':
             raise NotImplementedError
         elif args.recog_metric in ['ppl', 'loss']:
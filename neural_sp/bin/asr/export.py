@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Export the ASR/LM model for inference."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from distutils.util import strtobool
+import numpy as np
+import os
+import pandas as pd
+import sys
+import time
+import torch
+
+from neural_sp.bin.asr.recognizer import load_lm
+from neural_sp.bin.asr.recognizer import Recognizer
+from neural_sp.bin.inference_utils import export_checkpoint
+from neural_sp.bin.inference_utils import load_inference_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.datasets.frontend import read_wav
+from neural_sp.evaluators.edit_distance import compute_edit_distance
+from utils import kaldi_io
+
+
+def load_dev_subset(tsv_path, n_utts):
+    """Load the first utterances of a dataset tsv file.
+
+    Args:
+        tsv_path (str): path to the dataset tsv file
+        n_utts (int): number of utterances
+    Returns:
+        feat_paths (list): paths to Kaldi features or wav files
+        refs (list): A list of length `[B]`, which contains token IDs of references
+
+    """
+    df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
+    df = df[df['ylen'] > 0][:n_utts]
+    refs = [[int(y) for y in str(token_ids).split()] for token_ids in df['token_id']]
+    return df['feat_path'].tolist(), refs
+
+
+def load_inputs(feat_paths, frontend=None):
+    """Load input features (wav files are converted by the frontend).
+
+    Args:
+        feat_paths (list):
+        frontend (LogMelFrontend):
+    Returns:
+        xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+
+    """
+    if frontend is not None:
+        return frontend.compute([read_wav(p)[0] for p in feat_paths])
+    return [kaldi_io.read_mat(p) for p in feat_paths]
+
+
+def token_error_rate(refs, hyps):
+    """Token error rate (%) over all utterances."""
+    n_errors = sum(compute_edit_distance(ref, hyp) for ref, hyp in zip(refs, hyps))
+    return n_errors * 100 / max(sum(len(ref) for ref in refs), 1)
+
+
+def perplexity(lm, refs):
+    """Perplexity of a LM over all utterances."""
+    total_loss = 0
+    n_tokens = 0
+    for ref in refs:
+        ys = np.array([lm.eos] + ref + [lm.eos], dtype=np.int64)
+        loss = lm([ys], None, is_eval=True)[0].item()
+        total_loss += loss * (len(ref) + 1)
+        n_tokens += len(ref) + 1
+    return np.exp(total_loss / n_tokens)
+
+
+def check_accuracy(model_path, exported_model, args):
+    """Compare the exported model with the float32 model on a dev subset.
+
+    The token error rate of greedy decoding is compared for ASR models,
+    and perplexity is compared for LMs.
+
+    Args:
+        model_path (str): path to the saved model (model.epoch-*)
+        exported_model (torch.nn.Module): model loaded from the exported checkpoint
+        args (Namespace):
+    Returns:
+        degradation (float): absolute increase of the token error rate (%) for ASR,
+            relative increase of perplexity (%) for LM
+
+    """
+    feat_paths, refs = load_dev_subset(args.dev_set, args.n_dev_utts)
+    conf = load_config(os.path.join(os.path.dirname(model_path), 'conf.yml'))
+    if 'enc_type' in conf:
+        recognizer = Recognizer(model_path, batch_size=args.batch_size)
+        xs = load_inputs(feat_paths, recognizer.frontend)
+        scores = []
+        for model in [recognizer.model, exported_model]:
+            recognizer.model = model
+            start_time = time.time()
+            hyps = [r['token_ids'] for r in recognizer(xs)]
+            scores.append(token_error_rate(refs, hyps))
+            print('Token error rate: %.2f %% (%.3f [sec])' % (scores[-1], time.time() - start_time))
+        return scores[1] - scores[0]
+    else:
+        lm, _ = load_lm(model_path)
+        lm.eval()
+        scores = [perplexity(model, refs) for model in [lm, exported_model]]
+        print('Perplexity: %.2f -> %.2f' % tuple(scores))
+        return (scores[1] - scores[0]) * 100 / scores[0]
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True,
+                        help='path to the saved model (model.epoch-*)')
+    parser.add_argument('--out', type=str, default=None,
+                        help='path to the exported model (model_inference.epoch-* by default)')
+    parser.add_argument('--fp16', type=strtobool, default=False,
+                        help='save parameters in half precision')
+    parser.add_argument('--quantize', type=strtobool, default=False,
+                        help='apply dynamic int8 quantization to LSTM/GRU/Linear layers (for CPU)')
+    # accuracy check
+    parser.add_argument('--dev_set', type=str, default=None,
+                        help='dataset tsv file to compare the exported model with the float32 model')
+    parser.add_argument('--n_dev_utts', type=int, default=100,
+                        help='number of utterances used for the accuracy check')
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='size of mini-batch for the accuracy check')
+    parser.add_argument('--max_degradation', type=float, default=1.0,
+                        help='maximum absolute increase of the token error rate (%%) for ASR, '
+                             'or relative increase of perplexity (%%) for LM')
+    parser.add_argument('--n_threads', type=int, default=1,
+                        help='number of CPU threads for the accuracy check')
+    args = parser.parse_args()
+
+    save_path = export_checkpoint(args.model, args.out, fp16=args.fp16, quantize=args.quantize)
+    print('Exported: %s' % save_path)
+    print('Size: %.1f [MB] -> %.1f [MB]' % (os.path.getsize(args.model) / 1024 ** 2,
+                                            os.path.getsize(save_path) / 1024 ** 2))
+
+    # Check the exported model
+    start_time = time.time()
+    model, _ = load_inference_checkpoint(save_path)
+    print('Loading time: %.3f [sec]' % (time.time() - start_time))
+
+    if args.dev_set is not None:
+        torch.set_num_threads(args.n_threads)
+        degradation = check_accuracy(args.model, model, args)
+        print('Degradation: %.2f %%' % degradation)
+        if degradation > args.max_degradation:
+            print('The exported model is degraded more than %.2f %%.' % args.max_degradation)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
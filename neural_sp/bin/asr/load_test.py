@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Send concurrent requests to the local ASR server and measure latency."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+import time
+
+from neural_sp.bin.asr.client import metrics
+from neural_sp.bin.asr.client import recognize
+from utils import kaldi_io
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', type=str, default='http://localhost:8080')
+    parser.add_argument('--tsv', type=str, default=None,
+                        help='tsv file of the dataset (utterances are sent from feat_path)')
+    parser.add_argument('--input_dim', type=int, default=80,
+                        help='dimension of random features (without --tsv)')
+    parser.add_argument('--min_n_frames', type=int, default=100,
+                        help='minimum length of random features (without --tsv)')
+    parser.add_argument('--max_n_frames', type=int, default=1000,
+                        help='maximum length of random features (without --tsv)')
+    parser.add_argument('--n_requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='number of clients sending requests at the same time')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1)
+    if args.tsv is not None:
+        df = pd.read_csv(args.tsv, encoding='utf-8', delimiter='\t')
+        feat_paths = df['feat_path'].values[rng.randint(0, len(df), size=args.n_requests)]
+        xs = [kaldi_io.read_mat(p) for p in feat_paths]
+    else:
+        xs = [rng.randn(rng.randint(args.min_n_frames, args.max_n_frames + 1), args.input_dim).astype(np.float32)
+              for _ in range(args.n_requests)]
+
+    def _send(x):
+        start_time = time.time()
+        try:
+            recognize(args.url, x=x)
+            return time.time() - start_time, True
+        except Exception:
+            return time.time() - start_time, False
+
+    pool = ThreadPool(args.concurrency)
+    start_time = time.time()
+    try:
+        results = pool.map(_send, xs)
+    finally:
+        pool.close()
+    elapsed = time.time() - start_time
+
+    latencies = np.array([t for t, ok in results if ok]) * 1000
+    n_frames = sum(len(x) for x in xs)
+    print('requests: %d (failed: %d), concurrency: %d' %
+          (len(xs), sum(not ok for _, ok in results), args.concurrency))
+    print('throughput: %.2f [requests/sec], %.1f [frames/sec]' % (len(xs) / elapsed, n_frames / elapsed))
+    if len(latencies) > 0:
+        print('latency [ms]: p50 %.1f / p90 %.1f / p99 %.1f / max %.1f' %
+              (np.percentile(latencies, 50), np.percentile(latencies, 90),
+               np.percentile(latencies, 99), latencies.max()))
+    print('server metrics: %s' % json.dumps(metrics(args.url)))
+
+
+if __name__ == '__main__':
+    main()
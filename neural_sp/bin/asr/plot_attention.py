@@ -10,21 +10,21 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import argparse
 import copy
 import numpy as np
 import os
 import shutil
 
 from neural_sp.bin.args_asr import parse
+from neural_sp.bin.inference_utils import build_lm
+from neural_sp.bin.inference_utils import load_args
 from neural_sp.bin.plot_utils import plot_attention_weights
 from neural_sp.bin.plot_utils import plot_cache_weights
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
 from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.datasets.frontend import build_frontend
 from neural_sp.datasets.loader_asr import Dataset
-from neural_sp.models.lm.gated_convlm import GatedConvLM
-from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.seq2seq import Seq2seq
 from neural_sp.utils import mkdir_join
 
@@ -60,7 +60,9 @@ def main():
                           unit=args.unit,
                           unit_sub1=args.unit_sub1,
                           batch_size=args.recog_batch_size,
-                          is_test=True)
+                          is_test=True,
+                          frontend=build_frontend(args, cmvn_path=os.path.join(dir_name, 'cmvn.npz') if os.path.isfile(
+                              os.path.join(dir_name, 'cmvn.npz')) else None))
 
         if i == 0:
             # Load the ASR model
@@ -93,16 +95,11 @@ def main():
                     # Load a LM conf file
                     conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
 
-                    # Merge conf with args
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
+                    # Merge conf with the default options
+                    args_lm = load_args(conf_lm)
 
                     # Load the pre-trianed LM
-                    if args_lm.lm_type == 'gated_cnn':
-                        lm = GatedConvLM(args_lm)
-                    else:
-                        lm = RNNLM(args_lm)
+                    lm = build_lm(args_lm)
                     lm, _ = load_checkpoint(lm, args.recog_lm)
                     if args_lm.backward:
                         model.lm_bwd = lm
@@ -114,16 +111,11 @@ def main():
                     # Load a LM conf file
                     conf_lm = load_config(os.path.join(args.recog_lm_bwd, 'conf.yml'))
 
-                    # Merge conf with args
-                    args_lm_bwd = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm_bwd, k, v)
+                    # Merge conf with the default options
+                    args_lm_bwd = load_args(conf_lm)
 
                     # Load the pre-trianed LM
-                    if args_lm_bwd.lm_type == 'gated_cnn':
-                        lm_bwd = GatedConvLM(args_lm_bwd)
-                    else:
-                        lm_bwd = RNNLM(args_lm_bwd)
+                    lm_bwd = build_lm(args_lm_bwd)
                     lm_bwd, _ = load_checkpoint(lm_bwd, args.recog_lm_bwd)
                     model.lm_bwd = lm_bwd
 
@@ -19,6 +19,7 @@ from neural_sp.bin.plot_utils import plot_ctc_probs
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
 from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.datasets.frontend import build_frontend
 from neural_sp.datasets.loader_asr import Dataset
 from neural_sp.models.seq2seq.seq2seq import Seq2seq
 from neural_sp.utils import mkdir_join
@@ -64,7 +65,9 @@ def main():
                           unit=args.unit,
                           unit_sub1=args.unit_sub1,
                           batch_size=args.recog_batch_size,
-                          is_test=True)
+                          is_test=True,
+                          frontend=build_frontend(args, cmvn_path=os.path.join(dir_name, 'cmvn.npz') if os.path.isfile(
+                              os.path.join(dir_name, 'cmvn.npz')) else None))
 
         if i == 0:
             # Load the ASR model
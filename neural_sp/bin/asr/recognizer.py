@@ -0,0 +1,284 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""In-process ASR API decoding NumPy arrays without Dataset."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import logging
+import numpy as np
+import os
+import shutil
+import tempfile
+import torch
+import torch.nn.functional as F
+
+from neural_sp.bin.args_asr import parse
+from neural_sp.bin.inference_utils import build_lm
+from neural_sp.bin.inference_utils import extract_files
+from neural_sp.bin.inference_utils import load_args
+from neural_sp.bin.inference_utils import load_inference_checkpoint
+from neural_sp.bin.inference_utils import quantize_model
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.datasets.frontend import build_frontend
+from neural_sp.datasets.token_converter.character import Idx2char
+from neural_sp.datasets.token_converter.phone import Idx2phone
+from neural_sp.datasets.token_converter.word import Idx2word
+from neural_sp.datasets.token_converter.wordpiece import Idx2wp
+from neural_sp.models.seq2seq.long_form import ctc_forced_align
+from neural_sp.models.seq2seq.seq2seq import Seq2seq
+from neural_sp.models.seq2seq.session_decoding import SessionParallelDecoder
+from neural_sp.models.torch_utils import is_quantized
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger('decoding')
+
+
+def build_idx2token(unit, dict_path, wp_model=None):
+    """Build the converter from indices to tokens.
+
+    Args:
+        unit (str): word or wp or char or phone or word_char
+        dict_path (str): path to the dictionary
+        wp_model (str): path to the word-piece model for sentencepiece
+    Returns:
+        idx2token ():
+
+    """
+    if unit in ['word', 'word_char']:
+        return Idx2word(dict_path)
+    elif unit == 'wp':
+        return Idx2wp(dict_path, wp_model)
+    elif unit == 'char':
+        return Idx2char(dict_path)
+    elif 'phone' in unit:
+        return Idx2phone(dict_path)
+    else:
+        raise ValueError(unit)
+
+
+def load_lm(lm_path):
+    """Load a pre-trained LM for shallow fusion.
+
+    Args:
+        lm_path (str): path to the saved LM (conf.yml is in the same directory)
+    Returns:
+        lm (torch.nn.Module):
+        backward (bool): True for the backward LM
+
+    """
+    args_lm = load_args(load_config(os.path.join(os.path.dirname(lm_path), 'conf.yml')))
+    lm, _ = load_checkpoint(build_lm(args_lm), lm_path)
+    return lm, args_lm.backward
+
+
+class Recognizer(object):
+    """Decode feature arrays by a model loaded once.
+
+    The model is loaded from a training checkpoint (model.epoch-*, with conf.yml
+    and dictionaries in the same directory) or an inference-only checkpoint
+    exported by neural_sp/bin/asr/export.py. Nothing is written to files, and
+    hypotheses are not logged unless the `decoding` logger is enabled.
+
+    Args:
+        model_path (str): path to the checkpoint
+        recog_params (dict): `recog_*` settings (see neural_sp/bin/args_asr.py).
+            The defaults are used for missing keys.
+        use_gpu (bool): decode on the GPU
+        batch_size (int): number of utterances decoded at once.
+            Beam search decodes a single utterance at a time.
+        frame_shift (float): frame shift of input features in seconds (for timings)
+        quantize (bool): apply dynamic int8 quantization to the model and the LM
+            (see neural_sp.bin.inference_utils.quantize_model). Only for CPU.
+
+    """
+
+    def __init__(self, model_path, recog_params=None, use_gpu=False, batch_size=16,
+                 frame_shift=0.01, quantize=False):
+        params = vars(parse([]))
+        params.update(recog_params or {})
+        self.batch_size = batch_size
+        self.frame_shift = frame_shift
+
+        save_dir = tempfile.mkdtemp()
+        try:
+            if 'model_inference' in os.path.basename(model_path):
+                recog_keys = {k: v for k, v in params.items() if 'recog' in k}
+                self.model, checkpoint = load_inference_checkpoint(model_path, recog_keys)
+                conf = vars(checkpoint['args'])
+                extract_files(checkpoint['files'], save_dir)
+                model_dir = save_dir
+            else:
+                model_dir = os.path.dirname(model_path)
+                conf = load_config(os.path.join(model_dir, 'conf.yml'))
+            for k, v in conf.items():
+                if 'recog' not in k:
+                    params[k] = v
+            args = argparse.Namespace(**params)
+            if 'model_inference' not in os.path.basename(model_path):
+                self.model, _ = load_checkpoint(Seq2seq(args), model_path)
+
+            self.unit = params['recog_unit'] or params['unit']
+            self.idx2token = build_idx2token(self.unit, os.path.join(model_dir, 'dict.txt'),
+                                             os.path.join(model_dir, 'wp.model'))
+            cmvn_path = os.path.join(model_dir, 'cmvn.npz')
+            self.frontend = build_frontend(args, cmvn_path=cmvn_path if os.path.isfile(cmvn_path) else None)
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+
+        if quantize and use_gpu:
+            raise ValueError('Quantized models run only on CPU.')
+        if quantize and not is_quantized(self.model):
+            self.model = quantize_model(self.model)
+
+        if not params['lm_fusion'] and params['recog_lm'] is not None and params['recog_lm_weight'] > 0:
+            lm, backward = load_lm(params['recog_lm'])
+            if quantize:
+                lm = quantize_model(lm)
+            if backward:
+                self.model.lm_bwd = lm
+            else:
+                self.model.lm_fwd = lm
+
+        if use_gpu and torch.cuda.is_available():
+            self.model.cuda()
+        self.model.eval()
+        self.params = params
+
+        self.task = 'ys'
+        if self.unit != params['unit']:
+            if self.unit == params.get('unit_sub1'):
+                self.task = 'ys_sub1'
+            elif self.unit == params.get('unit_sub2'):
+                self.task = 'ys_sub2'
+        self.batched = params['recog_beam_width'] == 1 and not params['recog_fwd_bwd_attention']
+        # NOTE: encoder outputs cannot be shared when the backward decoder takes flipped inputs
+        self.share_enc_outs = not (self.model.mtl_per_batch and (
+            params['recog_bwd_attention'] or params['recog_fwd_bwd_attention']))
+        self.has_ctc = self.task == 'ys' and self.model.ctc_weight > 0 and hasattr(self.model, 'dec_fwd')
+
+    def _decode_batch(self, xs, return_timings):
+        enc_outs = None
+        if self.share_enc_outs:
+            enc_outs = self.model.encode_for_decoding(xs, self.task)
+        if self.batched:
+            best_hyps_id, _, _ = self.model.decode(xs, self.params, self.idx2token,
+                                                   exclude_eos=True, task=self.task, enc_outs=enc_outs)
+        else:
+            best_hyps_id = []
+            for b, x in enumerate(xs):
+                enc_outs_b = None
+                if enc_outs is not None:
+                    enc_outs_b = {k: {'xs': v['xs'][b:b + 1, :v['xlens'][b]] if v['xs'] is not None else None,
+                                      'xlens': v['xlens'][b:b + 1] if v['xlens'] is not None else None}
+                                  for k, v in enc_outs.items()}
+                best_hyps_id += self.model.decode([x], self.params, self.idx2token,
+                                                  exclude_eos=True, task=self.task, enc_outs=enc_outs_b)[0]
+        hyps = [[int(y) for y in hyp if y != self.model.eos] for hyp in best_hyps_id]
+
+        scores = [None] * len(xs)
+        timings = [None] * len(xs)
+        if self.has_ctc:
+            if enc_outs is None:
+                enc_outs = self.model.encode_for_decoding(xs, self.task)
+            with torch.no_grad():
+                eouts, elens = enc_outs[self.task]['xs'], enc_outs[self.task]['xlens']
+                log_probs = self.model.dec_fwd.ctc_log_probs(eouts)
+                scores = self.ctc_scores(log_probs, elens, hyps)
+            if return_timings:
+                log_probs = tensor2np(log_probs)
+                for b, (x, hyp) in enumerate(zip(xs, hyps)):
+                    frames = ctc_forced_align(log_probs[b, :elens[b]], hyp, self.model.blank)
+                    if frames is not None:
+                        timings[b] = (frames * len(x) / elens[b] * self.frame_shift).tolist()
+
+        return [{'token_ids': hyp,
+                 'text': self.idx2token(hyp),
+                 'score': score,
+                 'timings': timing} for hyp, score, timing in zip(hyps, scores, timings)]
+
+    def ctc_scores(self, log_probs, elens, hyps):
+        """Log-likelihood of hypotheses by the CTC branch.
+
+        Args:
+            log_probs (FloatTensor): `[B, T, vocab]`
+            elens (list): A list of length `[B]`
+            hyps (list): A list of length `[B]`, which contains a list of size `[L]`
+        Returns:
+            scores (list): A list of length `[B]`
+
+        """
+        ylens = [len(y) for y in hyps]
+        ys = pad_list([np2tensor(np.array(y if len(y) > 0 else [0], dtype=np.int64), self.model.device_id)
+                       for y in hyps], 0)
+        nll = F.ctc_loss(log_probs.transpose(0, 1), ys,
+                         torch.tensor(elens, dtype=torch.long), torch.tensor(ylens, dtype=torch.long),
+                         blank=self.model.blank, reduction='none')
+        return [-s for s in nll.tolist()]
+
+    def __call__(self, xs, return_timings=False):
+        """Decode utterances.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            return_timings (bool): compute the start time of each token in seconds
+                by the CTC forced alignment (None without CTC)
+        Returns:
+            results (list): A list of length `[B]`, which contains dicts of
+                token_ids (list): token IDs
+                text (str): transcription
+                score (float): log-likelihood of the hypothesis by CTC (None without CTC)
+                timings (list): start time of each token in seconds
+
+        """
+        # Decode utterances of similar lengths together to reduce padding
+        order = sorted(range(len(xs)), key=lambda i: len(xs[i]), reverse=True)
+        results = [None] * len(xs)
+        for i in range(0, len(order), self.batch_size):
+            indices = order[i:i + self.batch_size]
+            for j, result in zip(indices, self._decode_batch([xs[j] for j in indices], return_timings)):
+                results[j] = result
+        return results
+
+    def recognize_sessions(self, xs, sessions, n_slots=8):
+        """Decode utterances of multiple sessions (e.g., conversations) in parallel.
+
+        States are carried over between utterances of the same session according
+        to recog_asr_state_carry_over, recog_lm_state_carry_over and recog_n_caches.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            sessions (list): A list of length `[B]`, session of each utterance.
+                Utterances of each session must be in the onset order.
+            n_slots (int): maximum number of sessions decoded at once
+        Returns:
+            results (list): A list of length `[B]`, which contains dicts of token_ids and text
+
+        """
+        decoder = SessionParallelDecoder(self.model, self.params, self.idx2token, n_slots, self.task)
+        best_hyps_id = decoder(xs, sessions)
+        return [{'token_ids': [int(y) for y in hyp], 'text': self.idx2token(hyp)} for hyp in best_hyps_id]
+
+    def recognize_waveforms(self, signals, return_timings=False):
+        """Decode waveforms in memory (only for models trained with the logmel frontend).
+
+        Args:
+            signals (list): A list of length `[B]`, which contains arrays of size `[n_samples]`
+                in the 16-bit integer scale
+            return_timings (bool):
+        Returns:
+            results (list): see __call__
+
+        """
+        if self.frontend is None:
+            raise ValueError('The model is not trained with the logmel frontend.')
+        return self(self.frontend.compute(signals), return_timings)
@@ -0,0 +1,253 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Local ASR server decoding concurrent requests in mini-batches.
+
+POST /recognize with a .npy array of size `[T, input_dim]`
+(Content-Type: application/octet-stream) or a 16-bit PCM wav file
+(Content-Type: audio/wav, only for the logmel frontend) returns
+{"text": ..., "token_ids": [...], "score": ..., "timings": ..., "latency": ...}.
+GET /metrics returns the queue depth, the histogram of batch sizes and
+latency percentiles.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import Counter
+from collections import deque
+import io
+import json
+import logging
+import numpy as np
+import os
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from queue import Empty
+    from queue import Queue
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from Queue import Empty
+    from Queue import Queue
+    from SocketServer import ThreadingMixIn
+
+from neural_sp.bin.args_asr import parse
+from neural_sp.bin.asr.recognizer import Recognizer
+from neural_sp.bin.train_utils import set_logger
+from neural_sp.datasets.frontend import read_wav
+
+logger = logging.getLogger('decoding')
+
+
+class _Request(object):
+
+    def __init__(self, x):
+        self.x = x
+        self.arrival = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchScheduler(object):
+    """Coalesce concurrent requests into mini-batches.
+
+    A mini-batch is closed when `max_wait_ms` has passed since the arrival
+    of its first request, when it has `max_batch_size` requests, or when the
+    padded number of frames would exceed `max_frames`.
+
+    Args:
+        decode_fn (callable): function taking a list of arrays of size `[T, input_dim]`
+            and returning a list of results
+        max_batch_size (int): maximum number of requests in a mini-batch
+        max_frames (int): maximum number of padded frames in a mini-batch
+        max_wait_ms (float): deadline to wait for following requests
+        n_latencies (int): number of the latest requests to compute latency percentiles
+
+    """
+
+    def __init__(self, decode_fn, max_batch_size=16, max_frames=30000, max_wait_ms=20,
+                 n_latencies=10000):
+        self.decode_fn = decode_fn
+        self.max_batch_size = max_batch_size
+        self.max_frames = max_frames
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = Queue()
+        self._pending = None  # request which did not fit in the previous mini-batch
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._latencies = deque(maxlen=n_latencies)
+        self._n_requests = 0
+
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, x):
+        """Decode an utterance (blocks until decoded).
+
+        Args:
+            x (np.ndarray): `[T, input_dim]`
+        Returns:
+            result: returned by decode_fn
+
+        """
+        request = _Request(x)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        first = self._pending if self._pending is not None else self._queue.get()
+        self._pending = None
+        batch = [first]
+        max_len = len(first.x)
+        deadline = first.arrival + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except Empty:
+                break
+            if max(max_len, len(request.x)) * (len(batch) + 1) > self.max_frames:
+                self._pending = request
+                break
+            batch.append(request)
+            max_len = max(max_len, len(request.x))
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.decode_fn([r.x for r in batch])
+                for r, result in zip(batch, results):
+                    r.result = result
+            except Exception as e:
+                logger.exception('Failed to decode a mini-batch')
+                for r in batch:
+                    r.error = e
+            now = time.time()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._n_requests += len(batch)
+                for r in batch:
+                    self._latencies.append(now - r.arrival)
+            for r in batch:
+                r.done.set()
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            metrics = {
+                'queue_depth': self._queue.qsize() + int(self._pending is not None),
+                'n_requests': self._n_requests,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            }
+        for p in [50, 90, 99]:
+            metrics['latency_p%d_ms' % p] = float(np.percentile(latencies, p)) if len(latencies) > 0 else 0.
+        return metrics
+
+
+class ASRServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scheduler, frontend=None):
+        HTTPServer.__init__(self, address, ASRRequestHandler)
+        self.scheduler = scheduler
+        self.frontend = frontend
+
+
+class ASRRequestHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(self.server.scheduler.metrics())
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        if self.path != '/recognize':
+            self._send_json({'error': 'not found'}, status=404)
+            return
+        start_time = time.time()
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        try:
+            if 'wav' in (self.headers.get('Content-Type') or ''):
+                if self.server.frontend is None:
+                    raise ValueError('wav inputs need --frontend logmel')
+                signal, sample_rate = read_wav(io.BytesIO(data))
+                if sample_rate != self.server.frontend.sample_rate:
+                    raise ValueError('Sampling rate is %d (expected %d)' %
+                                     (sample_rate, self.server.frontend.sample_rate))
+                x = self.server.frontend.compute([signal])[0]
+            else:
+                x = np.load(io.BytesIO(data)).astype(np.float32)
+            if x.ndim != 2 or len(x) == 0:
+                raise ValueError('inputs must be of size [T, input_dim]')
+        except Exception as e:
+            self._send_json({'error': str(e)}, status=400)
+            return
+        try:
+            result = self.server.scheduler.submit(x)
+        except Exception as e:
+            self._send_json({'error': str(e)}, status=500)
+            return
+        result['latency'] = time.time() - start_time
+        self._send_json(result)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+
+    args = parse()
+    set_logger(os.path.join(args.recog_dir, 'server.log'), key='decoding')
+
+    # NOTE: the model is loaded once and shared by all requests
+    recognizer = Recognizer(args.recog_model[0],
+                            recog_params={k: v for k, v in vars(args).items() if 'recog' in k},
+                            use_gpu=args.n_gpus > 0,
+                            batch_size=args.server_max_batch_size)
+
+    scheduler = BatchScheduler(recognizer,
+                               max_batch_size=args.server_max_batch_size if recognizer.batched else 1,
+                               max_frames=args.server_max_frames,
+                               max_wait_ms=args.server_max_wait_ms)
+    server = ASRServer((args.server_host, args.server_port), scheduler, recognizer.frontend)
+    logger.info('Serving on %s:%d' % (args.server_host, args.server_port))
+    print('Serving on %s:%d' % (args.server_host, args.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,6 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import argparse
 import copy
 import cProfile
 import numpy as np
@@ -22,6 +21,7 @@ import torch
 from tqdm import tqdm
 
 from neural_sp.bin.args_asr import parse
+from neural_sp.bin.inference_utils import load_args
 from neural_sp.bin.lr_controller import Controller
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import save_config
@@ -29,7 +29,11 @@ from neural_sp.bin.train_utils import set_logger
 from neural_sp.bin.train_utils import set_save_path
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import save_checkpoint
+from neural_sp.bin.train_utils import wait_checkpoint
 from neural_sp.bin.reporter import Reporter
+from neural_sp.bin.step_profiler import StepProfiler
+from neural_sp.datasets.feature_cache import build_feat_cache
+from neural_sp.datasets.frontend import build_frontend
 from neural_sp.datasets.loader_asr import Dataset
 from neural_sp.evaluators.character import eval_char
 from neural_sp.evaluators.phone import eval_phone
@@ -88,6 +92,7 @@ def main():
     skip_thought = 'skip' in args.enc_type
 
     # Load dataset
+    feat_cache = build_feat_cache(args)  # shared by the training and dev sets
     train_set = Dataset(corpus=args.corpus,
                         tsv_path=args.train_set,
                         tsv_path_sub1=args.train_set_sub1,
@@ -109,6 +114,7 @@ def main():
                         sort_by_input_length=True,
                         short2long=True,
                         sort_stop_epoch=args.sort_stop_epoch,
+                        n_ques=args.n_ques,
                         dynamic_batching=args.dynamic_batching,
                         ctc=args.ctc_weight > 0,
                         ctc_sub1=args.ctc_weight_sub1 > 0,
@@ -117,7 +123,14 @@ def main():
                         subsample_factor_sub1=subsample_factor_sub1,
                         subsample_factor_sub2=subsample_factor_sub2,
                         contextualize=args.contextualize,
-                        skip_thought=skip_thought)
+                        skip_thought=skip_thought,
+                        collate=args.collate_batch and args.input_type == 'speech',
+                        n_stacks=args.n_stacks,
+                        n_skips=args.n_skips,
+                        n_splices=args.n_splices,
+                        frontend=build_frontend(args),
+                        feat_cache=feat_cache,
+                        speed_factors=[float(s) for s in args.speed_factors.split('_')] if args.speed_perturb else None)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       tsv_path_sub1=args.dev_set_sub1,
@@ -136,6 +149,7 @@ def main():
                       min_n_frames=args.min_n_frames,
                       max_n_frames=args.max_n_frames,
                       shuffle=True if args.contextualize else False,
+                      n_ques=args.n_ques,
                       ctc=args.ctc_weight > 0,
                       ctc_sub1=args.ctc_weight_sub1 > 0,
                       ctc_sub2=args.ctc_weight_sub2 > 0,
@@ -143,7 +157,13 @@ def main():
                       subsample_factor_sub1=subsample_factor_sub1,
                       subsample_factor_sub2=subsample_factor_sub2,
                       contextualize=args.contextualize,
-                      skip_thought=skip_thought)
+                      skip_thought=skip_thought,
+                      collate=args.collate_batch and args.input_type == 'speech',
+                      n_stacks=args.n_stacks,
+                      n_skips=args.n_skips,
+                      n_splices=args.n_splices,
+                      frontend=build_frontend(args),
+                      feat_cache=feat_cache.share() if feat_cache is not None else None)
     eval_sets = []
     for s in args.eval_sets:
         eval_sets += [Dataset(corpus=args.corpus,
@@ -155,7 +175,8 @@ def main():
                               batch_size=1,
                               contextualize=args.contextualize,
                               skip_thought=skip_thought,
-                              is_test=True)]
+                              is_test=True,
+                              frontend=build_frontend(args))]
 
     args.vocab = train_set.vocab
     args.vocab_sub1 = train_set.vocab_sub1
@@ -168,9 +189,7 @@ def main():
             lm_conf = load_config(os.path.join(os.path.dirname(args.lm_fusion), 'conf.yml'))
         elif args.resume:
             lm_conf = load_config(os.path.join(os.path.dirname(args.resume), 'conf_lm.yml'))
-        args.lm_conf = argparse.Namespace()
-        for k, v in lm_conf.items():
-            setattr(args.lm_conf, k, v)
+        args.lm_conf = load_args(lm_conf)
         assert args.unit == args.lm_conf.unit
         assert args.vocab == args.lm_conf.vocab
 
@@ -209,6 +228,7 @@ def main():
         epoch = checkpoint['epoch']
         step = checkpoint['step']
         metric_dev_best = checkpoint['metric_dev_best']
+        best_epoch = checkpoint['best_epoch']
 
         # Resume between convert_to_sgd_epoch and convert_to_sgd_epoch + 1
         if epoch == conf['convert_to_sgd_epoch'] + 1:
@@ -230,6 +250,8 @@ def main():
                 shutil.copy(getattr(args, 'dict' + sub), os.path.join(model.save_path, 'dict' + sub + '.txt'))
             if getattr(args, 'unit' + sub) == 'wp':
                 shutil.copy(getattr(args, 'wp_model' + sub), os.path.join(model.save_path, 'wp' + sub + '.model'))
+        if args.frontend == 'logmel' and args.cmvn_path:
+            shutil.copy(args.cmvn_path, os.path.join(model.save_path, 'cmvn.npz'))
 
         for k, v in sorted(vars(args).items(), key=lambda x: x[0]):
             logger.info('%s: %s' % (k, str(v)))
@@ -276,6 +298,7 @@ def main():
 
         epoch, step = 1, 1
         metric_dev_best = 10000
+        best_epoch = None
 
         # Set learning rate controller
         lr_controller = Controller(learning_rate=float(args.learning_rate),
@@ -313,6 +336,15 @@ def main():
     # Set reporter
     reporter = Reporter(model.module.save_path, tensorboard=True)
 
+    # Set profiler
+    profiler = StepProfiler(model.module, reporter,
+                            enabled=args.profile,
+                            profile_modules=args.n_gpus == 1,
+                            summary_step=args.print_step,
+                            trace_dir=model.module.save_path,
+                            trace_start=args.profile_trace_start,
+                            trace_n_steps=args.profile_trace_n_steps)
+
     if args.mtl_per_batch:
         # NOTE: from easier to harder tasks
         tasks = []
@@ -334,6 +366,9 @@ def main():
                     tasks = ['ys_' + sub + '.ctc'] + tasks
                 if getattr(args, 'lmobj_weight_' + sub) > 0:
                     tasks = ['ys_' + sub + '.lmobj'] + tasks
+        if args.mtl_shared_encoder:
+            # NOTE: encode once and update all tasks by a single backward pass
+            tasks = [tuple(tasks)]
     else:
         tasks = ['all']
 
@@ -341,33 +376,40 @@ def main():
     start_time_epoch = time.time()
     start_time_step = time.time()
     not_improved_n_epochs = 0
+    n_cache_hits, n_cache_misses = 0, 0
     pbar_epoch = tqdm(total=len(train_set))
     while True:
         # Compute loss in the training set
-        batch_train, is_new_epoch = train_set.next()
+        with profiler.section('data'):
+            batch_train, is_new_epoch = train_set.next()
 
         # Change tasks depending on task
         for task in tasks:
             model.module.optimizer.zero_grad()
-            if skip_thought:
-                loss, reporter = model(batch_train['ys'],
-                                       ys_prev=batch_train['ys_prev'],
-                                       ys_next=batch_train['ys_next'],
-                                       reporter=reporter)
-            else:
-                loss, reporter = model(batch_train, reporter=reporter, task=task)
-            if len(model.device_ids) > 1:
-                loss.backward(torch.ones(len(model.device_ids)))
-            else:
-                loss.backward()
+            with profiler.section('forward'):
+                if skip_thought:
+                    loss, reporter = model(batch_train['ys'],
+                                           ys_prev=batch_train['ys_prev'],
+                                           ys_next=batch_train['ys_next'],
+                                           reporter=reporter)
+                else:
+                    loss, reporter = model(batch_train, reporter=reporter, task=task)
+            with profiler.section('backward'):
+                if len(model.device_ids) > 1:
+                    loss.backward(torch.ones(len(model.device_ids)))
+                else:
+                    loss.backward()
             loss.detach()  # Trancate the graph
             if args.clip_grad_norm > 0:
-                torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
-            model.module.optimizer.step()
-            loss_train = loss.item()
+                with profiler.section('clip'):
+                    torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
+            with profiler.section('optimizer'):
+                model.module.optimizer.step()
+            loss_train = loss.detach()  # NOTE: synchronized only at print_step
             del loss
 
         reporter.step(is_eval=False)
+        profiler.step()
 
         # Update learning rate
         if step < args.warmup_n_steps:
@@ -400,14 +442,14 @@ def main():
                 ylen = max(len(y) for y in batch_train['ys_sub1'])
             logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/lr:%.5f/bs:%d/xlen:%d/ylen:%d (%.2f min)" %
                         (step, train_set.epoch_detail,
-                         loss_train, loss_dev,
+                         loss_train.item(), loss_dev,
                          lr_controller.lr, len(batch_train['utt_ids']),
                          xlen, ylen, duration_step / 60))
             start_time_step = time.time()
         step += args.n_gpus
         pbar_epoch.update(len(batch_train['utt_ids']))
 
-        # Save fugures of loss and accuracy
+        # Flush the metrics log
         if step % (args.print_step * 10) == 0:
             reporter.snapshot()
 
@@ -415,12 +457,21 @@ def main():
         if is_new_epoch:
             duration_epoch = time.time() - start_time_epoch
             logger.info('========== EPOCH:%d (%.2f min) ==========' % (epoch, duration_epoch / 60))
+            if train_set.cache is not None:
+                cache = train_set.cache
+                n_hits, n_misses = cache.n_hits - n_cache_hits, cache.n_misses - n_cache_misses
+                n_cache_hits, n_cache_misses = cache.n_hits, cache.n_misses
+                logger.info('Feature cache: %d utterances (%.1f MB), hit rate: %.2f %% in this epoch' %
+                            (len(cache), cache.n_bytes / 1024 ** 2,
+                             n_hits / max(n_hits + n_misses, 1) * 100))
 
             if epoch < args.eval_start_epoch:
                 # Save the model
                 save_checkpoint(model.module, model.module.save_path, lr_controller,
                                 epoch, step - 1, metric_dev_best,
-                                remove_old_checkpoints=True)
+                                remove_old_checkpoints=True,
+                                background=args.async_checkpoint,
+                                n_keep_checkpoints=args.n_keep_checkpoints)
                 reporter._epoch += 1
                 # TODO(hirofumi): fix later
             else:
@@ -461,13 +512,18 @@ def main():
 
                 if metric_dev < metric_dev_best:
                     metric_dev_best = metric_dev
+                    best_epoch = epoch
                     not_improved_n_epochs = 0
                     logger.info('||||| Best Score |||||')
 
                     # Save the model
                     save_checkpoint(model.module, model.module.save_path, lr_controller,
                                     epoch, step - 1, metric_dev_best,
-                                    remove_old_checkpoints=True)
+                                    remove_old_checkpoints=True,
+                                    background=args.async_checkpoint,
+                                    metric_dev=metric_dev,
+                                    n_keep_checkpoints=args.n_keep_checkpoints,
+                                    best_epoch=best_epoch)
 
                     # test
                     for s in eval_sets:
@@ -501,6 +557,16 @@ def main():
                 else:
                     not_improved_n_epochs += 1
 
+                    # Save the latest model for checkpoint averaging
+                    if args.n_keep_checkpoints > 1:
+                        save_checkpoint(model.module, model.module.save_path, lr_controller,
+                                        epoch, step - 1, metric_dev_best,
+                                        remove_old_checkpoints=True,
+                                        background=args.async_checkpoint,
+                                        metric_dev=metric_dev,
+                                        n_keep_checkpoints=args.n_keep_checkpoints,
+                                        best_epoch=best_epoch)
+
                     # start scheduled sampling
                     if args.ss_prob > 0:
                         model.module.scheduled_sampling_trigger()
@@ -533,11 +599,14 @@ def main():
             start_time_epoch = time.time()
             epoch += 1
 
+    # Wait for the last checkpoint
+    wait_checkpoint()
+
     duration_train = time.time() - start_time_train
     logger.info('Total time: %.2f hour' % (duration_train / 3600))
 
-    if reporter.tensorboard:
-        reporter.tf_writer.close()
+    profiler.close()
+    reporter.close()
     pbar_epoch.close()
 
     return model.module.save_path
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Average parameters of multiple checkpoints."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from distutils.util import strtobool
+from glob import glob
+import os
+
+from neural_sp.bin.inference_utils import load_tensors
+from neural_sp.bin.inference_utils import save_inference_checkpoint
+
+
+def average_checkpoints(checkpoint_paths):
+    """Average `state_dict`s by streaming checkpoints one by one.
+
+    Floating point parameters are accumulated in float64, so that only one
+    checkpoint is loaded in addition to the accumulator at any time.
+    The other buffers are taken from the last checkpoint.
+
+    Args:
+        checkpoint_paths (list): paths to the saved models
+    Returns:
+        state_dict (dict): averaged parameters
+
+    """
+    avg, dtypes = None, None
+    for path in checkpoint_paths:
+        state_dict = load_tensors(path)['state_dict']
+        if avg is None:
+            avg = {k: v.double() if v.is_floating_point() else v.clone() for k, v in state_dict.items()}
+            dtypes = {k: v.dtype for k, v in state_dict.items()}
+        else:
+            if set(state_dict.keys()) != set(avg.keys()):
+                raise ValueError('%s has different parameters from %s' % (path, checkpoint_paths[0]))
+            for k, v in state_dict.items():
+                if v.is_floating_point():
+                    avg[k].add_(v.double())
+                else:
+                    avg[k] = v.clone()
+        del state_dict
+
+    return {k: v.div_(len(checkpoint_paths)).to(dtypes[k]) if v.is_floating_point() else v
+            for k, v in avg.items()}
+
+
+def select_checkpoints(model_dir, last=0, best=0):
+    """Select checkpoints in the model directory.
+
+    Args:
+        model_dir (str):
+        last (int): select the latest checkpoints
+        best (int): select the checkpoints with the lowest dev metric
+    Returns:
+        checkpoint_paths (list):
+
+    """
+    paths = sorted(glob(os.path.join(model_dir, 'model.epoch-*')),
+                   key=lambda x: int(x.split('-')[-1]))
+    if last > 0:
+        return paths[-last:]
+    elif best > 0:
+        metrics = []
+        for path in paths:
+            metric = load_tensors(path).get('metric_dev', None)
+            if metric is None:
+                raise ValueError('No dev metric is saved in %s' % path)
+            metrics.append(metric)
+        indices = sorted(range(len(paths)), key=lambda i: metrics[i])[:best]
+        return [paths[i] for i in sorted(indices)]
+    return paths
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', type=str, default=None,
+                        help='directory containing model.epoch-*')
+    parser.add_argument('--checkpoints', type=str, nargs='+', default=[],
+                        help='paths (or glob patterns) to the checkpoints to average')
+    parser.add_argument('--last', type=int, default=0,
+                        help='average the latest checkpoints in model_dir')
+    parser.add_argument('--best', type=int, default=0,
+                        help='average the checkpoints with the best dev metrics in model_dir')
+    parser.add_argument('--out', type=str, default=None,
+                        help='path to the averaged model (model_avg.epoch-* in model_dir by default)')
+    parser.add_argument('--fp16', type=strtobool, default=False,
+                        help='save parameters in half precision')
+    args = parser.parse_args()
+
+    if len(args.checkpoints) > 0:
+        checkpoint_paths = sorted(set(p for pattern in args.checkpoints for p in glob(pattern)),
+                                  key=lambda x: int(x.split('-')[-1]))
+    elif args.model_dir is not None:
+        checkpoint_paths = select_checkpoints(args.model_dir, last=args.last, best=args.best)
+    else:
+        raise ValueError('Set --model_dir or --checkpoints.')
+    if len(checkpoint_paths) == 0:
+        raise ValueError('No checkpoint found.')
+
+    model_dir = os.path.dirname(checkpoint_paths[0])
+    epoch = int(checkpoint_paths[-1].split('-')[-1])
+    save_path = args.out
+    if save_path is None:
+        save_path = os.path.join(model_dir, 'model_avg.epoch-' + str(epoch))
+
+    for path in checkpoint_paths:
+        print('Average: %s' % path)
+    state_dict = average_checkpoints(checkpoint_paths)
+    save_inference_checkpoint(state_dict, model_dir, save_path, epoch, fp16=args.fp16)
+    print('Saved: %s' % save_path)
+
+
+if __name__ == '__main__':
+    main()
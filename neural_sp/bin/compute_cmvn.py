@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Compute global CMVN statistics of log-mel features from wav files."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import codecs
+import pandas as pd
+from tqdm import tqdm
+
+from neural_sp.datasets.frontend import GlobalCMVN
+from neural_sp.datasets.frontend import LogMelFrontend
+from neural_sp.datasets.frontend import read_wav
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tsv', type=str, default=None,
+                        help='dataset tsv file whose feat_path column contains wav files')
+    parser.add_argument('--wav_scp', type=str, default=None,
+                        help='wav.scp file (utt_id and path to the wav file in each line)')
+    parser.add_argument('--out', type=str, required=True,
+                        help='path to save the statistics (.npz)')
+    parser.add_argument('--sample_rate', type=int, default=16000,
+                        help='sampling rate of wav files')
+    parser.add_argument('--n_mels', type=int, default=80,
+                        help='number of mel bins')
+    parser.add_argument('--batch_size', type=int, default=32,
+                        help='number of utterances processed at once')
+    args = parser.parse_args()
+
+    if args.tsv is not None:
+        wav_paths = list(pd.read_csv(args.tsv, encoding='utf-8', delimiter='\t')['feat_path'])
+    elif args.wav_scp is not None:
+        with codecs.open(args.wav_scp, 'r', encoding='utf-8') as f:
+            wav_paths = [line.strip().split(' ')[1] for line in f if line.strip() != '']
+    else:
+        raise ValueError('Set --tsv or --wav_scp.')
+
+    # NOTE: statistics are computed before appending delta features
+    frontend = LogMelFrontend(sample_rate=args.sample_rate, n_mels=args.n_mels)
+    cmvn = GlobalCMVN()
+    for i in tqdm(range(0, len(wav_paths), args.batch_size)):
+        signals = [read_wav(p)[0] for p in wav_paths[i:i + args.batch_size]]
+        for feats in frontend.logmel(signals):
+            cmvn.accumulate(feats)
+    cmvn.save(args.out)
+    print('Saved statistics of %d frames to %s' % (cmvn.count, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Utility functions for inference-only checkpoints."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import torch
+import torch.nn as nn
+
+from neural_sp.bin.train_utils import _write_checkpoint
+from neural_sp.bin.train_utils import load_config
+
+logger = logging.getLogger('decoding')
+
+# files in the model directory bundled into an inference-only checkpoint
+BUNDLED_FILES = ['dict.txt', 'dict_sub1.txt', 'dict_sub2.txt', 'nlsyms.txt',
+                 'wp.model', 'wp_sub1.model', 'wp_sub2.model', 'conf_lm.yml', 'cmvn.npz']
+
+# layers replaced by dynamically quantized ones (LinearND wraps nn.Linear)
+QUANTIZED_MODULES = {nn.LSTM, nn.GRU, nn.LSTMCell, nn.GRUCell, nn.Linear}
+
+
+def quantize_model(model):
+    """Apply dynamic int8 quantization to LSTM/GRU/Linear layers for CPU inference.
+
+    Weights are stored in int8 and activations are quantized on the fly,
+    so no calibration data is required. Embeddings, CNN layers and
+    normalization layers remain float32. A tied output layer gets its own
+    int8 copy of the embedding matrix.
+
+    Args:
+        model (torch.nn.Module): model on CPU
+    Returns:
+        model (torch.nn.Module): quantized model in the evaluation mode
+
+    """
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, QUANTIZED_MODULES, dtype=torch.qint8)
+
+
+def export_checkpoint(checkpoint_path, save_path=None, fp16=False, quantize=False):
+    """Export a training checkpoint to an inference-only checkpoint.
+
+    Args:
+        checkpoint_path (str): path to the saved model (model.epoch-*)
+        save_path (str): path to the exported model.
+            model_inference.epoch-* in the same directory by default.
+        fp16 (bool): save floating point parameters in half precision
+        quantize (bool): save the model quantized by `quantize_model`
+    Returns:
+        save_path (str):
+
+    """
+    if not os.path.isfile(checkpoint_path):
+        raise ValueError("No checkpoint found at %s" % checkpoint_path)
+    if fp16 and quantize:
+        raise ValueError("fp16 and quantize cannot be used at the same time.")
+
+    model_dir = os.path.dirname(checkpoint_path)
+    epoch = int(os.path.basename(checkpoint_path).split('-')[-1])
+    if save_path is None:
+        save_path = os.path.join(model_dir, 'model_inference.epoch-' + str(epoch))
+
+    checkpoint = load_tensors(checkpoint_path, mmap=True)
+    state_dict = checkpoint['state_dict']
+    if quantize:
+        model = _build_model(load_args(load_config(os.path.join(model_dir, 'conf.yml'))))
+        model.load_state_dict(state_dict)
+        state_dict = quantize_model(model).state_dict()
+    save_inference_checkpoint(state_dict, model_dir, save_path, epoch,
+                              fp16=fp16, quantized=quantize)
+    return save_path
+
+
+def save_inference_checkpoint(state_dict, model_dir, save_path, epoch, fp16=False,
+                              quantized=False):
+    """Save parameters with the configuration and dictionaries.
+
+    The optimizer and the learning rate controller are dropped.
+
+    Args:
+        state_dict (dict): parameters of the model
+        model_dir (str): directory containing conf.yml and dictionaries
+        save_path (str): path to the exported model
+        epoch (int):
+        fp16 (bool): save floating point parameters in half precision
+        quantized (bool): state_dict is of the model quantized by `quantize_model`
+
+    """
+    if fp16:
+        state_dict = type(state_dict)(
+            (k, v.half() if v.is_floating_point() else v) for k, v in state_dict.items())
+
+    files = {}
+    for name in BUNDLED_FILES:
+        if os.path.isfile(os.path.join(model_dir, name)):
+            with open(os.path.join(model_dir, name), 'rb') as f:
+                files[name] = f.read()
+
+    checkpoint = {
+        "state_dict": state_dict,
+        "conf": vars(load_args(load_config(os.path.join(model_dir, 'conf.yml')))),
+        "files": files,
+        "fp16": fp16,
+        "quantized": quantized,
+        "epoch": epoch
+    }
+    _write_checkpoint(checkpoint, save_path)
+
+
+def load_inference_checkpoint(checkpoint_path, recog_params=None, mmap=True):
+    """Build a model from an inference-only checkpoint.
+
+    Only the modules used by the `recog_*` settings are built, so that
+    the decoders which are never called are neither initialized nor loaded.
+
+    Args:
+        checkpoint_path (str): path to the exported model
+        recog_params (dict): `recog_*` settings overriding the saved ones.
+            If None, all modules are built.
+        mmap (bool): memory-map the parameters if supported
+    Returns:
+        model (torch.nn.Module): model in the evaluation mode on CPU
+        checkpoint (dict):
+            args (Namespace): the merged configuration
+            files (dict): contents of the bundled files
+            quantized (bool): the model is quantized by `quantize_model`
+            epoch (int): the next epoch as in `load_checkpoint`
+
+    """
+    if not os.path.isfile(checkpoint_path):
+        raise ValueError("No checkpoint found at %s" % checkpoint_path)
+
+    checkpoint = load_tensors(checkpoint_path, mmap=mmap)
+    if 'conf' not in checkpoint:
+        raise ValueError("%s is not an inference-only checkpoint" % checkpoint_path)
+
+    args = load_args(checkpoint['conf'])
+    if recog_params is not None:
+        for k, v in recog_params.items():
+            if 'recog' in k:
+                setattr(args, k, v)
+
+    skip_decoders = _unused_decoders(args) if recog_params is not None else []
+    model = _build_model(args, skip_decoders)
+    for name in skip_decoders:
+        if any(k.startswith(name + '.') for k in checkpoint['state_dict']):
+            logger.info('Skip %s' % name)
+
+    quantized = checkpoint.get('quantized', False)
+    if quantized:
+        model = quantize_model(model)
+
+    # NOTE: parameters of the skipped decoders are ignored
+    state_dict = model.state_dict()
+    state_dict = {k: v.float() if checkpoint['fp16'] and v.is_floating_point() else v
+                  for k, v in checkpoint['state_dict'].items() if k in state_dict}
+    if quantized:
+        # NOTE: int8 weights are repacked
+        model.load_state_dict(state_dict)
+    else:
+        try:
+            # share the memory-mapped storage instead of copying
+            model.load_state_dict(state_dict, assign=not checkpoint['fp16'])
+        except TypeError:
+            model.load_state_dict(state_dict)
+    model.eval()
+
+    logger.info("=> Loading inference checkpoint (epoch:%d): %s" % (checkpoint['epoch'], checkpoint_path))
+    return_values = {
+        'args': args,
+        'files': checkpoint['files'],
+        'quantized': quantized,
+        'epoch': checkpoint['epoch'] + 1
+    }
+    return model, return_values
+
+
+def extract_files(files, save_dir):
+    """Write the bundled dictionaries etc. to a directory.
+
+    Args:
+        files (dict): contents of the bundled files
+        save_dir (str):
+
+    """
+    if not os.path.isdir(save_dir):
+        os.makedirs(save_dir)
+    for name, content in files.items():
+        with open(os.path.join(save_dir, name), 'wb') as f:
+            f.write(content)
+
+
+def load_tensors(checkpoint_path, mmap=True):
+    """Load a checkpoint on CPU.
+
+    Args:
+        checkpoint_path (str):
+        mmap (bool): memory-map the tensors if supported
+    Returns:
+        checkpoint (dict):
+
+    """
+    if mmap:
+        try:
+            return torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=False)
+        except (TypeError, RuntimeError):
+            # NOTE: mmap requires PyTorch>=2.1 and the zipfile serialization
+            pass
+    return torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+
+
+def load_args(conf):
+    """Overlay a saved configuration on the default options.
+
+    Options added after the model was trained take their default values.
+
+    Args:
+        conf (dict): configuration of the ASR model or LM (conf.yml)
+    Returns:
+        args (Namespace):
+
+    """
+    if 'enc_type' in conf:
+        from neural_sp.bin.args_asr import parse
+    else:
+        from neural_sp.bin.args_lm import parse
+    params = vars(parse([]))
+    params.update(conf)
+    return argparse.Namespace(**params)
+
+
+def build_lm(args):
+    """Build a LM from its configuration.
+
+    Args:
+        args (Namespace): configuration of the LM (see `load_args`)
+    Returns:
+        lm (RNNLM or GatedConvLM):
+
+    """
+    if 'gated_conv' in args.lm_type:
+        from neural_sp.models.lm.gated_convlm import GatedConvLM
+        return GatedConvLM(args)
+    else:
+        from neural_sp.models.lm.rnnlm import RNNLM
+        return RNNLM(args)
+
+
+def _build_model(args, skip_decoders=()):
+    if hasattr(args, 'enc_type'):
+        from neural_sp.models.seq2seq.seq2seq import Seq2seq
+        return Seq2seq(args, skip_decoders)
+    return build_lm(args)
+
+
+def _unused_decoders(args):
+    """Names of the decoders which are not used by the `recog_*` settings."""
+    if not hasattr(args, 'enc_type'):
+        return []
+    names = []
+    if not (args.recog_bwd_attention or args.recog_fwd_bwd_attention):
+        names.append('dec_bwd')
+    recog_unit = getattr(args, 'recog_unit', None) or args.unit
+    if not (args.recog_resolving_unk or (recog_unit != args.unit and recog_unit == args.unit_sub1)):
+        names.append('dec_fwd_sub1')
+    if not (recog_unit != args.unit and recog_unit == args.unit_sub2):
+        names.append('dec_fwd_sub2')
+    return names
@@ -27,7 +27,9 @@ from neural_sp.bin.train_utils import set_logger
 from neural_sp.bin.train_utils import set_save_path
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import save_checkpoint
+from neural_sp.bin.train_utils import wait_checkpoint
 from neural_sp.bin.reporter import Reporter
+from neural_sp.bin.step_profiler import StepProfiler
 from neural_sp.datasets.loader_lm import Dataset
 from neural_sp.evaluators.ppl import eval_ppl
 from neural_sp.models.data_parallel import CustomDataParallel
@@ -107,6 +109,8 @@ def main():
     else:
         model = RNNLM(args)
     model.save_path = save_path
+    if model.sampled_loss is not None and args.sampling_proposal == 'unigram':
+        model.sampled_loss.set_unigram(np.bincount(train_set.concat_ids.reshape(-1), minlength=args.vocab))
 
     if args.resume:
         # Set optimizer
@@ -121,6 +125,7 @@ def main():
         epoch = checkpoint['epoch']
         step = checkpoint['step']
         ppl_dev_best = checkpoint['metric_dev_best']
+        best_epoch = checkpoint['best_epoch']
 
         # Resume between convert_to_sgd_epoch and convert_to_sgd_epoch + 1
         if epoch == conf['convert_to_sgd_epoch'] + 1:
@@ -156,6 +161,7 @@ def main():
 
         epoch, step = 1, 1
         ppl_dev_best = 10000
+        best_epoch = None
 
         # Set learning rate controller
         lr_controller = Controller(learning_rate=float(args.learning_rate),
@@ -188,50 +194,73 @@ def main():
     # Set reporter
     reporter = Reporter(model.module.save_path, tensorboard=True)
 
+    # Set profiler
+    profiler = StepProfiler(model.module, reporter,
+                            enabled=args.profile,
+                            profile_modules=args.n_gpus == 1,
+                            summary_step=args.print_step,
+                            trace_dir=model.module.save_path,
+                            trace_start=args.profile_trace_start,
+                            trace_n_steps=args.profile_trace_n_steps)
+
     hidden = None
     start_time_train = time.time()
     start_time_epoch = time.time()
     start_time_step = time.time()
+    n_tokens_step = 0
     not_improved_epoch = 0
     pbar_epoch = tqdm(total=len(train_set))
     while True:
         # Compute loss in the training set
-        ys_train, is_new_epoch = train_set.next()
+        with profiler.section('data'):
+            ys_train, is_new_epoch = train_set.next()
 
         model.module.optimizer.zero_grad()
-        loss, hidden, reporter = model(ys_train, hidden, reporter)
-        if len(model.device_ids) > 1:
-            loss.backward(torch.ones(len(model.device_ids)))
-        else:
-            loss.backward()
+        with profiler.section('forward'):
+            loss, hidden, reporter = model(ys_train, hidden, reporter)
+        with profiler.section('backward'):
+            if len(model.device_ids) > 1:
+                loss.backward(torch.ones(len(model.device_ids)))
+            else:
+                loss.backward()
         loss.detach()  # Trancate the graph
         if args.clip_grad_norm > 0:
-            torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
-        model.module.optimizer.step()
-        loss_train = loss.item()
+            with profiler.section('clip'):
+                torch.nn.utils.clip_grad_norm_(model.module.parameters(), args.clip_grad_norm)
+        with profiler.section('optimizer'):
+            model.module.optimizer.step()
+        loss_train = loss.detach()  # NOTE: synchronized only at print_step
         del loss
         if 'gated_conv' not in args.lm_type:
             hidden = model.module.repackage_hidden(hidden)
         reporter.step(is_eval=False)
+        profiler.step()
 
         if step % args.print_step == 0:
             # Compute loss in the dev set
             ys_dev = dev_set.next()[0]
             loss, _, reporter = model(ys_dev, None, reporter, is_eval=True)
             loss_dev = loss.item()
+            loss_train = loss_train.item()
             del loss
             reporter.step(is_eval=True)
 
             duration_step = time.time() - start_time_step
-            logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/ppl:%.3f(%.3f)/lr:%.5f/bs:%d (%.2f min)" %
+            tokens_per_sec = n_tokens_step / duration_step
+            reporter.add_profile({'speed.tokens_per_sec': tokens_per_sec})
+            # NOTE: the training loss of sampled objectives is not cross entropy
+            ppl_train = '%.3f' % np.exp(loss_train) if model.module.sampled_loss is None else '-'
+            logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/ppl:%s(%.3f)/lr:%.5f/bs:%d/%.1f tokens/sec (%.2f min)" %
                         (step, train_set.epoch_detail, loss_train, loss_dev,
-                         np.exp(loss_train), np.exp(loss_dev),
-                         lr_controller.lr, ys_train.shape[0], duration_step / 60))
+                         ppl_train, np.exp(loss_dev),
+                         lr_controller.lr, ys_train.shape[0], tokens_per_sec, duration_step / 60))
             start_time_step = time.time()
+            n_tokens_step = 0
         step += args.n_gpus
+        n_tokens_step += ys_train.shape[0] * (ys_train.shape[1] - 1)
         pbar_epoch.update(ys_train.shape[0] * (ys_train.shape[1] - 1))
 
-        # Save fugures of loss and accuracy
+        # Flush the metrics log
         if step % (args.print_step * 10) == 0:
             reporter.snapshot()
 
@@ -244,7 +273,9 @@ def main():
                 # Save the model
                 save_checkpoint(model.module, model.module.save_path, lr_controller,
                                 epoch, step - 1, ppl_dev_best,
-                                remove_old_checkpoints=True)
+                                remove_old_checkpoints=True,
+                                background=args.async_checkpoint,
+                                n_keep_checkpoints=args.n_keep_checkpoints)
             else:
                 start_time_eval = time.time()
                 # dev
@@ -259,13 +290,18 @@ def main():
 
                 if ppl_dev < ppl_dev_best:
                     ppl_dev_best = ppl_dev
+                    best_epoch = epoch
                     not_improved_epoch = 0
                     logger.info('||||| Best Score |||||')
 
                     # Save the model
                     save_checkpoint(model.module, model.module.save_path, lr_controller,
                                     epoch, step - 1, ppl_dev_best,
-                                    remove_old_checkpoints=True)
+                                    remove_old_checkpoints=True,
+                                    background=args.async_checkpoint,
+                                    metric_dev=ppl_dev,
+                                    n_keep_checkpoints=args.n_keep_checkpoints,
+                                    best_epoch=best_epoch)
 
                     # test
                     ppl_test_avg = 0.
@@ -279,6 +315,16 @@ def main():
                 else:
                     not_improved_epoch += 1
 
+                    # Save the latest model for checkpoint averaging
+                    if args.n_keep_checkpoints > 1:
+                        save_checkpoint(model.module, model.module.save_path, lr_controller,
+                                        epoch, step - 1, ppl_dev_best,
+                                        remove_old_checkpoints=True,
+                                        background=args.async_checkpoint,
+                                        metric_dev=ppl_dev,
+                                        n_keep_checkpoints=args.n_keep_checkpoints,
+                                        best_epoch=best_epoch)
+
                 duration_eval = time.time() - start_time_eval
                 logger.info('Evaluation time: %.2f min' % (duration_eval / 60))
 
@@ -304,14 +350,18 @@ def main():
                 break
 
             start_time_step = time.time()
+            n_tokens_step = 0
             start_time_epoch = time.time()
             epoch += 1
 
+    # Wait for the last checkpoint
+    wait_checkpoint()
+
     duration_train = time.time() - start_time_train
     logger.info('Total time: %.2f hour' % (duration_train / 3600))
 
-    if reporter.tensorboard:
-        reporter.tf_writer.close()
+    profiler.close()
+    reporter.close()
     pbar_epoch.close()
 
     return model.module.save_path
@@ -342,6 +392,10 @@ def make_model_name(args):
         dir_name += '_' + str(args.min_n_tokens) + 'tokens'
     if args.adaptive_softmax:
         dir_name += '_adaptiveSM'
+    if args.output_loss != 'softmax':
+        dir_name += '_' + args.output_loss + str(args.n_samples)
+        if args.sampling_proposal == 'unigram':
+            dir_name += 'unigram'
     return dir_name
 
 
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Plot training curves from the metrics log of Reporter."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+import json
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import numpy as np
+import os
+
+plt.style.use('ggplot')
+blue = '#4682B4'
+orange = '#D2691E'
+
+
+def load_metrics(path):
+    """Load the metrics log.
+
+    Args:
+        path (str): path to metrics.jsonl
+    Returns:
+        curves (dict): `{metric: {name: {split: {step: value}}}}`.
+            split is train or dev, or profile for Reporter.add_profile
+        evals (list): tuples of (epoch, value)
+
+    """
+    curves = OrderedDict()
+    evals = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line may be partially written
+                continue
+            if 'epoch' in record:
+                evals.append((record['epoch'], record['value']))
+                continue
+            curve = curves.setdefault(record['metric'], OrderedDict()).setdefault(
+                record['name'], {'train': OrderedDict(), 'dev': OrderedDict()})
+            curve.setdefault(record['split'], OrderedDict())[record['step']] = record['value']
+    return curves, evals
+
+
+def plot_metrics(model_dir, dpi=100):
+    """Save figures and csv files of the training curves.
+
+    Args:
+        model_dir (str): directory containing metrics.jsonl
+        dpi (int):
+
+    """
+    curves, evals = load_metrics(os.path.join(model_dir, 'metrics.jsonl'))
+
+    linestyles = ['-', '--', '-.', ':']
+    for metric, curves_metric in curves.items():
+        plt.clf()
+        upper = 0
+        is_profile = False
+        for i, (name, curve) in enumerate(sorted(curves_metric.items())):
+            linestyle = linestyles[min(i, len(linestyles) - 1)]
+            if len(curve.get('profile', {})) > 0:
+                # NOTE: profiling results are observed only in training
+                is_profile = True
+                steps = sorted(curve['profile'].keys())
+                values = [curve['profile'][s] for s in steps]
+                plt.plot(steps, values, blue, label=name, linestyle=linestyle)
+                np.savetxt(os.path.join(model_dir, metric + '-' + name + ".csv"),
+                           np.column_stack((steps, values)), delimiter=",")
+                continue
+
+            steps = sorted(set(curve['train'].keys()) & set(curve['dev'].keys()))
+            if len(steps) == 0:
+                continue
+            train = [curve['train'][s] for s in steps]
+            dev = [curve['dev'][s] for s in steps]
+            # skip non-observed values
+            if np.mean(train) == 0:
+                continue
+
+            plt.plot(steps, train, blue, label=name + " (train)", linestyle=linestyle)
+            plt.plot(steps, dev, orange, label=name + " (dev)", linestyle=linestyle)
+            upper = max(upper, max(train), max(dev))
+
+            # Save as csv file
+            np.savetxt(os.path.join(model_dir, metric + '-' + name + ".csv"),
+                       np.column_stack((steps, train, dev)), delimiter=",")
+
+        plt.xlabel('step', fontsize=12)
+        plt.ylabel(metric, fontsize=12)
+        if not is_profile:
+            plt.ylim([0, min(upper + 10, 300)])
+        plt.legend(loc="upper right", fontsize=12)
+        plt.savefig(os.path.join(model_dir, metric + ".png"), dpi=dpi)
+
+    if len(evals) > 0:
+        epochs, values = zip(*evals)
+        plt.clf()
+        plt.plot(epochs, values, orange, label='dev', linestyle='-')
+        plt.xlabel('epoch', fontsize=12)
+        plt.ylabel('WER', fontsize=12)
+        plt.ylim([0, min(100, max(values) + 1)])
+        plt.legend(loc="upper right", fontsize=12)
+        plt.savefig(os.path.join(model_dir, 'wer' + ".png"), dpi=dpi)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model_dirs', type=str, nargs='+',
+                        help='directories containing metrics.jsonl')
+    parser.add_argument('--dpi', type=int, default=100,
+                        help='resolution of the figures')
+    args = parser.parse_args()
+
+    for model_dir in args.model_dirs:
+        plot_metrics(model_dir, dpi=args.dpi)
+
+
+if __name__ == '__main__':
+    main()
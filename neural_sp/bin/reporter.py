@@ -10,20 +10,16 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import json
 import logging
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
-import numpy as np
 import os
-import seaborn as sns
-from tensorboardX import SummaryWriter
+import threading
+import torch
 
-plt.style.use('ggplot')
-grey = '#878f99'
-blue = '#4682B4'
-orange = '#D2691E'
-green = '#82b74b'
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 logger = logging.getLogger('training')
 
@@ -31,6 +27,11 @@ logger = logging.getLogger('training')
 class Reporter(object):
     """"Report loss, accuracy etc. during training.
 
+    Observations are appended to `metrics.jsonl` in `save_path` by a
+    background thread. Figures are drawn offline by `neural_sp/bin/plot_metrics.py`.
+    Training observations are kept on the device by `MetricsAccumulator` and
+    synchronized with the host only when they are reported with evaluation.
+
     Args:
         save_path (str):
         tensorboard (bool): use tensorboard logging
@@ -42,19 +43,19 @@ class Reporter(object):
         self.tensorboard = tensorboard
 
         if tensorboard:
+            from tensorboardX import SummaryWriter
             self.tf_writer = SummaryWriter(save_path)
 
         # report per step
         self._step = 0
-        self.observation_train = {'loss': {}, 'acc': {}, 'ppl': {}}
-        self.observation_train_local = {'loss': {}, 'acc': {}, 'ppl': {}}
-        self.observation_dev = {'loss': {}, 'acc': {}, 'ppl': {}}
-        self.steps = []
+        # training observations since the last evaluation
+        self.observation_train_local = MetricsAccumulator()
 
         # report per epoch
         self._epoch = 0
-        self.observation_eval = []
-        self.epochs = []
+
+        self._writer = _MetricsWriter(os.path.join(save_path, 'metrics.jsonl'))
+        self._writer.start()
 
     def add(self, observation, is_eval):
         """Restore values per step.
@@ -64,101 +65,154 @@ class Reporter(object):
                 is_eval (bool):
 
         """
-        for k, v in observation.items():
-            if v is None:
-                continue
+        if not is_eval:
+            self.observation_train_local.add(observation)
+            return
+
+        # avarage for training
+        observation_train = self.observation_train_local.mean()
+        observation_dev = MetricsAccumulator.reduce(observation)
+        for k, v in observation_dev.items():
             metric, name = k.split('.')
             # NOTE: metric: loss, acc, ppl
+            if k in observation_train:
+                self._write('train', metric, name, observation_train[k])
+            self._write('dev', metric, name, v)
+
+    def add_profile(self, observation):
+        """Restore profiling results.
+
+            Args:
+                observation (dict): e.g., `{'time.forward': 12.3}`
+
+        """
+        for k, v in observation.items():
+            metric, name = k.split('.')
+            self._write('profile', metric, name, v)
 
-            if v == float("inf") or v == -float("inf"):
-                logger.warning("WARNING: received an inf %s for %s." % (metric, k))
-
-            if not is_eval:
-                if name not in self.observation_train_local[metric].keys():
-                    self.observation_train_local[metric][name] = []
-                self.observation_train_local[metric][name].append(v)
-            else:
-                # avarage for training
-                if name not in self.observation_train[metric].keys():
-                    self.observation_train[metric][name] = []
-                self.observation_train[metric][name].append(
-                    np.mean(self.observation_train_local[metric][name]))
-                logger.info('%s (train, mean): %.3f' % (k, np.mean(self.observation_train_local[metric][name])))
-
-                if name not in self.observation_dev[metric].keys():
-                    self.observation_dev[metric][name] = []
-                self.observation_dev[metric][name].append(v)
-                logger.info('%s (dev): %.3f' % (k, v))
-
-                # Logging by tensorboard
-                if self.tensorboard:
-                    if not is_eval:
-                        self.tf_writer.add_scalar('train/' + metric + '/' + name, v, self._step)
-                    else:
-                        self.tf_writer.add_scalar('dev/' + metric + '/' + name, v, self._step)
-                # for n, p in model.module.named_parameters():
-                #     n = n.replace('.', '/')
-                #     if p.grad is not None:
-                #         tf_writer.add_histogram(n, p.data.cpu().numpy(), self._step + 1)
-                #         tf_writer.add_histogram(n + '/grad', p.grad.data.cpu().numpy(), self._step + 1)
+    def _write(self, split, metric, name, value):
+        value = float(value)
+        self._writer.put({'step': self._step, 'split': split,
+                          'metric': metric, 'name': name, 'value': value})
+        if self.tensorboard:
+            self.tf_writer.add_scalar(split + '/' + metric + '/' + name, value, self._step)
 
     def step(self, is_eval):
         self._step += 1
         if is_eval:
-            self.steps.append(self._step)
-
             # reset
-            self.observation_train_local = {'loss': {}, 'acc': {}, 'ppl': {}}
+            self.observation_train_local.reset()
 
-    def epoch(self, wer):
+    def epoch(self, metric_dev):
         self._epoch += 1
-        self.epochs.append(self._epoch)
-
-        # register
-        self.observation_eval.append(wer)
-
-        plt.clf()
-        plt.plot(self.epochs, self.observation_eval, orange,
-                 label='dev', linestyle='-')
-        plt.xlabel('epoch', fontsize=12)
-        plt.ylabel('WER', fontsize=12)
-        plt.ylim([0, min(100, max(self.observation_eval) + 1)])
-        plt.legend(loc="upper right", fontsize=12)
-        if os.path.isfile(os.path.join(self.save_path, 'wer' + ".png")):
-            os.remove(os.path.join(self.save_path, 'wer' + ".png"))
-        plt.savefig(os.path.join(self.save_path, 'wer' + ".png"), dvi=500)
+        self._writer.put({'epoch': self._epoch, 'split': 'dev', 'metric': 'eval',
+                          'value': float(metric_dev)})
 
     def snapshot(self):
-        # linestyles = ['solid', 'dashed', 'dotted', 'dashdotdotted']
-        linestyles = ['-', '--', '-.', ':', ':', ':', ':', ':', ':', ':', ':', ':']
-        for metric in self.observation_train.keys():
-            plt.clf()
-            upper = 0
-            for i, (k, v) in enumerate(sorted(self.observation_train[metric].items())):
-                # skip non-observed values
-                if np.mean(self.observation_train[metric][k]) == 0:
-                    continue
-
-                plt.plot(self.steps, self.observation_train[metric][k], blue,
-                         label=k + " (train)", linestyle=linestyles[i])
-                plt.plot(self.steps, self.observation_dev[metric][k], orange,
-                         label=k + " (dev)", linestyle=linestyles[i])
-                upper = max(upper, max(self.observation_train[metric][k]))
-                upper = max(upper, max(self.observation_dev[metric][k]))
-
-                # Save as csv file
-                if os.path.isfile(os.path.join(self.save_path, metric + '-' + k + ".csv")):
-                    os.remove(os.path.join(self.save_path, metric + '-' + k + ".csv"))
-                loss_graph = np.column_stack(
-                    (self.steps, self.observation_train[metric][k], self.observation_dev[metric][k]))
-                np.savetxt(os.path.join(self.save_path, metric + '-' + k + ".csv"), loss_graph, delimiter=",")
-
-            upper = min(upper + 10, 300)
-
-            plt.xlabel('step', fontsize=12)
-            plt.ylabel(metric, fontsize=12)
-            plt.ylim([0, upper])
-            plt.legend(loc="upper right", fontsize=12)
-            if os.path.isfile(os.path.join(self.save_path, metric + ".png")):
-                os.remove(os.path.join(self.save_path, metric + ".png"))
-            plt.savefig(os.path.join(self.save_path, metric + ".png"), dvi=500)
+        """Flush buffered observations to the disk."""
+        self._writer.put(_MetricsWriter.FLUSH)
+
+    def close(self):
+        self._writer.put(_MetricsWriter.CLOSE)
+        self._writer.join()
+        if self.tensorboard:
+            self.tf_writer.close()
+
+
+class MetricsAccumulator(object):
+    """Accumulate observations without synchronizing devices.
+
+    Observations of each step are kept as they are (scalar tensors on the
+    device or floats) and reduced to floats at once by `mean`.
+
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._mean = None
+
+    def add(self, observation):
+        """Append an observation of a step.
+
+            Args:
+                observation (dict): values are scalar tensors, floats or None
+
+        """
+        for k, v in observation.items():
+            if v is None:
+                continue
+            if torch.is_tensor(v):
+                v = v.detach()
+            self._values.setdefault(k, []).append(v)
+        self._mean = None
+
+    def mean(self):
+        """Average observations since the last reset.
+
+            Returns:
+                observation (dict): `{key: float}`
+
+        """
+        if self._mean is None:
+            self._mean = {k: total / len(self._values[k])
+                          for k, total in self.reduce(self._values, sum_values=True).items()}
+        return self._mean
+
+    def reset(self):
+        self._values = {}
+        self._mean = None
+
+    @staticmethod
+    def reduce(observation, sum_values=False):
+        """Copy observations to the host.
+
+            Args:
+                observation (dict): `{key: value}`, or `{key: [value, ...]}` if sum_values
+                sum_values (bool): sum a list of values per key
+            Returns:
+                observation (dict): `{key: float}`
+
+        """
+        reduced = {}
+        for k, values in observation.items():
+            if values is None:
+                continue
+            if not sum_values:
+                values = [values]
+            tensors = [v for v in values if torch.is_tensor(v)]
+            total = sum(float(v) for v in values if not torch.is_tensor(v))
+            if len(tensors) > 0:
+                # NOTE: values may be on different devices with DataParallel
+                device = tensors[0].device
+                total += torch.stack([v.float().sum().to(device) for v in tensors]).sum().item()
+            if total == float("inf") or total == -float("inf"):
+                logger.warning("WARNING: received an inf %s for %s." % (k.split('.')[0], k))
+            reduced[k] = total
+        return reduced
+
+
+class _MetricsWriter(threading.Thread):
+    """Append records to a JSON lines file in the background."""
+
+    FLUSH = 'flush'
+    CLOSE = 'close'
+
+    def __init__(self, path):
+        super(_MetricsWriter, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.queue = queue.Queue()
+
+    def put(self, record):
+        self.queue.put(record)
+
+    def run(self):
+        with open(self.path, 'a') as f:
+            while True:
+                record = self.queue.get()
+                if record == self.FLUSH:
+                    f.flush()
+                elif record == self.CLOSE:
+                    break
+                else:
+                    f.write(json.dumps(record) + '\n')
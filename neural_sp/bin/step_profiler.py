@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Profiler of training steps."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import os
+import time
+import torch
+
+logger = logging.getLogger('training')
+
+# decoder methods timed in addition to the forward of each sub-module
+DECODER_METHODS = ['forward_ctc', 'forward_att', 'forward_lmobj']
+
+
+class StepProfiler(object):
+    """Measure time of each part of training steps.
+
+    Sections of the training loop (data loading, forward, backward, gradient
+    clipping and optimizer step) are timed by `section`, and the forward
+    computation of the encoder and each decoder (CTC, attention and sub tasks)
+    is timed by hooks. The mean time per step and the peak memory are
+    summarized every `summary_step` steps.
+    NOTE: CUDA is synchronized at every boundary, which slows down training.
+
+    Args:
+        model (torch.nn.Module): model to profile (not wrapped by DataParallel)
+        reporter (Reporter):
+        enabled (bool): if False, all methods do nothing
+        profile_modules (bool): measure time of the encoder and decoders.
+            This must be False when the model is replicated over multiple GPUs.
+        summary_step (int): interval of summaries
+        trace_dir (str): directory to save `torch.profiler` traces
+        trace_start (int): step to start tracing
+        trace_n_steps (int): number of steps to trace
+
+    """
+
+    def __init__(self, model, reporter=None, enabled=True, profile_modules=True,
+                 summary_step=200, trace_dir=None, trace_start=0, trace_n_steps=0):
+        self.enabled = enabled
+        self.reporter = reporter
+        self.summary_step = summary_step
+        self.sync = torch.cuda.is_available()
+
+        self._step = 0
+        self._starts = {}
+        self._times = OrderedDict()
+        self._n_steps = 0
+        self._peak_memory = 0
+
+        self._handles = []
+        self._wrapped = []
+        self._nested = set()  # sections inside the forward computation
+        if enabled and profile_modules:
+            self._register(model)
+
+        self.trace_dir = trace_dir
+        self.trace_start = trace_start
+        self.trace_n_steps = trace_n_steps
+        self._trace = None
+
+    def _register(self, model):
+        for name, module in model.named_children():
+            if name != 'enc' and not name.startswith('dec_'):
+                continue
+            self._handles.append(module.register_forward_pre_hook(self._pre_hook(name)))
+            self._handles.append(module.register_forward_hook(self._post_hook(name)))
+            self._nested.add(name)
+            for method in DECODER_METHODS:
+                if hasattr(module, method):
+                    key = name + '.' + method.split('_')[-1]
+                    setattr(module, method, self._timed(key, module, getattr(module, method)))
+                    self._wrapped.append((module, method))
+                    self._nested.add(key)
+
+    # NOTE: evaluation on the dev set is not measured
+    def _pre_hook(self, name):
+        def hook(module, inputs):
+            if module.training:
+                self._start(name)
+        return hook
+
+    def _post_hook(self, name):
+        def hook(module, inputs, outputs):
+            if module.training:
+                self._stop(name)
+        return hook
+
+    def _timed(self, name, module, fn):
+        def timed(*args, **kwargs):
+            if not module.training:
+                return fn(*args, **kwargs)
+            with self.section(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def _synchronize(self):
+        if self.sync:
+            torch.cuda.synchronize()
+
+    def _start(self, name):
+        self._synchronize()
+        self._starts[name] = time.time()
+
+    def _stop(self, name):
+        self._synchronize()
+        elapsed = time.time() - self._starts.pop(name)
+        self._times[name] = self._times.get(name, 0.) + elapsed
+
+    @contextmanager
+    def section(self, name):
+        """Measure time of a section of the current step.
+
+        Args:
+            name (str):
+
+        """
+        if not self.enabled:
+            yield
+            return
+        self._start(name)
+        try:
+            yield
+        finally:
+            self._stop(name)
+
+    def step(self):
+        """Close the current step."""
+        if not self.enabled:
+            return
+        self._step += 1
+        self._n_steps += 1
+
+        if self.sync:
+            self._peak_memory = max(self._peak_memory, torch.cuda.max_memory_allocated())
+            if hasattr(torch.cuda, 'reset_peak_memory_stats'):
+                torch.cuda.reset_peak_memory_stats()
+            else:
+                torch.cuda.reset_max_memory_allocated()
+
+        self._step_trace()
+
+        if self._step % self.summary_step == 0:
+            self.summary()
+
+    def summary(self):
+        """Log the mean time per step and reset the statistics."""
+        if self._n_steps == 0:
+            return
+        total = sum(v for k, v in self._times.items() if k not in self._nested)
+        logger.info('===== Profile (mean of %d steps) =====' % self._n_steps)
+        logger.info('%-24s %10s %8s' % ('section', 'time[ms]', 'ratio[%]'))
+        observation = {}
+        for k, v in self._times.items():
+            logger.info('%-24s %10.2f %8.2f' % (k, v / self._n_steps * 1000,
+                                                v / total * 100 if total > 0 else 0))
+            observation['time.' + k.replace('.', '-')] = v / self._n_steps * 1000
+        if self.sync:
+            logger.info('peak memory: %.1f MB' % (self._peak_memory / 1024 ** 2))
+            observation['memory.peak'] = self._peak_memory / 1024 ** 2
+        if self.reporter is not None:
+            self.reporter.add_profile(observation)
+
+        self._times = OrderedDict()
+        self._n_steps = 0
+        self._peak_memory = 0
+
+    def _step_trace(self):
+        if self.trace_n_steps <= 0 or self.trace_dir is None:
+            return
+        if self._trace is None and self._step >= self.trace_start:
+            try:
+                from torch.profiler import profile
+                from torch.profiler import ProfilerActivity
+                from torch.profiler import tensorboard_trace_handler
+            except ImportError:
+                logger.warning('torch.profiler is not available.')
+                self.trace_n_steps = 0
+                return
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self._trace = profile(activities=activities, record_shapes=True, profile_memory=True,
+                                  on_trace_ready=tensorboard_trace_handler(os.path.join(self.trace_dir, 'profile')))
+            self._trace.__enter__()
+            logger.info('Start tracing at step %d' % self._step)
+        elif self._trace is not None:
+            self._trace.step()
+            if self._step >= self.trace_start + self.trace_n_steps:
+                self._trace.__exit__(None, None, None)
+                self._trace = None
+                self.trace_n_steps = 0
+                logger.info('Saved traces to %s' % os.path.join(self.trace_dir, 'profile'))
+
+    def close(self):
+        """Remove hooks and stop tracing."""
+        if self._trace is not None:
+            self._trace.__exit__(None, None, None)
+            self._trace = None
+        for handle in self._handles:
+            handle.remove()
+        for module, method in self._wrapped:
+            delattr(module, method)
+        self._handles = []
+        self._wrapped = []
@@ -10,16 +10,21 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import copy
 import functools
 from glob import glob
 import logging
 import os
+import threading
 import time
 import torch
 import yaml
 
 logger = logging.getLogger('training')
 
+# background thread writing a checkpoint
+_checkpoint_writer = None
+
 
 def measure_time(func):
     @functools.wraps(func)
@@ -122,6 +127,7 @@ def load_checkpoint(model, checkpoint_path, resume=False):
             epoch (int): the currnet epoch
             step (int): the current step
             metric_dev_best (float): the current best performance
+            best_epoch (int): the epoch of the best checkpoint
 
     """
     if not os.path.isfile(checkpoint_path):
@@ -160,15 +166,21 @@ def load_checkpoint(model, checkpoint_path, resume=False):
         'lr_controller': checkpoint['lr_controller'],
         'epoch': epoch + 1,
         'step': checkpoint['step'] + 1,
-        'metric_dev_best': checkpoint['metric_dev_best']
+        'metric_dev_best': checkpoint['metric_dev_best'],
+        'best_epoch': checkpoint.get('best_epoch', epoch)
     }
     return model, return_values
 
 
 def save_checkpoint(model, save_path, lr_controller, epoch, step, metric_dev_best,
-                    remove_old_checkpoints=False):
+                    remove_old_checkpoints=False, background=False,
+                    metric_dev=None, n_keep_checkpoints=1, best_epoch=None):
     """Save checkpoint.
 
+    The checkpoint is first written to a temporary file, which is renamed
+    after the data reaches the disk. Old checkpoints are removed only after
+    the new one has been saved.
+
     Args:
         model (torch.nn.Module):
         save_path (str): path to the directory to save a model
@@ -176,26 +188,114 @@ def save_checkpoint(model, save_path, lr_controller, epoch, step, metric_dev_bes
         epoch (int): the currnet epoch
         step (int): the current step
         metric_dev_best (float):
-        remove_old_checkpoints (bool): if True, all checkpoints
-            other than the best one will be deleted
+        remove_old_checkpoints (bool): if True, all checkpoints other than
+            the latest `n_keep_checkpoints` ones and the best one will be deleted
+        background (bool): if True, serialize on a background thread.
+            The caller blocks only for copying the states to CPU memory.
+        metric_dev (float): performance of this checkpoint on the dev set
+        n_keep_checkpoints (int): number of the latest checkpoints to keep
+        best_epoch (int): epoch of the best checkpoint, which is always kept
 
     """
-    model_path = os.path.join(save_path, 'model.epoch-' + str(epoch))
+    global _checkpoint_writer
 
-    # Remove old checkpoints
-    if remove_old_checkpoints:
-        for path in glob(os.path.join(save_path, 'model.epoch-*')):
-            os.remove(path)
+    model_path = os.path.join(save_path, 'model.epoch-' + str(epoch))
 
     # Save parameters, optimizer, step index etc.
+    # NOTE: snapshot to CPU memory so that training can continue during serialization
     checkpoint = {
-        "state_dict": model.state_dict(),
-        "optimizer": model.optimizer.state_dict(),
-        "lr_controller": lr_controller,
+        "state_dict": _to_cpu(model.state_dict()),
+        "optimizer": _to_cpu(model.optimizer.state_dict()),
+        "lr_controller": copy.deepcopy(lr_controller),
         "epoch": epoch,
         "step": step,
-        "metric_dev_best": metric_dev_best
+        "metric_dev_best": metric_dev_best,
+        "metric_dev": metric_dev,
+        "best_epoch": best_epoch
     }
-    torch.save(checkpoint, model_path)
 
-    logger.info("=> Saved checkpoint (epoch:%d): %s" % (epoch, model_path))
+    # Wait for the previous checkpoint
+    wait_checkpoint()
+
+    keep_epochs = None
+    if remove_old_checkpoints:
+        keep_epochs = sorted(set(_saved_epochs(save_path) + [epoch]))[-n_keep_checkpoints:]
+        if best_epoch is not None:
+            keep_epochs.append(best_epoch)
+
+    if background:
+        _checkpoint_writer = _CheckpointWriter(checkpoint, model_path, keep_epochs)
+        _checkpoint_writer.start()
+    else:
+        _write_checkpoint(checkpoint, model_path, keep_epochs)
+
+
+def wait_checkpoint():
+    """Block until the checkpoint being written in the background is saved."""
+    global _checkpoint_writer
+
+    if _checkpoint_writer is not None:
+        _checkpoint_writer.join()
+        error = _checkpoint_writer.error
+        _checkpoint_writer = None
+        if error is not None:
+            raise error
+
+
+class _CheckpointWriter(threading.Thread):
+
+    def __init__(self, checkpoint, model_path, keep_epochs):
+        # NOTE: non-daemon thread so that the interpreter waits for it at exit
+        super(_CheckpointWriter, self).__init__()
+        self.checkpoint = checkpoint
+        self.model_path = model_path
+        self.keep_epochs = keep_epochs
+        self.error = None
+
+    def run(self):
+        try:
+            _write_checkpoint(self.checkpoint, self.model_path, self.keep_epochs)
+        except Exception as e:
+            logger.error("Failed to save checkpoint: %s" % self.model_path)
+            self.error = e
+        self.checkpoint = None
+
+
+def _write_checkpoint(checkpoint, model_path, keep_epochs=None):
+    save_path, model_name = os.path.split(model_path)
+    tmp_path = os.path.join(save_path, '.' + model_name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        torch.save(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, model_path)
+    # NOTE: rename is atomic on POSIX
+
+    # Remove old checkpoints
+    if keep_epochs is not None:
+        for e in _saved_epochs(save_path):
+            if e not in keep_epochs:
+                os.remove(os.path.join(save_path, 'model.epoch-' + str(e)))
+
+    logger.info("=> Saved checkpoint (epoch:%d): %s" % (checkpoint['epoch'], model_path))
+
+
+def _saved_epochs(save_path):
+    return [int(os.path.basename(path).split('-')[-1])
+            for path in glob(os.path.join(save_path, 'model.epoch-*'))]
+
+
+def _to_cpu(obj):
+    """Copy tensors in nested containers to CPU memory."""
+    if torch.is_tensor(obj):
+        obj = obj.detach()
+        return obj.cpu() if obj.is_cuda else obj.clone()
+    elif isinstance(obj, dict):
+        obj_cpu = type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+        if hasattr(obj, '_metadata'):
+            # NOTE: versions of modules in state_dict used by load_state_dict
+            obj_cpu._metadata = obj._metadata
+        return obj_cpu
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
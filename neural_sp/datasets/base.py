@@ -14,10 +14,13 @@ import codecs
 import logging
 import random
 import six
-import time
+from six.moves.queue import Empty
+from torch.multiprocessing import Event
 from torch.multiprocessing import Process
 from torch.multiprocessing import Queue
 
+from neural_sp.datasets.collate import pin_batch
+
 random.seed(1)
 
 logger = logging.getLogger('training')
@@ -35,6 +38,7 @@ class Base(object):
 
         # Setting for multiprocessing
         self.preloading_process = None
+        self.stop_event = None
         self.queue = Queue()
         self.queue_size = 0
 
@@ -80,18 +84,16 @@ class Base(object):
             # NOTE: max_epoch == None means infinite loop
 
             data_indices, is_new_epoch = self.sample_index(batch_size)
-            batch = self.make_batch(data_indices)
+            batch = self.on_batch_loaded(self.make_batch(data_indices))
             self.iteration += len(data_indices)
         else:
             # Clean up multiprocessing
-            if self.preloading_process is not None and self.queue_size == 0:
-                self.preloading_process.terminate()
-                self.preloading_process.join()
+            if self.queue_size == 0:
+                self.stop_preloading()
 
             if self.max_epoch is not None and self.epoch >= self.max_epoch:
                 # Clean up multiprocessing
-                self.preloading_process.terminate()
-                self.preloading_process.join()
+                self.stop_preloading()
                 raise StopIteration()
             # NOTE: max_epoch == None means infinite loop
 
@@ -103,29 +105,46 @@ class Base(object):
                     data_indices, is_new_epoch = self.sample_index(batch_size)
                     self.df_indices_list.append(data_indices)
                     self.is_new_epoch_list.append(is_new_epoch)
-                self.preloading_process = Process(self.preloading_loop,
-                                                  args=(self.queue, self.df_indices_list))
+                self.stop_event = Event()
+                self.preloading_process = Process(target=self.preloading_loop,
+                                                  args=(self.queue, self.df_indices_list, self.stop_event))
                 self.preloading_process.start()
                 self.queue_size += self.n_ques
-                time.sleep(3)
 
             # print(self.queue.qsize())
             # print(self.queue_size)
 
             self.iteration += len(self.df_indices_list[self.n_ques - self.queue_size])
             self.queue_size -= 1
-            batch = self.queue.get()
+            batch = self.on_batch_loaded(self.queue.get())
             is_new_epoch = self.is_new_epoch_list.pop(0)
 
         if is_new_epoch:
             self.epoch += 1
 
-        return batch, is_new_epoch
+        return pin_batch(batch), is_new_epoch
 
     def next(self, batch_size=None):
         # For python2
         return self.__next__(batch_size)
 
+    def on_batch_loaded(self, batch):
+        """Process a mini-batch in the main process (it may be made by the preloading process).
+
+        Args:
+            batch (dict):
+        Returns:
+            batch (dict):
+
+        """
+        return batch
+
+    def on_new_epoch(self):
+        """Called after the last mini-batch of an epoch is sampled.
+           Data indices of the next epoch have not been sampled yet.
+        """
+        pass
+
     def sample_index(self, batch_size):
         """Sample data indices of mini-batch.
 
@@ -178,6 +197,9 @@ class Base(object):
 
             self.offset += len(data_indices)
 
+        if is_new_epoch:
+            self.on_new_epoch()
+
         return data_indices, is_new_epoch
 
     def select_batch_size(self, batch_size, min_n_frames_batch):
@@ -199,28 +221,46 @@ class Base(object):
     def reset(self):
         self._reset()
 
+        # Clean up multiprocessing
+        self.stop_preloading()
+
         self.queue = Queue()
         self.queue_size = 0
 
-        # Clean up multiprocessing
-        if self.preloading_process is not None:
-            self.preloading_process.terminate()
-            self.preloading_process.join()
+    def stop_preloading(self):
+        """Stop the preloading process after it finishes the current mini-batch.
+
+        The process is not terminated because it may hold the lock of the feature cache.
+        """
+        if self.preloading_process is None:
+            return
+        self.stop_event.set()
+        # NOTE: the process cannot exit until its mini-batches in the queue are consumed
+        while self.preloading_process.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except Empty:
+                pass
+        self.preloading_process.join()
+        self.preloading_process = None
 
     def _reset(self):
         """Reset data counter and offset."""
         self.rest = set(list(self.df.index))
         self.offset = 0
 
-    def preloading_loop(self, queue, df_indices_list):
+    def preloading_loop(self, queue, df_indices_list, stop_event):
         """.
 
         Args:
             queue ():
             df_indices_list (np.ndarray):
+            stop_event (Event): set by `stop_preloading`
 
         """
         # print("Pre-loading started.")
         for i in six.moves.range(len(df_indices_list)):
+            if stop_event.is_set():
+                break
             queue.put(self.make_batch(df_indices_list[i]))
         # print("Pre-loading done.")
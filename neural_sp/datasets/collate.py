@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Collate mini-batches into padded tensors on the host."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import torch
+
+from neural_sp.models.seq2seq.frontends.frame_stacking import stack_frame
+from neural_sp.models.seq2seq.frontends.splicing import splice
+
+
+def collate_speech(xs, n_stacks=1, n_skips=1, n_splices=1):
+    """Stack, splice and pad acoustic features.
+
+    Args:
+        xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+        n_stacks (int):
+        n_skips (int):
+        n_splices (int):
+    Returns:
+        xs_pad (FloatTensor): `[B, T_max, input_dim']`
+        xlens (list): A list of length `[B]`
+
+    """
+    if n_stacks > 1:
+        xs = [stack_frame(x, n_stacks, n_skips) for x in xs]
+    if n_splices > 1:
+        xs = [splice(x, n_splices, n_stacks) for x in xs]
+    xlens = [len(x) for x in xs]
+    xs_pad = np.zeros((len(xs), max(xlens), xs[0].shape[-1]), dtype=np.float32)
+    for b, x in enumerate(xs):
+        xs_pad[b, :len(x)] = x
+    return torch.from_numpy(xs_pad), xlens
+
+
+def collate_labels(ys, pad):
+    """Pad label sequences.
+
+    Args:
+        ys (list): A list of length `[B]`, which contains a list of size `[L]`
+        pad (int): index for padding
+    Returns:
+        ys_pad (LongTensor): `[B, L_max]`
+        ylens (LongTensor): `[B]`
+
+    """
+    ylens = np.fromiter((len(y) for y in ys), dtype=np.int64, count=len(ys))
+    ys_pad = np.full((len(ys), ylens.max()), pad, dtype=np.int64)
+    for b, y in enumerate(ys):
+        ys_pad[b, :len(y)] = y
+    return torch.from_numpy(ys_pad), torch.from_numpy(ylens)
+
+
+def pin_batch(batch):
+    """Copy the collated tensors to the page-locked memory.
+
+    Args:
+        batch (dict):
+    Returns:
+        batch (dict):
+
+    """
+    if 'collated' in batch and torch.cuda.is_available():
+        batch['collated'] = {k: tuple(t.pin_memory() for t in v) if isinstance(v, tuple)
+                             else v.pin_memory() if torch.is_tensor(v) else v
+                             for k, v in batch['collated'].items()}
+    return batch
@@ -0,0 +1,171 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""LRU cache of decompressed features shared by the main and preloading processes."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import atexit
+import copy
+import hashlib
+import logging
+import multiprocessing as mp
+import numpy as np
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger('training')
+
+
+class SharedFeatureCache(object):
+    """Least recently used cache of float32 features bounded by the total size.
+
+    Each matrix is saved as a .npy file in a directory on the shared memory
+    (/dev/shm), so that the preloading processes forked from the main process
+    read and write the same cache. The total size and hit counts are kept in
+    shared counters. Caches made by `share` use the same files with their own
+    hit counts (e.g., for the dev set). Reads update the modification time of the file, and the
+    oldest files are evicted when the size exceeds the budget.
+
+    Args:
+        max_bytes (int): maximum number of bytes to keep
+        cache_dir (str): parent directory of the cache (removed at exit)
+
+    """
+
+    def __init__(self, max_bytes, cache_dir='/dev/shm'):
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            logger.warning('%s does not exist. The feature cache is made in %s.' %
+                           (cache_dir, tempfile.gettempdir()))
+            cache_dir = None
+        self.cache_dir = tempfile.mkdtemp(prefix='neural_sp_feats_', dir=cache_dir)
+
+        self._lock = mp.Lock()
+        self._n_bytes = mp.Value('q', 0, lock=False)
+        self._n_files = mp.Value('q', 0, lock=False)
+        self._n_hits = mp.Value('q', 0, lock=False)
+        self._n_misses = mp.Value('q', 0, lock=False)
+
+        self._owner_pid = os.getpid()
+        atexit.register(self.close)
+
+    def __len__(self):
+        return self._n_files.value
+
+    def share(self):
+        """Make a cache sharing the files and the size budget with separate hit counts.
+
+        Returns:
+            feat_cache (SharedFeatureCache):
+
+        """
+        feat_cache = copy.copy(self)
+        feat_cache._n_hits = mp.Value('q', 0, lock=False)
+        feat_cache._n_misses = mp.Value('q', 0, lock=False)
+        return feat_cache
+
+    @property
+    def n_bytes(self):
+        return self._n_bytes.value
+
+    @property
+    def n_hits(self):
+        return self._n_hits.value
+
+    @property
+    def n_misses(self):
+        return self._n_misses.value
+
+    @property
+    def hit_rate(self):
+        n_total = self.n_hits + self.n_misses
+        return self.n_hits / n_total if n_total > 0 else 0.
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.md5(key.encode('utf-8')).hexdigest() + '.npy')
+
+    def _count(self, counter):
+        with self._lock:
+            counter.value += 1
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            value = np.load(path)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            # not cached, or evicted (or being written) by another process
+            self._count(self._n_misses)
+            return None
+        self._count(self._n_hits)
+        return value
+
+    def put(self, key, value):
+        value = np.ascontiguousarray(value, dtype=np.float32)
+        path = self._path(key)
+        if value.nbytes > self.max_bytes or os.path.exists(path):
+            return  # too large, or already cached by another process
+        # Write to a temporary file and rename it so that readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, value)
+        n_bytes = os.path.getsize(tmp_path)
+        os.rename(tmp_path, path)
+        with self._lock:
+            self._n_bytes.value += n_bytes
+            self._n_files.value += 1
+            if self._n_bytes.value > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove the least recently used files until 90% of the budget is free."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        entries.sort()
+        target = int(self.max_bytes * 0.9)
+        n_bytes = sum(e[1] for e in entries)
+        n_files = len(entries)
+        for _, size, name in entries:
+            if n_bytes <= target:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            n_bytes -= size
+            n_files -= 1
+        self._n_bytes.value = n_bytes
+        self._n_files.value = n_files
+
+    def close(self):
+        """Remove the cache directory (only in the process that created it)."""
+        if os.getpid() == self._owner_pid and os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def build_feat_cache(args):
+    """Build the shared cache of features dumped by Kaldi from arguments.
+
+    Args:
+        args (Namespace): training arguments
+    Returns:
+        feat_cache (SharedFeatureCache): None when disabled or the logmel frontend is used
+
+    """
+    if getattr(args, 'frontend', 'kaldi') != 'kaldi' or args.feat_cache_size <= 0:
+        return None
+    return SharedFeatureCache(args.feat_cache_size * 1024 ** 2, cache_dir=args.feat_cache_dir)
@@ -0,0 +1,409 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Log-mel filterbank features computed from raw audio with NumPy."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import math
+import numpy as np
+import os
+import wave
+
+from neural_sp.datasets.perturbation import speed_perturb_signal
+
+EPS = 1e-10
+
+
+def read_wav(wav_path):
+    """Read a 16-bit PCM wav file.
+
+    Args:
+        wav_path (str): path to the wav file
+    Returns:
+        signal (np.ndarray): samples in the 16-bit integer scale (as Kaldi). `[n_samples]`
+        sample_rate (int):
+
+    """
+    f = wave.open(wav_path, 'rb')
+    try:
+        n_channels = f.getnchannels()
+        sample_width = f.getsampwidth()
+        sample_rate = f.getframerate()
+        data = f.readframes(f.getnframes())
+    finally:
+        f.close()
+    if sample_width != 2:
+        raise ValueError('Only 16-bit PCM is supported: %s' % wav_path)
+    signal = np.frombuffer(data, dtype='<i2').astype(np.float32)
+    if n_channels > 1:
+        # use the 1st channel
+        signal = signal.reshape(-1, n_channels)[:, 0]
+    return signal, sample_rate
+
+
+def n_frames(n_samples, win_length, hop_length):
+    """Number of frames without padding (snip_edges=true in Kaldi)."""
+    if n_samples < win_length:
+        return 0
+    return 1 + (n_samples - win_length) // hop_length
+
+
+def wav_n_frames(wav_path, frame_length=0.025, frame_shift=0.01):
+    """Number of frames read only from the header of the wav file.
+
+    Args:
+        wav_path (str): path to the wav file
+        frame_length (float): window length in seconds
+        frame_shift (float): window shift in seconds
+    Returns:
+        n_frames (int):
+
+    """
+    f = wave.open(wav_path, 'rb')
+    try:
+        sample_rate = f.getframerate()
+        n_samples = f.getnframes()
+    finally:
+        f.close()
+    return n_frames(n_samples, int(sample_rate * frame_length), int(sample_rate * frame_shift))
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels, low_freq=20., high_freq=None):
+    """Triangular mel filters (the same mel scale as Kaldi).
+
+    Args:
+        sample_rate (int):
+        n_fft (int): size of FFT
+        n_mels (int): number of mel bins
+        low_freq (float): lower cutoff frequency
+        high_freq (float): upper cutoff frequency (Nyquist frequency by default)
+    Returns:
+        fbank (np.ndarray): `[n_fft // 2 + 1, n_mels]`
+
+    """
+    if high_freq is None:
+        high_freq = sample_rate / 2
+
+    def mel(f):
+        return 1127. * np.log(1. + np.asarray(f) / 700.)
+
+    mel_points = np.linspace(mel(low_freq), mel(high_freq), n_mels + 2)
+    mel_bins = mel(np.arange(n_fft // 2 + 1) * sample_rate / n_fft)
+    fbank = np.zeros((n_fft // 2 + 1, n_mels), dtype=np.float32)
+    for m in range(n_mels):
+        left, center, right = mel_points[m:m + 3]
+        up = (mel_bins - left) / (center - left)
+        down = (right - mel_bins) / (right - center)
+        fbank[:, m] = np.maximum(0., np.minimum(up, down))
+    return fbank
+
+
+def add_deltas(feats, window=2):
+    """Append delta and delta-delta features (same as add-deltas in Kaldi).
+
+    Args:
+        feats (np.ndarray): `[T, dim]`
+        window (int): context size of the regression
+    Returns:
+        feats (np.ndarray): `[T, dim * 3]`
+
+    """
+    def delta(x):
+        padded = np.pad(x, ((window, window), (0, 0)), mode='edge')
+        denom = 2 * sum(n ** 2 for n in range(1, window + 1))
+        out = np.zeros_like(x)
+        for n in range(1, window + 1):
+            out += n * (padded[window + n:window + n + len(x)] - padded[window - n:window - n + len(x)])
+        return out / denom
+
+    d1 = delta(feats)
+    d2 = delta(d1)
+    return np.concatenate([feats, d1, d2], axis=-1).astype(np.float32)
+
+
+class GlobalCMVN(object):
+    """Global mean and variance normalization.
+
+    The statistics are accumulated in a single streaming pass over utterances.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = None
+        self.sum_sq = None
+
+    def accumulate(self, feats):
+        """Add statistics of an utterance.
+
+        Args:
+            feats (np.ndarray): `[T, dim]`
+
+        """
+        feats = feats.astype(np.float64)
+        if self.sum is None:
+            self.sum = np.zeros(feats.shape[-1], dtype=np.float64)
+            self.sum_sq = np.zeros(feats.shape[-1], dtype=np.float64)
+        self.count += len(feats)
+        self.sum += feats.sum(0)
+        self.sum_sq += (feats ** 2).sum(0)
+
+    @property
+    def mean(self):
+        return self.sum / self.count
+
+    @property
+    def std(self):
+        var = self.sum_sq / self.count - self.mean ** 2
+        return np.sqrt(np.maximum(var, 1e-20))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, count=self.count, sum=self.sum, sum_sq=self.sum_sq)
+
+    @classmethod
+    def load(cls, path):
+        cmvn = cls()
+        stats = np.load(path)
+        cmvn.count = int(stats['count'])
+        cmvn.sum = stats['sum']
+        cmvn.sum_sq = stats['sum_sq']
+        return cmvn
+
+    def __call__(self, feats):
+        return ((feats - self.mean) / self.std).astype(np.float32)
+
+
+class LRUCache(object):
+    """Least recently used cache of arrays bounded by the total size.
+
+    Args:
+        max_bytes (int): maximum number of bytes to keep
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.n_hits = 0
+        self.n_misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        if key not in self._data:
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self._data:
+            self.n_bytes -= self._data.pop(key).nbytes
+        if value.nbytes > self.max_bytes:
+            return
+        self._data[key] = value
+        self.n_bytes += value.nbytes
+        while self.n_bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.n_bytes -= evicted.nbytes
+
+    @property
+    def hit_rate(self):
+        n_total = self.n_hits + self.n_misses
+        return self.n_hits / n_total if n_total > 0 else 0.
+
+
+class LogMelFrontend(object):
+    """Compute log-mel filterbank features from wav files.
+
+    Frames of all utterances in a mini-batch are transformed by a single FFT.
+    The pipeline follows the Kaldi recipes: log-mel filterbank, global CMVN
+    and then (optionally) delta and delta-delta features.
+
+    Args:
+        sample_rate (int): expected sampling rate of wav files
+        n_mels (int): number of mel bins
+        frame_length (float): window length in seconds
+        frame_shift (float): window shift in seconds
+        preemphasis (float): coefficient of pre-emphasis
+        cmvn_path (str): path to the global CMVN statistics saved by GlobalCMVN
+        add_deltas (bool): append delta and delta-delta features
+        cache_size (int): size of the LRU cache of features in MB (0 means no cache)
+
+    """
+
+    def __init__(self, sample_rate=16000, n_mels=80, frame_length=0.025, frame_shift=0.01,
+                 preemphasis=0.97, cmvn_path=None, add_deltas=False, cache_size=0):
+
+        self.sample_rate = sample_rate
+        self.n_mels = n_mels
+        self.win_length = int(sample_rate * frame_length)
+        self.hop_length = int(sample_rate * frame_shift)
+        self.n_fft = 2 ** int(math.ceil(math.log(self.win_length, 2)))
+        self.preemphasis = preemphasis
+        self.window = np.hamming(self.win_length).astype(np.float32)
+        self.fbank = mel_filterbank(sample_rate, self.n_fft, n_mels)
+        self.cmvn = GlobalCMVN.load(cmvn_path) if cmvn_path else None
+        self.add_deltas = add_deltas
+
+        self.cache = LRUCache(cache_size * 1024 ** 2) if cache_size > 0 else None
+        # computed features and cache statistics not yet reported to the main process
+        self._new_feats = {}
+        self._n_hits_reported = 0
+        self._n_misses_reported = 0
+
+    @property
+    def output_dim(self):
+        return self.n_mels * 3 if self.add_deltas else self.n_mels
+
+    def frames(self, signal):
+        """Split a signal into windowed frames.
+
+        Args:
+            signal (np.ndarray): `[n_samples]`
+        Returns:
+            frames (np.ndarray): `[T, win_length]`
+
+        """
+        T = n_frames(len(signal), self.win_length, self.hop_length)
+        indices = np.arange(self.win_length)[None, :] + self.hop_length * np.arange(T)[:, None]
+        frames = signal[indices]
+        frames = frames - frames.mean(-1, keepdims=True)  # remove DC offset
+        if self.preemphasis > 0:
+            frames = np.concatenate([frames[:, :1] * (1 - self.preemphasis),
+                                     frames[:, 1:] - self.preemphasis * frames[:, :-1]], axis=1)
+        return frames * self.window
+
+    def logmel(self, signals):
+        """Compute log-mel filterbank features of multiple signals at once.
+
+        Args:
+            signals (list): A list of length `[B]`, which contains arrays of size `[n_samples]`
+        Returns:
+            feats (list): A list of length `[B]`, which contains arrays of size `[T, n_mels]`
+
+        """
+        frames = [self.frames(x) for x in signals]
+        lens = [len(f) for f in frames]
+        spec = np.fft.rfft(np.concatenate(frames, axis=0), n=self.n_fft)
+        power = spec.real ** 2 + spec.imag ** 2
+        feats = np.log(np.maximum(np.dot(power, self.fbank), EPS)).astype(np.float32)
+        return np.split(feats, np.cumsum(lens)[:-1], axis=0)
+
+    def postprocess(self, feats):
+        if self.cmvn is not None:
+            feats = self.cmvn(feats)
+        if self.add_deltas:
+            feats = add_deltas(feats)
+        return feats
+
+    def compute(self, signals):
+        """Compute features of waveforms in memory (not cached).
+
+        Args:
+            signals (list): A list of length `[B]`, which contains arrays of size `[n_samples]`
+        Returns:
+            feats (list): A list of length `[B]`, which contains arrays of size `[T, output_dim]`
+
+        """
+        return [self.postprocess(f) for f in self.logmel(signals)]
+
+    def __call__(self, wav_paths, speeds=None):
+        """Load features of wav files.
+
+        Args:
+            wav_paths (list): paths to wav files
+            speeds (list): speed factors to perturb each waveform
+        Returns:
+            feats (list): A list of length `[B]`, which contains arrays of size `[T, output_dim]`
+
+        """
+        if speeds is None:
+            speeds = [1.0] * len(wav_paths)
+        keys = [p if s == 1 else '%s@%.3f' % (p, s) for p, s in zip(wav_paths, speeds)]
+        feats = [self.cache.get(k) if self.cache is not None else None for k in keys]
+        indices = [i for i, f in enumerate(feats) if f is None]
+        if len(indices) == 0:
+            return feats
+
+        signals = []
+        for i in indices:
+            signal, sample_rate = read_wav(wav_paths[i])
+            if sample_rate != self.sample_rate:
+                raise ValueError('Sampling rate of %s is %d (expected %d)' %
+                                 (wav_paths[i], sample_rate, self.sample_rate))
+            signals.append(speed_perturb_signal(signal, speeds[i]))
+        for i, f in zip(indices, self.logmel(signals)):
+            feats[i] = self.postprocess(f)
+            if self.cache is not None:
+                self.cache.put(keys[i], feats[i])
+                self._new_feats[keys[i]] = feats[i]
+        return feats
+
+    def pop_updates(self):
+        """Pop features computed and cache statistics since the last call.
+
+        The preloading process is forked from the main process, so updates of
+        the cache in the preloading process are sent back with mini-batches and
+        merged by `merge_updates` to be inherited by the next preloading process.
+
+        Returns:
+            updates (dict):
+
+        """
+        updates = {'pid': os.getpid(),
+                   'feats': self._new_feats,
+                   'n_hits': self.cache.n_hits - self._n_hits_reported,
+                   'n_misses': self.cache.n_misses - self._n_misses_reported}
+        self._new_feats = {}
+        self._n_hits_reported = self.cache.n_hits
+        self._n_misses_reported = self.cache.n_misses
+        return updates
+
+    def merge_updates(self, updates):
+        """Merge updates of the cache made in the preloading process.
+
+        Args:
+            updates (dict): returned by `pop_updates`
+
+        """
+        if updates['pid'] == os.getpid():
+            return  # already in the cache
+        for k, v in updates['feats'].items():
+            self.cache.put(k, v)
+        self.cache.n_hits += updates['n_hits']
+        self.cache.n_misses += updates['n_misses']
+
+
+def build_frontend(args, cmvn_path=None):
+    """Build the feature frontend from arguments.
+
+    Args:
+        args (Namespace): training or decoding arguments
+        cmvn_path (str): overwrite args.cmvn_path (e.g., the copy in the model directory)
+    Returns:
+        frontend (LogMelFrontend): None when features dumped by Kaldi are used
+
+    """
+    if getattr(args, 'frontend', 'kaldi') != 'logmel':
+        return None
+    return LogMelFrontend(sample_rate=args.sample_rate,
+                          n_mels=args.n_mels,
+                          cmvn_path=cmvn_path if cmvn_path else args.cmvn_path,
+                          add_deltas=args.add_deltas,
+                          cache_size=args.feat_cache_size)
@@ -18,6 +18,11 @@ import os
 import pandas as pd
 
 from neural_sp.datasets.base import Base
+from neural_sp.datasets.collate import collate_labels
+from neural_sp.datasets.collate import collate_speech
+from neural_sp.datasets.perturbation import perturbed_length
+from neural_sp.datasets.perturbation import sample_speeds
+from neural_sp.datasets.perturbation import speed_perturb_feats
 from neural_sp.datasets.token_converter.character import Char2idx
 from neural_sp.datasets.token_converter.character import Idx2char
 from neural_sp.datasets.token_converter.phone import Idx2phone
@@ -50,7 +55,9 @@ class Dataset(Base):
                  ctc_sub2=False, subsample_factor_sub2=1,
                  wp_model_sub3=False,
                  tsv_path_sub3=False, dict_path_sub3=False, unit_sub3=False,
-                 ctc_sub3=False, subsample_factor_sub3=1):
+                 ctc_sub3=False, subsample_factor_sub3=1,
+                 collate=False, n_stacks=1, n_skips=1, n_splices=1,
+                 frontend=None, feat_cache=None, speed_factors=None, seed=1):
         """A class for loading dataset.
 
         Args:
@@ -77,6 +84,18 @@ class Dataset(Base):
             corpus (str): name of corpus
             concat_prev_n_utterances (int): number of utterances to concatenate
             n_caches (int): number of previous tokens for cache (for training)
+            collate (bool): add padded tensors of inputs and labels to mini-batches
+            n_stacks (int): number of frames to stack when collating
+            n_skips (int): number of frames to skip when collating
+            n_splices (int): number of frames to splice when collating
+            frontend (LogMelFrontend): compute features from wav files in feat_path.
+                If None, features dumped by Kaldi are read.
+            feat_cache (SharedFeatureCache): cache of decompressed features dumped by Kaldi
+            speed_factors (list): speed factors for speed perturbation, e.g., [0.9, 1.0, 1.1].
+                A factor is drawn for each utterance at every epoch with the seed of
+                `seed + epoch`, and waveforms are resampled (or Kaldi features are
+                warped along the time axis) when loaded.
+            seed (int): seed of speed perturbation
 
         """
         super(Dataset, self).__init__()
@@ -90,11 +109,22 @@ class Dataset(Base):
         self.shuffle = shuffle
         self.sort_stop_epoch = sort_stop_epoch
         self.sort_by_input_length = sort_by_input_length
+        self.short2long = short2long
         self.n_ques = n_ques
         self.dynamic_batching = dynamic_batching
         self.corpus = corpus
         self.concat_prev_n_utterances = concat_prev_n_utterances
         self.n_caches = n_caches
+        self.collate = collate
+        self.n_stacks = n_stacks
+        self.n_skips = n_skips
+        self.n_splices = n_splices
+        self.frontend = frontend
+        self.feat_cache = feat_cache
+        self.speed_factors = speed_factors
+        self.seed = seed
+        self.ctc = ctc
+        self.subsample_factor = subsample_factor
         self.vocab = self.count_vocab_size(dict_path)
 
         self.eos = 2
@@ -242,6 +272,12 @@ class Dataset(Base):
                             setattr(self, 'df_sub' + str(j),
                                     getattr(self, 'df_sub' + str(j)).drop(getattr(self, 'df_sub' + str(j)).index.difference(self.df.index)))
 
+        if speed_factors:
+            if concat_prev_n_utterances > 0:
+                raise ValueError('Speed perturbation (speed_factors) is not supported with concat_prev_n_utterances > 0.')
+            self.df['xlen_orig'] = self.df['xlen']
+            self.perturb_speed()
+
         # Sort tsv records
         if not is_test:
             if sort_by_input_length:
@@ -250,7 +286,72 @@ class Dataset(Base):
                 self.df = self.df.reindex(np.random.permutation(self.df.index))
 
         self.rest = set(list(self.df.index))
-        self.input_dim = kaldi_io.read_mat(self.df['feat_path'][0]).shape[-1]
+        if frontend is not None:
+            self.input_dim = frontend.output_dim
+        else:
+            self.input_dim = kaldi_io.read_mat(self.df['feat_path'][0]).shape[-1]
+
+    def perturb_speed(self):
+        """Draw speed factors of the current epoch and update xlen."""
+        speeds = sample_speeds(len(self.df), self.speed_factors, self.seed, self._epoch)
+        xlens = perturbed_length(self.df['xlen_orig'].values, speeds)
+        if self.ctc and self.subsample_factor > 1:
+            # Keep the original speed if CTC cannot align labels to the shortened inputs
+            invalid = self.df['ylen'].values > xlens // self.subsample_factor
+            speeds[invalid] = 1.0
+            xlens[invalid] = self.df['xlen_orig'].values[invalid]
+        self.df['speed'] = speeds
+        self.df['xlen'] = xlens
+
+    def on_new_epoch(self):
+        if not self.speed_factors:
+            return
+        self.perturb_speed()
+        # Re-sort so that the length-based sampler batches perturbed utterances correctly
+        # NOTE: mini-batches already enqueued for the preloading process use the new factors
+        if self.sort_by_input_length:
+            self.df = self.df.sort_values(by='xlen', ascending=self.short2long)
+            self._reset()
+
+    def read_mat(self, feat_path):
+        if self.feat_cache is None:
+            return kaldi_io.read_mat(feat_path)
+        x = self.feat_cache.get(feat_path)
+        if x is None:
+            x = kaldi_io.read_mat(feat_path).astype(np.float32)
+            self.feat_cache.put(feat_path, x)
+        return x
+
+    @property
+    def cache(self):
+        """Cache of input features (None if not used)."""
+        if self.frontend is not None:
+            return self.frontend.cache
+        return self.feat_cache
+
+    def load_feats(self, feat_paths, speeds=None):
+        """Load input features.
+
+        Args:
+            feat_paths (list): paths to Kaldi features or wav files
+            speeds (list): speed factors for speed perturbation
+        Returns:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+
+        """
+        if self.frontend is not None:
+            return self.frontend(feat_paths, speeds)
+        xs = [self.read_mat(p) for p in feat_paths]
+        if speeds is not None:
+            xs = [speed_perturb_feats(x, s) for x, s in zip(xs, speeds)]
+        return xs
+
+    def on_batch_loaded(self, batch):
+        # Share features computed in the preloading process with the following ones
+        updates = batch.pop('feat_cache_updates', None)
+        if updates is not None:
+            self.frontend.merge_updates(updates)
+        return batch
 
     def make_batch(self, df_indices):
         """Create mini-batch per step.
@@ -268,14 +369,19 @@ class Dataset(Base):
                 utt_ids (list): name of each utterance
                 speakers (list): name of each speaker
                 sessions (list): name of each session
+                collated (dict): padded tensors of xs, ys, ys_sub1 and ys_sub2
+                    (only when collate is True)
+                feat_cache_updates (dict): features newly computed by the frontend
+                    (removed in on_batch_loaded)
 
         """
         # inputs
-        xs = [kaldi_io.read_mat(self.df['feat_path'][i]) for i in df_indices]
+        speeds = [self.df['speed'][i] for i in df_indices] if self.speed_factors else None
+        xs = self.load_feats([self.df['feat_path'][i] for i in df_indices], speeds)
         if self.concat_prev_n_utterances > 0:
             for j, i in enumerate(df_indices):
                 for idx in self.df['prev_utt'][i][::-1]:
-                    x_prev = kaldi_io.read_mat(self.df['feat_path'][idx])
+                    x_prev = self.load_feats([self.df['feat_path'][idx]])[0]
                     xs[j] = np.concatenate(
                         [x_prev, np.zeros((self.pad_xlen, self.input_dim), dtype=np.float32), xs[j]], axis=0)
 
@@ -327,7 +433,7 @@ class Dataset(Base):
 
         batch_dict = {
             'xs': xs,
-            'xlens': [self.df['xlen'][i] for i in df_indices],
+            'xlens': [len(x) for x in xs],
             'ys': ys,
             'ys_cache': ys_cache,
             'ys_sub1': ys_sub1,
@@ -340,4 +446,15 @@ class Dataset(Base):
             'feat_path': [self.df['feat_path'][i] for i in df_indices]  # for plot
         }
 
+        if self.frontend is not None and self.frontend.cache is not None:
+            batch_dict['feat_cache_updates'] = self.frontend.pop_updates()
+
+        # Pad in the loader process so that the model needs a single transfer per tensor
+        if self.collate:
+            xs_pad, xlens = collate_speech(xs, self.n_stacks, self.n_skips, self.n_splices)
+            batch_dict['collated'] = {'xs': xs_pad, 'xlens': xlens}
+            for k in ['ys', 'ys_sub1', 'ys_sub2']:
+                if len(batch_dict[k]) > 0:
+                    batch_dict['collated'][k] = collate_labels(batch_dict[k], self.pad)
+
         return batch_dict
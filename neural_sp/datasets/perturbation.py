@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Speed perturbation at load time."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def sample_speeds(n_utts, speed_factors, seed, epoch):
+    """Draw a speed factor per utterance with a per-epoch seed.
+
+    Args:
+        n_utts (int): number of utterances
+        speed_factors (list): candidates, e.g., [0.9, 1.0, 1.1]
+        seed (int):
+        epoch (int):
+    Returns:
+        speeds (np.ndarray): `[n_utts]`
+
+    """
+    rng = np.random.RandomState(seed + epoch)
+    return rng.choice(np.array(speed_factors, dtype=np.float64), size=n_utts)
+
+
+def perturbed_length(length, speed):
+    """Length of a sequence played `speed` times faster.
+
+    Args:
+        length (int or np.ndarray):
+        speed (float or np.ndarray):
+    Returns:
+        length (int or np.ndarray):
+
+    """
+    return np.maximum(np.floor(np.asarray(length) / speed), 1).astype(np.int64)
+
+
+def _interpolate(xs, speed):
+    """Linearly interpolate xs along the 1st axis at intervals of speed."""
+    length = len(xs)
+    pos = np.minimum(np.arange(perturbed_length(length, speed)) * speed, length - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, length - 1)
+    w = (pos - lo).astype(np.float32)
+    if xs.ndim > 1:
+        w = w[:, None]
+    return (xs[lo] * (1 - w) + xs[hi] * w).astype(np.float32)
+
+
+def _resample(signal, speed, n_zeros=16, rolloff=0.95, chunk_size=16000):
+    """Band-limited interpolation with a Hann-windowed sinc kernel.
+
+    The cutoff of the low-pass filter is lowered to the new Nyquist frequency
+    when speed > 1 to prevent aliasing.
+
+    Args:
+        signal (np.ndarray): `[n_samples]`
+        speed (float):
+        n_zeros (int): number of zero crossings of the sinc kernel on each side
+        rolloff (float): cutoff frequency relative to the Nyquist frequency
+        chunk_size (int): number of output samples computed at once
+    Returns:
+        signal (np.ndarray): `[n_samples / speed]`
+
+    """
+    cutoff = rolloff * min(1., 1. / speed)
+    half_width = int(np.ceil(n_zeros / cutoff))
+    padded = np.pad(signal.astype(np.float64), half_width, mode='constant')
+    taps = np.arange(-half_width + 1, half_width + 1)
+    pos = np.arange(perturbed_length(len(signal), speed)) * speed
+    out = np.empty(len(pos), dtype=np.float32)
+    for start in range(0, len(pos), chunk_size):
+        pos_chunk = pos[start:start + chunk_size, None]
+        idx = np.floor(pos_chunk).astype(np.int64) + taps  # `[chunk_size, 2 * half_width]`
+        t = (pos_chunk - idx) * cutoff
+        kernel = cutoff * np.sinc(t) * (0.5 + 0.5 * np.cos(np.pi * np.clip(t / n_zeros, -1, 1)))
+        out[start:start + chunk_size] = (padded[idx + half_width] * kernel).sum(1)
+    return out
+
+
+def speed_perturb_signal(signal, speed):
+    """Resample a waveform to change the playback speed (and pitch) like `sox speed`.
+
+    Args:
+        signal (np.ndarray): `[n_samples]`
+        speed (float): > 1 makes the signal faster (shorter)
+    Returns:
+        signal (np.ndarray): `[n_samples / speed]`
+
+    """
+    if speed == 1:
+        return signal
+    return _resample(signal, speed)
+
+
+def speed_perturb_feats(feats, speed):
+    """Warp features along the time axis.
+
+    This approximates speed perturbation for features dumped by Kaldi,
+    where the waveform is not available.
+
+    Args:
+        feats (np.ndarray): `[T, input_dim]`
+        speed (float): > 1 makes the sequence faster (shorter)
+    Returns:
+        feats (np.ndarray): `[T / speed, input_dim]`
+
+    """
+    if speed == 1:
+        return feats
+    return _interpolate(feats, speed)
@@ -20,7 +20,7 @@ logger = logging.getLogger("decoding").getChild('character')
 
 
 def eval_char(models, dataset, recog_params, epoch,
-              recog_dir=None, progressbar=False, task_idx=0):
+              recog_dir=None, progressbar=False, task_idx=0, counts=None):
     """Evaluate the character-level model by WER & CER.
 
     Args:
@@ -34,6 +34,7 @@ def eval_char(models, dataset, recog_params, epoch,
             0: main task
             1: sub task
             2: sub sub task
+        counts (dict): if given, filled with the raw error counts before normalization
     Returns:
         wer (float): Word error rate
         cer (float): Character error rate
@@ -133,6 +134,10 @@ def eval_char(models, dataset, recog_params, epoch,
     # Reset data counters
     dataset.reset()
 
+    if counts is not None:
+        counts['wer'] = [wer, n_sub_w, n_ins_w, n_del_w, n_word]
+        counts['cer'] = [cer, n_sub_c, n_ins_c, n_del_c, n_char]
+
     if ('char' in dataset.unit and 'nowb' not in dataset.unit) or (task_idx > 0 and dataset.unit_sub1 == 'char'):
         wer /= n_word
         n_sub_w /= n_word
@@ -146,6 +146,34 @@ def compute_wer(ref, hyp, normalize=False):
     return wer * 100, n_sub * 100, n_ins * 100, n_del * 100
 
 
+def compute_edit_distance(ref, hyp):
+    """Compute the number of word errors between long transcripts.
+
+    Only two rows of the DP matrix are kept and each row is computed by numpy,
+    so this can be used for whole recordings (e.g., talks of an hour).
+    The alignment is not traced back unlike compute_wer.
+
+    Args:
+        ref (list): words in the reference transcript
+        hyp (list): words in the predicted transcript
+    Returns:
+        n_errors (int): the number of substitution, insertion and deletion errors
+
+    """
+    word2idx = {}
+    ref = np.array([word2idx.setdefault(w, len(word2idx)) for w in ref], dtype=np.int64)
+    hyp = np.array([word2idx.setdefault(w, len(word2idx)) for w in hyp], dtype=np.int64)
+    offsets = np.arange(len(hyp) + 1, dtype=np.int64)
+    d = offsets.copy()
+    for i in range(len(ref)):
+        d_new = np.empty_like(d)
+        d_new[0] = i + 1
+        d_new[1:] = np.minimum(d[:-1] + (hyp != ref[i]), d[1:] + 1)  # substitution, deletion
+        # NOTE: insertion (d[i][j - 1] + 1) is a cumulative minimum after subtracting the offsets
+        d = np.minimum.accumulate(d_new - offsets) + offsets
+    return int(d[-1])
+
+
 def wer_align(ref, hyp, normalize=False, double_byte=False):
     """Compute Word Error Rate.
 
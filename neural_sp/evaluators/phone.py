@@ -20,7 +20,7 @@ logger = logging.getLogger("decoding").getChild('phone')
 
 
 def eval_phone(models, dataset, recog_params, epoch,
-               recog_dir=None, progressbar=False):
+               recog_dir=None, progressbar=False, counts=None):
     """Evaluate a phone-level model by PER.
 
     Args:
@@ -30,6 +30,7 @@ def eval_phone(models, dataset, recog_params, epoch,
         epoch (int):
         recog_dir (str):
         progressbar (bool): visualize the progressbar
+        counts (dict): if given, filled with the raw error counts before normalization
     Returns:
         per (float): Phone error rate
 
@@ -102,6 +103,9 @@ def eval_phone(models, dataset, recog_params, epoch,
     # Reset data counters
     dataset.reset()
 
+    if counts is not None:
+        counts['per'] = [per, n_sub, n_ins, n_del, n_phone]
+
     per /= n_phone
     n_sub /= n_phone
     n_ins /= n_phone
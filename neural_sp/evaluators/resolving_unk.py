@@ -48,19 +48,24 @@ def resolve_unk(hyp_word, best_hyps_char, aw_word, aw_char, idx2char,
             oov_info.append([offset, -1])
 
     # Point to characters
-    for i in range(len(oov_info)):
-        max_attn_overlap = 0
-        for t_char in range(len(aw_char)):
-            # print(np.sum(aw_word[oov_info[i][0]] * aw_char[t_char]))
-            if np.sum(aw_word[oov_info[i][0]] * aw_char[t_char]) > max_attn_overlap:
-                # Check if the correcsponding character is space
-                max_char = idx2char(best_hyps_char[t_char: t_char + 1])
-                if max_char == ' ':
-                    continue
-
-                max_attn_overlap = np.sum(
-                    aw_word[oov_info[i][0]] * aw_char[t_char])
-                oov_info[i][1] = t_char
+    if len(oov_info) > 0 and len(aw_char) > 0:
+        # NOTE: padded frames in mini-batch decoding have no attention weights
+        max_time = min(aw_word.shape[1], aw_char.shape[1])
+        aw_oov = aw_word[[offset for offset, _ in oov_info], :max_time]
+        aw_char = aw_char[:, :max_time]
+
+        # Attention overlaps between all pairs of <unk> and characters
+        attn_overlap = np.dot(aw_oov.reshape(len(oov_info), -1),
+                              aw_char.reshape(len(aw_char), -1).T)  # `[n_oovs, L_char]`
+
+        # Exclude space characters
+        is_space = np.array([idx2char(best_hyps_char[t_char: t_char + 1]) == ' '
+                             for t_char in range(len(aw_char))])
+        attn_overlap[:, is_space] = 0
+
+        t_chars = np.where(attn_overlap.max(1) > 0, attn_overlap.argmax(1), -1)
+        for i in range(len(oov_info)):
+            oov_info[i][1] = int(t_chars[i])
 
     hyp_no_unk = ''
     n_oovs = 0
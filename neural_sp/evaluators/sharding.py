@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Evaluate the model with multiple CPU worker processes."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import numpy as np
+import os
+import shutil
+from six.moves.queue import Empty
+import torch
+import torch.multiprocessing as mp
+import traceback
+
+from neural_sp.evaluators.phone import eval_phone
+from neural_sp.evaluators.word import eval_word
+from neural_sp.utils import mkdir_join
+
+logger = logging.getLogger("decoding").getChild('sharding')
+
+
+def eval_sharded(eval_fn, models, dataset, recog_params, epoch,
+                 recog_dir, n_jobs, n_threads=1, **kwargs):
+    """Evaluate the model by splitting the evaluation set into shards.
+
+    The evaluation set is split into contiguous shards, each of which is
+    decoded by `eval_fn` in a forked worker process on CPU. Hypotheses are
+    merged back in the original utterance order and the error rates are
+    computed from the summed raw counts, so that the results are the same as
+    those of the single-process evaluation.
+    NOTE: decoder/LM state carry-over is reset at the shard boundaries.
+
+    Args:
+        eval_fn (function): eval_word or eval_wordpiece or eval_char or eval_phone
+        models (list): models to evaluate (on CPU)
+        dataset: An instance of a `Dataset' class
+        recog_params (dict):
+        epoch (int):
+        recog_dir (str):
+        n_jobs (int): number of worker processes
+        n_threads (int): number of intra-op threads per worker
+        kwargs: other arguments passed to eval_fn (e.g., task_idx)
+    Returns:
+        same as eval_fn
+
+    """
+    # Split at the mini-batch boundaries to keep the decoding order
+    batch_size = recog_params['recog_batch_size']
+    df_indices = list(dataset.df.index)
+    batches = [df_indices[i:i + batch_size] for i in range(0, len(df_indices), batch_size)]
+    n_jobs = min(n_jobs, len(batches))
+    shards = [[idx for j in group for idx in batches[j]]
+              for group in np.array_split(np.arange(len(batches)), n_jobs)]
+
+    ctx = mp.get_context('fork')
+    queue = ctx.Queue()
+    processes = []
+    for rank, shard in enumerate(shards):
+        p = ctx.Process(target=_worker,
+                        args=(rank, queue, eval_fn, models, dataset, shard,
+                              recog_params, epoch, _shard_dir(recog_dir, rank),
+                              n_threads, kwargs))
+        p.start()
+        processes.append(p)
+
+    results = {}
+    while len(results) < n_jobs:
+        try:
+            rank, counts, error = queue.get(timeout=1)
+        except Empty:
+            # Workers killed without a Python exception (e.g., OOM killer, segfault) never report
+            for rank, p in enumerate(processes):
+                if rank not in results and p.exitcode is not None and p.exitcode != 0:
+                    _terminate(processes)
+                    raise RuntimeError('Worker %d died with exit code %d' % (rank, p.exitcode))
+            continue
+        if error is not None:
+            _terminate(processes)
+            raise RuntimeError('Worker %d failed:\n%s' % (rank, error))
+        results[rank] = counts
+    for p in processes:
+        p.join()
+
+    # Merge trn files in the original order
+    for trn in ['ref.trn', 'hyp.trn']:
+        with open(mkdir_join(recog_dir, trn), 'w') as f:
+            for rank in range(n_jobs):
+                with open(os.path.join(_shard_dir(recog_dir, rank), trn)) as f_shard:
+                    shutil.copyfileobj(f_shard, f)
+    for rank in range(n_jobs):
+        shutil.rmtree(_shard_dir(recog_dir, rank))
+
+    # Sum raw counts over shards
+    counts = {}
+    for rank in range(n_jobs):
+        for k, v in results[rank].items():
+            if isinstance(v, list):
+                counts[k] = [sum(x) for x in zip(counts[k], v)] if k in counts else v
+            else:
+                counts[k] = counts.get(k, 0) + v
+
+    logger.info('Merged %d shards' % n_jobs)
+    if eval_fn is eval_phone:
+        per = _report(counts['per'], 'PER', dataset.set)
+        return per
+
+    wer = _report(counts['wer'], 'WER', dataset.set)
+    cer = _report(counts['cer'], 'CER', dataset.set)
+    if eval_fn is eval_word:
+        logger.info('OOV (total): %d' % (counts['n_oov']))
+        return wer, cer, counts['n_oov']
+    return wer, cer
+
+
+def _worker(rank, queue, eval_fn, models, dataset, shard,
+            recog_params, epoch, recog_dir, n_threads, kwargs):
+    try:
+        torch.set_num_threads(n_threads)
+        dataset.df = dataset.df.loc[shard]
+        counts = {}
+        eval_fn(models, dataset, recog_params, epoch,
+                recog_dir=recog_dir, progressbar=False, counts=counts, **kwargs)
+        queue.put((rank, counts, None))
+    except Exception:
+        queue.put((rank, None, traceback.format_exc()))
+
+
+def _terminate(processes):
+    for p in processes:
+        if p.is_alive():
+            p.terminate()
+        p.join()
+
+
+def _shard_dir(recog_dir, rank):
+    return os.path.join(recog_dir, 'shard' + str(rank))
+
+
+def _report(counts, metric, set_name):
+    err, n_sub, n_ins, n_del, n_ref = counts
+    if n_ref > 0:
+        err /= n_ref
+        n_sub /= n_ref
+        n_ins /= n_ref
+        n_del /= n_ref
+    else:
+        err = n_sub = n_ins = n_del = 0
+    logger.info('%s (%s): %.2f %%' % (metric, set_name, err))
+    logger.info('SUB: %.2f / INS: %.2f / DEL: %.2f' % (n_sub, n_ins, n_del))
+    return err
@@ -23,7 +23,7 @@ logger = logging.getLogger("decoding").getChild('word')
 
 
 def eval_word(models, dataset, recog_params, epoch,
-              recog_dir=None, progressbar=False):
+              recog_dir=None, progressbar=False, counts=None):
     """Evaluate the word-level model by WER.
 
     Args:
@@ -33,6 +33,7 @@ def eval_word(models, dataset, recog_params, epoch,
         epoch (int):
         recog_dir (str):
         progressbar (bool): visualize the progressbar
+        counts (dict): if given, filled with the raw error counts before normalization
     Returns:
         wer (float): Word error rate
         cer (float): Character error rate
@@ -63,40 +64,63 @@ def eval_word(models, dataset, recog_params, epoch,
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO(hirofumi): fix this
 
+    # Greedy decoding of the character-level sub task for resolving UNK
+    recog_params_char = copy.deepcopy(recog_params)
+    recog_params_char['recog_lm_weight'] = 0
+    recog_params_char['recog_beam_width'] = 1
+    recog_params_char['recog_fwd_bwd_attention'] = False
+    # NOTE: encoder outputs cannot be shared when the backward decoder takes flipped inputs
+    share_enc_outs = not (models[0].mtl_per_batch and (
+        recog_params['recog_bwd_attention'] or recog_params['recog_fwd_bwd_attention']))
+
     with open(hyp_trn_save_path, 'w') as f_hyp, open(ref_trn_save_path, 'w') as f_ref:
         while True:
             batch, is_new_epoch = dataset.next(recog_params['recog_batch_size'])
+            enc_outs = None
+            if recog_params['recog_resolving_unk']:
+                # Encode once for both the word and character tasks
+                enc_outs = models[0].encode_for_decoding(batch['xs'], task='all')
             best_hyps_id, aws, _ = models[0].decode(
                 batch['xs'], recog_params, dataset.idx2token[0],
                 exclude_eos=True,
                 refs_id=batch['ys'],
                 utt_ids=batch['utt_ids'],
                 speakers=batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'],
-                ensemble_models=models[1:] if len(models) > 1 else [])
+                ensemble_models=models[1:] if len(models) > 1 else [],
+                enc_outs=enc_outs if share_enc_outs else None)
+            hyps = [dataset.idx2token[0](best_hyps_id[b]) for b in range(len(batch['xs']))]
+
+            # Resolving UNK
+            # NOTE: all utterances including UNK in the mini-batch are decoded together
+            unk_ids = []
+            if recog_params['recog_resolving_unk']:
+                unk_ids = [b for b in range(len(hyps)) if '<unk>' in hyps[b]]
+            if len(unk_ids) > 0:
+                xlens_char = [enc_outs['ys_sub1']['xlens'][b] for b in unk_ids]
+                enc_outs_char = {'ys_sub1': {'xs': enc_outs['ys_sub1']['xs'][unk_ids, :max(xlens_char)],
+                                             'xlens': xlens_char}}
+                best_hyps_id_char, aws_char, _ = models[0].decode(
+                    [batch['xs'][b] for b in unk_ids], recog_params_char,
+                    dataset.idx2token[1],
+                    exclude_eos=True,
+                    refs_id=[batch['ys_sub1'][b] for b in unk_ids],
+                    utt_ids=[batch['utt_ids'][b] for b in unk_ids],
+                    speakers=[(batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'])[b]
+                              for b in unk_ids],
+                    task='ys_sub1',
+                    enc_outs=enc_outs_char)
+                # TODO(hirofumi): support ys_sub2 and ys_sub3
 
             for b in range(len(batch['xs'])):
                 ref = batch['text'][b]
-                hyp = dataset.idx2token[0](best_hyps_id[b])
+                hyp = hyps[b]
 
                 n_oov_total += hyp.count('<unk>')
 
-                # Resolving UNK
-                if recog_params['recog_resolving_unk'] and '<unk>' in hyp:
-                    recog_params_char = copy.deepcopy(recog_params)
-                    recog_params_char['recog_lm_weight'] = 0
-                    recog_params_char['recog_beam_width'] = 1
-                    best_hyps_id_char, aw_char, _, _ = models[0].decode(
-                        batch['xs'][b:b + 1], recog_params_char,
-                        dataset.idx2token[1],
-                        exclude_eos=True,
-                        refs_id=batch['ys_sub1'],
-                        utt_ids=batch['utt_ids'],
-                        speakers=batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'],
-                        task='ys_sub1')
-                    # TODO(hirofumi): support ys_sub2 and ys_sub3
-
+                if b in unk_ids:
+                    i_unk = unk_ids.index(b)
                     hyp = resolve_unk(
-                        hyp, best_hyps_id_char[0], aws[b], aw_char[0], dataset.idx2token[1],
+                        hyp, best_hyps_id_char[i_unk], aws[b], aws_char[i_unk], dataset.idx2token[1],
                         subsample_factor_word=np.prod(models[0].subsample),
                         subsample_factor_char=np.prod(models[0].subsample[:models[0].enc_n_layers_sub1 - 1]))
                     logger.info('Hyp (after OOV resolution): %s' % hyp)
@@ -149,6 +173,11 @@ def eval_word(models, dataset, recog_params, epoch,
     # Reset data counters
     dataset.reset()
 
+    if counts is not None:
+        counts['wer'] = [wer, n_sub_w, n_ins_w, n_del_w, n_word]
+        counts['cer'] = [cer, n_sub_c, n_ins_c, n_del_c, n_char]
+        counts['n_oov'] = n_oov_total
+
     wer /= n_word
     n_sub_w /= n_word
     n_ins_w /= n_word
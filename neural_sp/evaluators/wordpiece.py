@@ -20,7 +20,7 @@ logger = logging.getLogger("decoding").getChild('wordpiece')
 
 
 def eval_wordpiece(models, dataset, recog_params, epoch,
-                   recog_dir=None, progressbar=False):
+                   recog_dir=None, progressbar=False, counts=None):
     """Evaluate the wordpiece-level model by WER.
 
     Args:
@@ -30,6 +30,7 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
         epoch (int):
         recog_dir (str):
         progressbar (bool): visualize the progressbar
+        counts (dict): if given, filled with the raw error counts before normalization
     Returns:
         wer (float): Word error rate
         cer (float): Character error rate
@@ -118,6 +119,10 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
     # Reset data counters
     dataset.reset()
 
+    if counts is not None:
+        counts['wer'] = [wer, n_sub_w, n_ins_w, n_del_w, n_word]
+        counts['cer'] = [cer, n_sub_c, n_ins_c, n_del_c, n_char]
+
     wer /= n_word
     n_sub_w /= n_word
     n_ins_w /= n_word
@@ -50,6 +50,28 @@ def cross_entropy_lsm(logits, ys, ylens, lsm_prob, size_average=False):
     return loss
 
 
+def ctc_loss(logits, ys, elens, ylens, blank=0):
+    """Compute CTC loss on the device of logits by the PyTorch implementation.
+
+    The loss is normalized by the batch size as warpctc_pytorch.CTCLoss(size_average=True).
+    Infinite losses of infeasible alignments are replaced with zeros.
+
+    Args:
+        logits (FloatTensor): `[B, T, vocab]`
+        ys (IntTensor): Indices of labels concatenated over the batch. `[sum(ylens)]`
+        elens (IntTensor): `[B]`
+        ylens (IntTensor): `[B]`
+        blank (int): index for blank
+    Returns:
+        loss (FloatTensor): `[1]`
+
+    """
+    log_probs = F.log_softmax(logits.float(), dim=-1).transpose(0, 1)  # time-major
+    loss = F.ctc_loss(log_probs, ys.to(logits.device).long(), elens.long(), ylens.long(),
+                      blank=blank, reduction='sum', zero_infinity=True)
+    return loss.unsqueeze(0) / logits.size(0)
+
+
 def kldiv_lsm_ctc(logits, ylens, size_average=False):
     """Compute KL divergence loss for label smoothing of CTC models.
 
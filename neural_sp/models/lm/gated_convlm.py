@@ -20,6 +20,7 @@ import torch.nn.functional as F
 from neural_sp.models.base import ModelBase
 from neural_sp.models.modules.embedding import Embedding
 from neural_sp.models.modules.linear import LinearND
+from neural_sp.models.modules.sampled_softmax import SampledSoftmaxLoss
 from neural_sp.models.modules.glu import GLUBlock
 from neural_sp.models.torch_utils import compute_accuracy
 from neural_sp.models.torch_utils import np2tensor
@@ -169,6 +170,16 @@ class GatedConvLM(ModelBase):
                     raise ValueError('When using the tied flag, n_units must be equal to emb_dim.')
                 self.output.fc.weight = self.embed.embed.weight
 
+        # Sampled output layer for training
+        self.sampled_loss = None
+        if getattr(args, 'output_loss', 'softmax') != 'softmax':
+            if args.adaptive_softmax:
+                raise ValueError('%s cannot be used with adaptive softmax.' % args.output_loss)
+            self.sampled_loss = SampledSoftmaxLoss(self.vocab, args.n_samples,
+                                                   loss_type=args.output_loss,
+                                                   proposal=args.sampling_proposal,
+                                                   pad=self.pad)
+
         # Initialize parameters
         self.reset_parameters(args.param_init)
 
@@ -223,6 +234,13 @@ class GatedConvLM(ModelBase):
         ys_out = ys[:, 1:]
 
         lmout, hidden = self.decode(self.encode(ys_in), hidden)
+        if self.sampled_loss is not None and self.training:
+            # NOTE: only the sampled loss is reported (perplexity and accuracy require the full output layer)
+            loss = self.sampled_loss(self.output, lmout, ys_out)
+            if reporter is not None:
+                reporter.add({'loss.lm_' + self.sampled_loss.loss_type: loss.detach()}, is_eval=False)
+            return loss, hidden, reporter
+
         if self.adaptive_softmax is None:
             logits = self.generate(lmout)
         else:
@@ -277,9 +295,9 @@ class GatedConvLM(ModelBase):
             acc = compute_accuracy(self.adaptive_softmax.log_prob(
                 logits.view((-1, logits.size(2)))), ys_out, pad=self.pad)
 
-        observation = {'loss.lm': loss.item(),
+        observation = {'loss.lm': loss.detach(),
                        'acc.lm': acc,
-                       'ppl.lm': np.exp(loss.item())}
+                       'ppl.lm': torch.exp(loss.detach())}
 
         # Report here
         if reporter is not None:
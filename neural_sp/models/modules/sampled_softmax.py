@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2019 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Sampled softmax and NCE losses for large-vocabulary output layers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def log_uniform_log_probs(vocab):
+    """Log probabilities of the log-uniform (Zipfian) distribution.
+
+    Token IDs are regarded as frequency ranks, which holds for word
+    dictionaries made by utils/text2dict.py.
+
+    Args:
+        vocab (int):
+    Returns:
+        log_probs (np.ndarray): `[vocab]`
+
+    """
+    ranks = np.arange(vocab, dtype=np.float64)
+    return np.log(np.log((ranks + 2) / (ranks + 1)) / np.log(vocab + 1))
+
+
+class SampledSoftmaxLoss(nn.Module):
+    """Sampled softmax or NCE loss computed with a subset of the output layer.
+
+    Negative tokens are sampled once per mini-batch from a proposal
+    distribution and shared by all positions.
+
+        [Reference]
+            "On Using Very Large Target Vocabulary for Neural Machine Translation" (Jean et al. 2015)
+            https://arxiv.org/abs/1412.2007
+            "A fast and simple algorithm for training neural probabilistic language models" (Mnih & Teh 2012)
+            https://arxiv.org/abs/1206.6426
+
+    Only used in training. Scores of NCE-trained models are self-normalized
+    approximately, and the exact softmax is used for evaluation.
+    The proposal distribution is a buffer, so that it is moved with the model
+    and copied to each replica in multi-GPU training.
+
+    Args:
+        vocab (int): number of tokens
+        n_samples (int): number of negative samples per mini-batch
+        loss_type (str): sampled_softmax or nce
+        proposal (str): log_uniform or unigram (set by `set_unigram`)
+        pad (int): index for padding
+
+    """
+
+    def __init__(self, vocab, n_samples, loss_type='sampled_softmax',
+                 proposal='log_uniform', pad=3):
+        super(SampledSoftmaxLoss, self).__init__()
+
+        if loss_type not in ['sampled_softmax', 'nce']:
+            raise ValueError(loss_type)
+        if proposal not in ['log_uniform', 'unigram']:
+            raise ValueError(proposal)
+
+        self.vocab = vocab
+        self.n_samples = n_samples
+        self.loss_type = loss_type
+        self.proposal = proposal
+        self.pad = pad
+        self.register_buffer('log_q', self._normalize(log_uniform_log_probs(vocab)))
+
+    def _normalize(self, log_probs):
+        log_probs = log_probs.copy()
+        log_probs[self.pad] = -np.inf
+        log_probs -= np.logaddexp.reduce(log_probs)
+        return torch.from_numpy(log_probs).float()
+
+    def set_unigram(self, counts, power=1.0):
+        """Use the unigram distribution as the proposal.
+
+        Args:
+            counts (np.ndarray): frequency of each token in the training set. `[vocab]`
+            power (float): exponent to flatten the distribution
+
+        """
+        assert self.proposal == 'unigram'
+        # NOTE: add-one smoothing to sample unseen tokens
+        self.log_q.copy_(self._normalize(power * np.log(np.asarray(counts, dtype=np.float64) + 1)))
+
+    def forward(self, linear, xs, ys):
+        """Compute the loss.
+
+        Args:
+            linear (LinearND): output layer over the whole vocabulary
+            xs (FloatTensor): `[B, L, in_size]`
+            ys (LongTensor): `[B, L]`
+        Returns:
+            loss (FloatTensor): `[1]` (averaged over non-padding tokens)
+
+        """
+        xs = xs.contiguous().view(-1, xs.size(-1))
+        ys = ys.contiguous().view(-1)
+        mask = ys != self.pad
+        xs, ys = xs[mask], ys[mask]
+
+        samples = torch.multinomial(self.log_q.exp(), self.n_samples, replacement=True)
+        # NOTE: log of the expected count of each token in the samples
+        log_n = math.log(self.n_samples)
+
+        weight, bias = linear.fc.weight, linear.fc.bias
+        logits_true = (xs * weight[ys]).sum(-1)
+        logits_sampled = torch.matmul(xs, weight[samples].t())
+        if bias is not None:
+            logits_true = logits_true + bias[ys]
+            logits_sampled = logits_sampled + bias[samples]
+        logits_true = logits_true - (self.log_q[ys] + log_n)
+        logits_sampled = logits_sampled - (self.log_q[samples] + log_n)
+
+        if self.loss_type == 'sampled_softmax':
+            # Remove accidental hits
+            hits = samples.unsqueeze(0) == ys.unsqueeze(1)
+            logits_sampled = logits_sampled.masked_fill(hits, float('-inf'))
+            logits = torch.cat([logits_true.unsqueeze(1), logits_sampled], dim=1)
+            loss = F.cross_entropy(logits, ys.new_zeros(ys.size(0)))
+        else:
+            loss = -(F.logsigmoid(logits_true) + F.logsigmoid(-logits_sampled).sum(1)).mean()
+        return loss
@@ -11,6 +11,7 @@ from __future__ import division
 from __future__ import print_function
 
 import logging
+import numpy as np
 
 logger = logging.getLogger("decoding")
 
@@ -71,40 +72,76 @@ def fwd_bwd_attention(nbest_hyps_fwd, aws_fwd, scores_fwd,
                 # <eos> only
                 logger.info(nbest_hyps_bwd[b][n])
 
+        # Attention peaks of each hypothesis (the first head)
+        peaks_fwd = [aws_fwd[b][n].argmax(-2)[:, 0] for n in range(nbest)]
+        peaks_bwd = [aws_bwd[b][n].argmax(-2)[:, 0] for n in range(nbest)]
+
+        n_matches = 0
         for n_f in range(nbest):
             for n_b in range(nbest):
-                for i_f in range(len(aws_fwd[b][n_f]) - 1):
-                    for i_b in range(len(aws_bwd[b][n_b]) - 1):
-                        if flip:
-                            t_prev = max_time - aws_bwd[b][n_b][i_b + 1].argmax(-2)
-                            t_curr = aws_fwd[b][n_f][i_f].argmax(-2)
-                            t_next = max_time - aws_bwd[b][n_b][i_b - 1].argmax(-2)
-                        else:
-                            t_prev = aws_bwd[b][n_b][i_b + 1].argmax(-2)
-                            t_curr = aws_fwd[b][n_f][i_f].argmax(-2)
-                            t_next = aws_bwd[b][n_b][i_b - 1].argmax(-2)
-
-                        # the same token at the same time
-                        if t_curr >= t_prev and t_curr <= t_next and nbest_hyps_fwd[b][n_f][i_f] == nbest_hyps_bwd[b][n_b][i_b]:
-                            new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
-                                nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
-                            score_curr_fwd = scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1]
-                            score_curr_bwd = scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1]
-                            score_curr = max(score_curr_fwd, score_curr_bwd)
-                            new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
-                            merged.append({'hyp': new_hyp, 'score': new_score})
-
-                            logger.info('time matching')
-                            if refs_id is not None:
-                                logger.info('Ref: %s' % idx2token(refs_id[b]))
-                            logger.info('hyp (fwd): %s' % idx2token(nbest_hyps_fwd[b][n_f]))
-                            logger.info('hyp (bwd): %s' % idx2token(nbest_hyps_bwd[b][n_b]))
-                            logger.info('hyp (fwd-bwd): %s' % idx2token(new_hyp))
-                            logger.info('log prob (fwd): %.3f' % scores_fwd[b][n_f][-1])
-                            logger.info('log prob (bwd): %.3f' % scores_bwd[b][n_b][0])
-                            logger.info('log prob (fwd-bwd): %.3f' % new_score)
+                i_f_list, i_b_list = time_consistent_matches(
+                    nbest_hyps_fwd[b][n_f], peaks_fwd[n_f],
+                    nbest_hyps_bwd[b][n_b], peaks_bwd[n_b],
+                    flip, max_time)
+                n_matches += len(i_f_list)
+                for i_f, i_b in zip(i_f_list, i_b_list):
+                    new_hyp = nbest_hyps_fwd[b][n_f][:i_f + 1].tolist() + \
+                        nbest_hyps_bwd[b][n_b][i_b + 1:].tolist()
+                    score_curr_fwd = scores_fwd[b][n_f][i_f] - scores_fwd[b][n_f][i_f - 1]
+                    score_curr_bwd = scores_bwd[b][n_b][i_b] - scores_bwd[b][n_b][i_b + 1]
+                    score_curr = max(score_curr_fwd, score_curr_bwd)
+                    new_score = scores_fwd[b][n_f][i_f - 1] + scores_bwd[b][n_b][i_b + 1] + score_curr
+                    merged.append({'hyp': new_hyp, 'score': new_score})
 
         merged = sorted(merged, key=lambda x: x['score'], reverse=True)
         best_hyps.append(merged[0]['hyp'])
 
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('time matching: %d' % n_matches)
+            if refs_id is not None:
+                logger.info('Ref: %s' % idx2token(refs_id[b]))
+            logger.info('hyp (fwd): %s' % idx2token(nbest_hyps_fwd[b][0]))
+            logger.info('hyp (bwd): %s' % idx2token(nbest_hyps_bwd[b][0]))
+            logger.info('hyp (fwd-bwd): %s' % idx2token(merged[0]['hyp']))
+            logger.info('log prob (fwd): %.3f' % scores_fwd[b][0][-1])
+            logger.info('log prob (bwd): %.3f' % scores_bwd[b][0][0])
+            logger.info('log prob (fwd-bwd): %.3f' % merged[0]['score'])
+
     return best_hyps
+
+
+def time_consistent_matches(hyp_fwd, peaks_fwd, hyp_bwd, peaks_bwd, flip, max_time):
+    """Find the same tokens emitted at consistent time by the forward and backward decoders.
+
+    A token at the i_f-th position in the forward hypothesis matches the token at
+    the i_b-th position in the backward hypothesis if they are the same and the
+    forward attention peak lies between the backward attention peaks of the
+    neighboring tokens. All pairs are compared at once by broadcasting.
+
+    Args:
+        hyp_fwd (np.ndarray): `[L_fwd]`
+        peaks_fwd (np.ndarray): `[L_fwd]`, attention peaks of the forward hypothesis
+        hyp_bwd (np.ndarray): `[L_bwd]`
+        peaks_bwd (np.ndarray): `[L_bwd]`, attention peaks of the backward hypothesis
+        flip (bool): backward attention weights are computed on flipped inputs
+        max_time (int):
+    Returns:
+        i_f (np.ndarray): positions in the forward hypothesis
+        i_b (np.ndarray): positions in the backward hypothesis
+
+    """
+    n_f = len(peaks_fwd) - 1
+    n_b = len(peaks_bwd) - 1
+    if n_f <= 0 or n_b <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    t_curr = peaks_fwd[:n_f]
+    t_prev = peaks_bwd[1:n_b + 1]
+    t_next = np.roll(peaks_bwd, 1)[:n_b]  # NOTE: i_b - 1 wraps around for i_b == 0
+    if flip:
+        t_prev = max_time - t_prev
+        t_next = max_time - t_next
+
+    match = (t_curr[:, None] >= t_prev[None, :]) & (t_curr[:, None] <= t_next[None, :])
+    match &= np.asarray(hyp_fwd[:n_f])[:, None] == np.asarray(hyp_bwd[:n_b])[None, :]
+    return np.nonzero(match)
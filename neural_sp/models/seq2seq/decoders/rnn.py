@@ -20,6 +20,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.criterion import ctc_loss
 from neural_sp.models.criterion import focal_loss
 from neural_sp.models.criterion import kldiv_lsm_ctc
 from neural_sp.models.modules.embedding import Embedding
@@ -29,13 +30,23 @@ from neural_sp.models.seq2seq.decoders.ctc_beam_search import BeamSearchDecoder
 from neural_sp.models.seq2seq.decoders.ctc_beam_search import CTCPrefixScore
 from neural_sp.models.seq2seq.decoders.ctc_greedy import GreedyDecoder
 from neural_sp.models.seq2seq.decoders.multihead_attention import MultiheadAttentionMechanism
+from neural_sp.models.seq2seq.decoders.rnn_step import ATTN_TYPES
+from neural_sp.models.seq2seq.decoders.rnn_step import get_decoder_step
+from neural_sp.models.seq2seq.decoders.shortlist import Shortlist
+from neural_sp.models.seq2seq.decoders.shortlist import shortlist_candidates
 from neural_sp.models.torch_utils import compute_accuracy
+from neural_sp.models.torch_utils import is_quantized
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
 from neural_sp.models.torch_utils import tensor2np
 
 random.seed(1)
 
+# attributes carried over to the next utterance of the same session
+SESSION_STATE_KEYS = ['prev_spk', 'dstates_final', 'lmstate_final', 'total_step',
+                      'fifo_cache_ids', 'fifo_cache_sp_key', 'fifo_cache_lm_key',
+                      'dict_cache_sp', 'dict_cache_lm']
+
 
 class RNNDecoder(nn.Module):
     """RNN decoder.
@@ -71,6 +82,7 @@ class RNNDecoder(nn.Module):
         ss_type (str): constant or saturation
         ctc_weight (float):
         ctc_fc_list (list):
+        ctc_loss_type (str): warpctc or pytorch
         input_feeding (bool):
         backward (bool): decode in the backward order
         lm (RNNLM or GatedConvLM):
@@ -83,6 +95,7 @@ class RNNDecoder(nn.Module):
         mtl_per_batch (bool):
         adaptive_softmax (bool):
         param_init (float):
+        jit_step (bool): run the decoder step compiled by TorchScript if possible
 
     """
 
@@ -119,6 +132,7 @@ class RNNDecoder(nn.Module):
                  fl_gamma=2.0,
                  ctc_weight=0.0,
                  ctc_fc_list=[],
+                 ctc_loss_type='warpctc',
                  input_feeding=False,
                  backward=False,
                  lm=None,
@@ -130,7 +144,8 @@ class RNNDecoder(nn.Module):
                  global_weight=1.0,
                  mtl_per_batch=False,
                  adaptive_softmax=False,
-                 param_init=0.1):
+                 param_init=0.1,
+                 jit_step=False):
 
         super(RNNDecoder, self).__init__()
 
@@ -160,6 +175,8 @@ class RNNDecoder(nn.Module):
         self.fl_gamma = fl_gamma
         self.ctc_weight = ctc_weight
         self.ctc_fc_list = ctc_fc_list
+        self.ctc_loss_type = ctc_loss_type
+        assert ctc_loss_type in ['warpctc', 'pytorch']
         self.input_feeding = input_feeding
         if input_feeding:
             assert loop_type == 'normal'
@@ -177,6 +194,7 @@ class RNNDecoder(nn.Module):
         self.share_lm_softmax = share_lm_softmax
         self.global_weight = global_weight
         self.mtl_per_batch = mtl_per_batch
+        self.jit_step = jit_step
 
         # for cache
         self.fifo_cache_ids = []
@@ -204,8 +222,9 @@ class RNNDecoder(nn.Module):
                 self.output_ctc = LinearND(enc_n_units, vocab)
             self.decode_ctc_greedy = GreedyDecoder(blank=blank)
             self.decode_ctc_beam = BeamSearchDecoder(blank=blank)
-            import warpctc_pytorch
-            self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
+            if ctc_loss_type == 'warpctc':
+                import warpctc_pytorch
+                self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
 
         if ctc_weight < global_weight:
             # Attention layer
@@ -370,7 +389,8 @@ class RNNDecoder(nn.Module):
         Args:
             eouts (FloatTensor): `[B, T, dec_n_units]`
             elens (list): A list of length `[B]`
-            ys (list): A list of length `[B]`, which contains a list of size `[L]`
+            ys (list or tuple): A list of length `[B]`, which contains a list of size `[L]`,
+                or a tuple of padded labels and their lengths (see append_sos_eos)
             task (str): all or ys or ys_sub*
             ys_hist (list):
         Returns:
@@ -391,7 +411,7 @@ class RNNDecoder(nn.Module):
         # CTC loss
         if self.ctc_weight > 0 and (task == 'all' or 'ctc' in task):
             loss_ctc = self.forward_ctc(eouts, elens, ys)
-            observation['loss_ctc'] = loss_ctc.item()
+            observation['loss_ctc'] = loss_ctc.detach()
             if self.mtl_per_batch:
                 loss += loss_ctc
             else:
@@ -400,7 +420,7 @@ class RNNDecoder(nn.Module):
         # LM objective for the decoder
         if self.lmobj_weight > 0 and (task == 'all' or 'lmobj' in task):
             loss_lmobj, acc_lmobj, ppl_lmobj = self.forward_lmobj(ys)
-            observation['loss_lmobj'] = loss_lmobj.item()
+            observation['loss_lmobj'] = loss_lmobj.detach()
             observation['acc_lmobj'] = acc_lmobj
             observation['ppl_lmobj'] = ppl_lmobj
             if self.mtl_per_batch:
@@ -411,7 +431,7 @@ class RNNDecoder(nn.Module):
         # XE loss
         if self.global_weight - self.ctc_weight > 0 and (task == 'all' or ('ctc' not in task and 'lmobj' not in task and 'lm' not in task)):
             loss_att, acc_att, ppl_att = self.forward_att(eouts, elens, ys, ys_hist)
-            observation['loss_att'] = loss_att.item()
+            observation['loss_att'] = loss_att.detach()
             observation['acc_att'] = acc_att
             observation['ppl_att'] = ppl_att
             if self.mtl_per_batch:
@@ -419,7 +439,7 @@ class RNNDecoder(nn.Module):
             else:
                 loss += loss_att * (self.global_weight - self.ctc_weight)
 
-        observation['loss'] = loss.item()
+        observation['loss'] = loss.detach()
         return loss, observation
 
     def forward_ctc(self, eouts, elens, ys):
@@ -437,20 +457,29 @@ class RNNDecoder(nn.Module):
 
         # Compute the auxiliary CTC loss
         elensmbl_ctc = np2tensor(np.fromiter(elens, dtype=np.int64), -1).int()
-        ys_ctc = [np2tensor(np.fromiter(y, dtype=np.int64)).long() for y in ys]  # always fwd
-        ylens = np2tensor(np.fromiter([y.size(0) for y in ys_ctc], dtype=np.int64), -1).int()
-        ys_ctc = torch.cat(ys_ctc, dim=0).int()
+        if isinstance(ys, tuple):
+            # padded by the data loader
+            ys_pad, ylens = ys
+            ys_ctc = ys_pad[torch.arange(ys_pad.size(1)).unsqueeze(0) < ylens.unsqueeze(1)].int()
+            ylens = ylens.int()
+        else:
+            ys_ctc = [np2tensor(np.fromiter(y, dtype=np.int64)).long() for y in ys]  # always fwd
+            ylens = np2tensor(np.fromiter([y.size(0) for y in ys_ctc], dtype=np.int64), -1).int()
+            ys_ctc = torch.cat(ys_ctc, dim=0).int()
         # NOTE: Concatenate all elements in ys for warpctc_pytorch
         # NOTE: do not copy to GPUs here
 
         # Compute CTC loss
-        loss = self.warpctc_loss(logits.transpose(1, 0).cpu(),  # time-major
-                                 ys_ctc, elensmbl_ctc, ylens)
-        # NOTE: ctc loss has already been normalized by bs
-        # NOTE: index 0 is reserved for blank in warpctc_pytorch
+        if self.ctc_loss_type == 'pytorch':
+            loss = ctc_loss(logits, ys_ctc, elensmbl_ctc, ylens, blank=self.blank)
+        else:
+            loss = self.warpctc_loss(logits.transpose(1, 0).cpu(),  # time-major
+                                     ys_ctc, elensmbl_ctc, ylens)
+            # NOTE: ctc loss has already been normalized by bs
+            # NOTE: index 0 is reserved for blank in warpctc_pytorch
 
-        if self.device_id >= 0:
-            loss = loss.cuda(self.device_id)
+            if self.device_id >= 0:
+                loss = loss.cuda(self.device_id)
 
         # Label smoothing for CTC
         if self.lsm_prob > 0:
@@ -460,6 +489,43 @@ class RNNDecoder(nn.Module):
 
         return loss
 
+    def append_sos_eos(self, ys):
+        """Append <sos> and <eos> and pad label sequences on the device.
+
+        Args:
+            ys (list or tuple): A list of length `[B]`, which contains a list of size `[L]`,
+                or a tuple of a LongTensor of size `[B, L]` padded by the data loader
+                and a LongTensor of lengths of size `[B]`
+        Returns:
+            ys_in_pad (LongTensor): `[B, L + 1]`
+            ys_out_pad (LongTensor): `[B, L + 1]`
+            ylens_out (list): A list of length `[B]`
+
+        """
+        if isinstance(ys, tuple):
+            ys_pad, ylens = ys
+            if self.device_id >= 0:
+                ys_pad = ys_pad.cuda(self.device_id, non_blocking=True)
+                ylens_dev = ylens.cuda(self.device_id, non_blocking=True)
+            else:
+                ylens_dev = ylens
+            bs, max_len = ys_pad.size()
+            if self.bwd:
+                # Reverse each sequence within its length
+                indices = ylens_dev.unsqueeze(1) - 1 - torch.arange(max_len, device=ys_pad.device).unsqueeze(0)
+                ys_pad = ys_pad.gather(1, indices.clamp(min=0)).masked_fill(indices < 0, self.pad)
+            ys_in_pad = torch.cat([ys_pad.new_full((bs, 1), self.eos), ys_pad], dim=1)
+            ys_out_pad = torch.cat([ys_pad, ys_pad.new_full((bs, 1), self.pad)], dim=1)
+            ys_out_pad.scatter_(1, ylens_dev.unsqueeze(1), self.eos)
+            return ys_in_pad, ys_out_pad, (ylens + 1).tolist()
+
+        eos = next(self.parameters()).new_zeros((1,)).fill_(self.eos).long()
+        ys = [np2tensor(np.fromiter(y[::-1] if self.bwd else y, dtype=np.int64),
+                        self.device_id).long() for y in ys]
+        ys_in = [torch.cat([eos, y], dim=0) for y in ys]
+        ys_out = [torch.cat([y, eos], dim=0) for y in ys]
+        return pad_list(ys_in, self.pad), pad_list(ys_out, self.pad), [y.size(0) for y in ys_out]
+
     def forward_lmobj(self, ys):
         """Compute XE loss for LM objective.
 
@@ -467,21 +533,15 @@ class RNNDecoder(nn.Module):
             ys (list): A list of length `[B]`, which contains a list of size `[L]`
         Returns:
             loss (FloatTensor): `[1]`
-            acc (float):
-            ppl (float):
+            acc (FloatTensor):
+            ppl (FloatTensor):
 
         """
-        bs = len(ys)
         w = next(self.parameters())
 
         # Append <sos> and <eos>
-        eos = w.new_zeros((1,)).fill_(self.eos).long()
-        ys = [np2tensor(np.fromiter(y[::-1] if self.bwd else y, dtype=np.int64),
-                        self.device_id).long() for y in ys]
-        ys_in = [torch.cat([eos, y], dim=0) for y in ys]
-        ys_out = [torch.cat([y, eos], dim=0) for y in ys]
-        ys_in_pad = pad_list(ys_in, self.pad)
-        ys_out_pad = pad_list(ys_out, self.pad)
+        ys_in_pad, ys_out_pad, _ = self.append_sos_eos(ys)
+        bs = ys_in_pad.size(0)
 
         # Initialization
         dstates = self.init_dec_state(bs)
@@ -511,7 +571,7 @@ class RNNDecoder(nn.Module):
 
         # Compute token-level accuracy in teacher-forcing
         acc = compute_accuracy(logits, ys_out_pad, self.pad)
-        ppl = min(np.exp(loss.item()), np.inf)
+        ppl = torch.exp(loss.detach())
 
         return loss, acc, ppl
 
@@ -525,19 +585,14 @@ class RNNDecoder(nn.Module):
             ys_hist (list):
         Returns:
             loss (FloatTensor): `[B, L, vocab]`
-            acc (float):
-            ppl (float):
+            acc (FloatTensor):
+            ppl (FloatTensor):
 
         """
         bs = eouts.size(0)
 
         # Append <sos> and <eos>
-        eos = eouts.new_zeros(1).fill_(self.eos).long()
-        _ys = [np2tensor(np.fromiter(y[::-1] if self.bwd else y, dtype=np.int64), self.device_id).long() for y in ys]
-        ys_in = [torch.cat([eos, y], dim=0) for y in _ys]
-        ys_out = [torch.cat([y, eos], dim=0) for y in _ys]
-        ys_in_pad = pad_list(ys_in, self.pad)
-        ys_out_pad = pad_list(ys_out, self.pad)
+        ys_in_pad, ys_out_pad, ylens_out = self.append_sos_eos(ys)
 
         # Initialization
         if self.contextualize:
@@ -556,32 +611,36 @@ class RNNDecoder(nn.Module):
         if self.lm is not None:
             ys_lm_emb = self.lm.encode(ys_in_pad)
 
-        logits = []
-        for t in range(ys_in_pad.size(1)):
-            # Sample for scheduled sampling
-            is_sample = t > 0 and self._ss_prob > 0 and random.random() < self._ss_prob and self.adaptive_softmax is None
-            y_emb = self.embed(self.output(
-                logits[-1]).detach().argmax(-1)) if is_sample else ys_emb[:, t:t + 1]
-
-            # Recurrency
-            dec_in = attn_v if self.input_feeding else cv
-            dstates = self.recurrency(y_emb, dec_in, dstates['dstate'])
-
-            # Update LM states for LM fusion
-            lmout = None
-            if self.lm is not None:
-                y_lm_emb = self.lm.encode(self.output(
-                    logits[-1]).detach().argmax(-1)) if is_sample else ys_lm_emb[:, t:t + 1]
-                lmout, lmstate = self.lm.decode(y_lm_emb, lmstate)
-
-            # Score
-            cv, aw = self.score(eouts, elens, eouts, dstates['dout_score'], aw)
-
-            # Generate
-            attn_v, lm_feat = self.generate(cv, dstates['dout_gen'], lmout)
-            logits.append(attn_v)
-
-        logits = torch.cat(logits, dim=1)
+        step = self.compiled_step() if self._ss_prob == 0 else None
+        if step is not None:
+            logits = step(eouts, self.attn_mask(eouts, elens), ys_emb, self.step_weights(), self.training)
+        else:
+            logits = []
+            for t in range(ys_in_pad.size(1)):
+                # Sample for scheduled sampling
+                is_sample = t > 0 and self._ss_prob > 0 and random.random() < self._ss_prob and self.adaptive_softmax is None
+                y_emb = self.embed(self.output(
+                    logits[-1]).detach().argmax(-1)) if is_sample else ys_emb[:, t:t + 1]
+
+                # Recurrency
+                dec_in = attn_v if self.input_feeding else cv
+                dstates = self.recurrency(y_emb, dec_in, dstates['dstate'])
+
+                # Update LM states for LM fusion
+                lmout = None
+                if self.lm is not None:
+                    y_lm_emb = self.lm.encode(self.output(
+                        logits[-1]).detach().argmax(-1)) if is_sample else ys_lm_emb[:, t:t + 1]
+                    lmout, lmstate = self.lm.decode(y_lm_emb, lmstate)
+
+                # Score
+                cv, aw = self.score(eouts, elens, eouts, dstates['dout_score'], aw)
+
+                # Generate
+                attn_v, lm_feat = self.generate(cv, dstates['dout_gen'], lmout)
+                logits.append(attn_v)
+
+            logits = torch.cat(logits, dim=1)
         if self.adaptive_softmax is None:
             logits = self.output(logits)
 
@@ -590,7 +649,7 @@ class RNNDecoder(nn.Module):
             if self.lsm_prob > 0:
                 # Label smoothing
                 loss = cross_entropy_lsm(logits, ys_out_pad,
-                                         ylens=[y.size(0) for y in ys_out],
+                                         ylens=ylens_out,
                                          lsm_prob=self.lsm_prob, size_average=False) / bs
             else:
                 loss = F.cross_entropy(logits.view((-1, logits.size(2))), ys_out_pad.view(-1),
@@ -599,7 +658,7 @@ class RNNDecoder(nn.Module):
             # Focal loss
             if self.fl_weight > 0:
                 fl = focal_loss(logits, ys_out_pad,
-                                ylens=[y.size(0) for y in ys_out],
+                                ylens=ylens_out,
                                 gamma=self.fl_gamma, size_average=False) / bs
                 loss = loss * (1 - self.fl_weight) + fl * self.fl_weight
         else:
@@ -612,10 +671,74 @@ class RNNDecoder(nn.Module):
         else:
             acc = compute_accuracy(self.adaptive_softmax.log_prob(
                 logits.view((-1, logits.size(2)))), ys_out_pad, pad=self.pad)
-        ppl = np.exp(loss.item())
+        ppl = torch.exp(loss.detach())
 
         return loss, acc, ppl
 
+    def compiled_step(self):
+        """Decoder step compiled by TorchScript.
+
+        Returns:
+            step (RNNDecoderStep): None if jit_step is False or the configuration is not supported
+
+        """
+        if not self.jit_step or self.loop_type != 'normal' or self.lm is not None or self.contextualize:
+            return None
+        if self.adaptive_softmax is not None or not isinstance(self.score, AttentionMechanism):
+            return None
+        if self.score.attn_type not in ATTN_TYPES:
+            return None
+        if is_quantized(self):
+            # NOTE: the compiled step takes float parameters
+            return None
+        step = get_decoder_step(
+            rnn_type=self.rnn_type,
+            n_units=self.dec_n_units,
+            n_projs=self.n_projs,
+            n_layers=self.n_layers,
+            residual=self.residual,
+            input_feeding=self.input_feeding,
+            attn_type=self.score.attn_type,
+            sharpening_factor=self.score.sharpening_factor,
+            sigmoid_smoothing=self.score.sigmoid_smoothing,
+            conv_kernel_size=self.score.conv.padding[1] if self.score.attn_type == 'location' else 0,
+            dropout=self.dropout[0].p,
+            dropout_att=self.score.attn_dropout.p,
+            dropout_emb=self.embed.dropout.p,
+            pad=self.embed.embed.padding_idx)
+        return step
+
+    def step_weights(self):
+        """Parameters used in the decoder step.
+
+        Returns:
+            weights (dict): parameter names (relative to this module) and tensors
+
+        """
+        weights = {}
+        for name in ['embed', 'rnn', 'proj', 'score', 'output_bn', 'output']:
+            module = getattr(self, name, None)
+            if module is not None:
+                weights.update(module.named_parameters(prefix=name))
+        return weights
+
+    def attn_mask(self, eouts, elens):
+        """Mask of the encoder outputs (same as AttentionMechanism).
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            elens (list): A list of length `[B]`
+        Returns:
+            mask (FloatTensor): `[B, T]`
+
+        """
+        bs, max_xlen = eouts.size()[:2]
+        mask = eouts.new_ones(bs, max_xlen)
+        for b in range(bs):
+            if elens[b] < max_xlen:
+                mask[b, elens[b]:] = 0
+        return mask
+
     def init_dec_state(self, batch_size):
         """Initialize decoder state.
 
@@ -793,54 +916,70 @@ class RNNDecoder(nn.Module):
             ylen_max = max([len(refs_id[b]) for b in range(bs)]) + 1
         else:
             ylen_max = int(math.floor(max_xlen * max_len_ratio)) + 1
-        for t in range(ylen_max):
-            if oracle:
-                y = eouts.new_zeros(bs, 1).long()
-                for b in range(bs):
-                    y[b] = ([self.eos] + refs_id[b])[t]
 
-            # Recurrency (1st)
-            y_emb = self.embed(y)
-            dec_in = attn_v if self.input_feeding else cv
-            dstates = self.recurrency(y_emb, dec_in, dstates['dstate'])
-
-            # Update LM states for LM fusion
-            lmout = None
-            if self.lm is not None:
-                lmout, lmstate = self.lm.decode(self.lm.encode(y), lmstate)
-
-            # Score
-            cv, aw = self.score(eouts, elens, eouts, dstates['dout_score'], aw)
-
-            # Generate
-            attn_v, lm_feat = self.generate(cv, dstates['dout_gen'], lmout)
-            if self.adaptive_softmax is None:
-                y = self.output(attn_v).detach().argmax(-1)
-            else:
-                y = self.adaptive_softmax.predict(attn_v.view(-1, attn_v.size(2))).detach().unsqueeze(1)
-
-            # Pick up 1-best
-            best_hyps_tmp += [y]
-            aws_tmp += [aw]
+        step = self.compiled_step() if not oracle else None
+        if step is not None:
+            best_hyps_tmp, aws_tmp = step.greedy(eouts, self.attn_mask(eouts, elens), self.eos, ylen_max,
+                                                 self.step_weights(), self.training)
+            best_hyps_tmp = tensor2np(best_hyps_tmp)
+            aws_tmp = tensor2np(aws_tmp)
+            self.lmstate_final = lmstate
 
             # Count lengths of hypotheses
             for b in range(bs):
-                if not eos_flags[b]:
-                    if y[b].item() == self.eos:
-                        eos_flags[b] = True
-                    ylens[b] += 1
-                    # NOTE: include <eos>
+                eos_pos = np.where(best_hyps_tmp[b] == self.eos)[0]
+                eos_flags[b] = len(eos_pos) > 0
+                ylens[b] = eos_pos[0] + 1 if eos_flags[b] else best_hyps_tmp.shape[1]
+                # NOTE: include <eos>
+        else:
+            for t in range(ylen_max):
+                if oracle:
+                    y = eouts.new_zeros(bs, 1).long()
+                    for b in range(bs):
+                        y[b] = ([self.eos] + refs_id[b])[t]
+
+                # Recurrency (1st)
+                y_emb = self.embed(y)
+                dec_in = attn_v if self.input_feeding else cv
+                dstates = self.recurrency(y_emb, dec_in, dstates['dstate'])
+
+                # Update LM states for LM fusion
+                lmout = None
+                if self.lm is not None:
+                    lmout, lmstate = self.lm.decode(self.lm.encode(y), lmstate)
+
+                # Score
+                cv, aw = self.score(eouts, elens, eouts, dstates['dout_score'], aw)
+
+                # Generate
+                attn_v, lm_feat = self.generate(cv, dstates['dout_gen'], lmout)
+                if self.adaptive_softmax is None:
+                    y = self.output(attn_v).detach().argmax(-1)
+                else:
+                    y = self.adaptive_softmax.predict(attn_v.view(-1, attn_v.size(2))).detach().unsqueeze(1)
 
-            # Break if <eos> is outputed in all mini-bs
-            if sum(eos_flags) == bs:
-                break
+                # Pick up 1-best
+                best_hyps_tmp += [y]
+                aws_tmp += [aw]
 
-        # LM state carry over
-        self.lmstate_final = lmstate
+                # Count lengths of hypotheses
+                for b in range(bs):
+                    if not eos_flags[b]:
+                        if y[b].item() == self.eos:
+                            eos_flags[b] = True
+                        ylens[b] += 1
+                        # NOTE: include <eos>
+
+                # Break if <eos> is outputed in all mini-bs
+                if sum(eos_flags) == bs:
+                    break
 
-        # Concatenate in L dimension
-        best_hyps_tmp = tensor2np(torch.cat(best_hyps_tmp, dim=1))
-        aws_tmp = tensor2np(torch.stack(aws_tmp, dim=1))
+            # LM state carry over
+            self.lmstate_final = lmstate
+
+            # Concatenate in L dimension
+            best_hyps_tmp = tensor2np(torch.cat(best_hyps_tmp, dim=1))
+            aws_tmp = tensor2np(torch.stack(aws_tmp, dim=1))
 
         # Truncate by the first <eos> (<sos> in case of the backward decoder)
         if self.bwd:
@@ -878,6 +1017,11 @@ class RNNDecoder(nn.Module):
                 coverage_threshold (float): threshold for coverage penalty
                 lm_weight (float): weight of LM score
                 n_caches (int):
+                shortlist (bool): restrict the output layers to a per-utterance shortlist
+                shortlist_topk (int): number of tokens taken from each frame of CTC posteriors
+                shortlist_n_frequent (int): number of frequent tokens in the shortlist
+                shortlist_min_mass (float): use the full vocabulary if the shortlist covers
+                    less CTC posterior mass than this value
             idx2token (): converter from index to token
             lm (torch.nn.Module):
             lm_rev (torch.nn.Module):
@@ -920,6 +1064,7 @@ class RNNDecoder(nn.Module):
         cache_theta_lm = params['recog_cache_theta_lm']
         cache_lambda_lm = params['recog_cache_lambda_lm']
         cache_type = params['recog_cache_type']
+        shortlist = params['recog_shortlist']
 
         if lm is not None:
             lm.eval()
@@ -933,6 +1078,14 @@ class RNNDecoder(nn.Module):
             else:
                 ctc_prefix_score = CTCPrefixScore(tensor2np(ctc_log_probs)[0], self.blank, self.eos)
 
+        # For vocabulary shortlisting
+        # NOTE: output probabilities over the full vocabulary are required for cache decoding
+        ctc_probs_sl = None
+        if shortlist and self.adaptive_softmax is None and n_caches == 0 and Shortlist.supports(self.output):
+            if ctc_log_probs is not None:
+                ctc_probs_sl = tensor2np(ctc_log_probs.exp())
+            elif hasattr(self, 'output_ctc'):
+                ctc_probs_sl = tensor2np(F.softmax(self.output_ctc(eouts), dim=-1))
         nbest_hyps_idx, aws, scores = [], [], []
         eos_flags = []
         for b in range(bs):
@@ -964,6 +1117,20 @@ class RNNDecoder(nn.Module):
                     dstates = self.dstates_final
             self.prev_spk = speakers[b]
 
+            # Restrict the output layers to tokens likely in this utterance
+            sl = None
+            if ctc_probs_sl is not None:
+                sl_ids, sl_mass = shortlist_candidates(
+                    ctc_probs_sl[b, :elens[b]], params['recog_shortlist_topk'],
+                    params['recog_shortlist_n_frequent'], self.blank, [self.eos, self.unk])
+                if sl_mass >= params['recog_shortlist_min_mass'] and len(sl_ids) >= beam_width:
+                    sl = Shortlist(sl_ids, self.vocab, self.device_id)
+                    logger.info('Shortlist: %d tokens (CTC mass: %.3f)' % (len(sl), sl_mass))
+                else:
+                    logger.info('Shortlist: full vocabulary (CTC mass: %.3f)' % sl_mass)
+            lm_fusion = self.lm if self.lm is not None else lm
+            lm_sl = sl if sl is not None and Shortlist.supports(getattr(lm_fusion, 'output', None)) else None
+
             complete = []
             beam = [{'hyp_id': [self.eos],
                      'ref_id': [self.eos],
@@ -982,7 +1149,7 @@ class RNNDecoder(nn.Module):
                      'lm_cxs': lm_cxs,
                      'ensmbl_dstates': ensmbl_dstates,
                      'ensmbl_cv': ensmbl_cv,
-                     'ensmbl_aws':[[None]] * (n_models - 1),
+                     'ensmbl_aws': [None] * (n_models - 1),
                      'ctc_state': ctc_prefix_score.initial_state() if ctc_weight > 0 and ctc_log_probs is not None else None,
                      'ctc_score': 0.0,
                      'cache_ids': [],
@@ -1000,21 +1167,43 @@ class RNNDecoder(nn.Module):
                 ylen_max = int(math.floor(elens[b] * max_len_ratio)) + 1
             for t in range(ylen_max):
                 new_beam = []
+
+                prev_ids = [([self.eos] + refs_id[b])[t] if oracle else beam[i_beam]['hyp_id'][-1]
+                            for i_beam in range(len(beam))]
+
+                # Update LM states first, since the LM output is shared with ensemble members
+                lm_steps = []
                 for i_beam in range(len(beam)):
-                    prev_idx = ([self.eos] + refs_id[b])[t] if oracle else beam[i_beam]['hyp_id'][-1]
+                    lmout, lmstate = None, None
+                    if self.lm is not None:
+                        # Update LM states for LM fusion
+                        lmout, lmstate = self.lm.decode(
+                            self.lm.encode(eouts.new_zeros(1, 1).fill_(prev_ids[i_beam]).long()),
+                            (beam[i_beam]['lm_hxs'], beam[i_beam]['lm_cxs']))
+                    elif lm_weight > 0 and lm is not None:
+                        # Update LM states for shallow fusion
+                        lmout, lmstate = lm.decode(
+                            lm.encode(eouts.new_zeros(1, 1).fill_(prev_ids[i_beam]).long()),
+                            (beam[i_beam]['lm_hxs'], beam[i_beam]['lm_cxs']))
+                    lm_steps.append((lmout, lmstate))
+
+                # Ensemble members are evaluated over all hypotheses at once
+                if n_models > 1:
+                    ys = torch.tensor(prev_ids, dtype=torch.long, device=eouts.device).unsqueeze(1)
+                    lmouts = None
+                    if lm_steps[0][0] is not None:
+                        lmouts = torch.cat([lmout for lmout, _ in lm_steps], dim=0)
+                    ensmbl_log_probs, ensmbl_dstates, ensmbl_cv, ensmbl_aws = self.ensemble_step(
+                        ensmbl_decs, ensmbl_eouts, ensmbl_elens, b, ys, beam, lmouts)
+
+                for i_beam in range(len(beam)):
+                    prev_idx = prev_ids[i_beam]
 
                     # Recurrency for the main model
                     y = eouts.new_zeros(1, 1).fill_(prev_idx).long()
                     dstates = self.recurrency(self.embed(y),
                                               beam[i_beam]['cv'],
                                               beam[i_beam]['dstates']['dstate'])
-                    # Recurrency for the ensemble
-                    ensmbl_dstates = []
-                    if n_models > 1:
-                        for i_e, dec in enumerate(ensmbl_decs):
-                            ensmbl_dstates += [dec.recurrency(dec.embed(y),
-                                                              beam[i_beam]['ensmbl_cv'][i_e],
-                                                              beam[i_beam]['ensmbl_dstates'][i_e]['dstate'])]
 
                     # Score for the main model
                     cv, aw = self.score(eouts[b:b + 1, :elens[b]],
@@ -1022,42 +1211,23 @@ class RNNDecoder(nn.Module):
                                         eouts[b:b + 1, :elens[b]],
                                         dstates['dout_score'],
                                         beam[i_beam]['aws'][-1])
-                    # Score for the ensemble
-                    ensmbl_cv = []
-                    ensmbl_aws = []
-                    if n_models > 1:
-                        for i_e, dec in enumerate(ensmbl_decs):
-                            cv_e, aw_e = dec.score(
-                                ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]],
-                                ensmbl_elens[i_e][b:b + 1],
-                                ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]],
-                                ensmbl_dstates[i_e]['dout_score'],
-                                beam[i_beam]['ensmbl_aws'][i_e][-1])
-                            ensmbl_cv += [cv_e]
-                            ensmbl_aws += [aw_e.unsqueeze(0)]  # TODO(hirofumi)] why unsqueeze?
 
-                    lmout, lmstate = None, None
-                    if self.lm is not None:
-                        # Update LM states for LM fusion
-                        lmout, lmstate = self.lm.decode(
-                            self.lm.encode(eouts.new_zeros(1, 1).fill_(prev_idx).long()),
-                            (beam[i_beam]['lm_hxs'], beam[i_beam]['lm_cxs']))
-                    elif lm_weight > 0 and lm is not None:
-                        # Update LM states for shallow fusion
-                        lmout, lmstate = lm.decode(
-                            lm.encode(eouts.new_zeros(1, 1).fill_(prev_idx).long()),
-                            (beam[i_beam]['lm_hxs'], beam[i_beam]['lm_cxs']))
+                    lmout, lmstate = lm_steps[i_beam]
 
                     # Generate for the main model
                     attn_v, lm_feat = self.generate(cv, dstates['dout_gen'], lmout)
-                    if self.adaptive_softmax is None:
+                    if sl is not None:
+                        probs = sl.probs(self.output, attn_v)
+                    elif self.adaptive_softmax is None:
                         probs = F.softmax(self.output(attn_v).squeeze(1), dim=1)
                     else:
                         probs = self.adaptive_softmax.log_prob(attn_v.view(-1, attn_v.size(2)))
 
                     # Generate for LM
                     if lm_weight > 0:
-                        if self.lm is not None:
+                        if lm_sl is not None:
+                            lm_probs = lm_sl.probs(lm_fusion.output, lmout)
+                        elif self.lm is not None:
                             lm_probs = F.softmax(self.lm.generate(lmout).squeeze(1), dim=-1)
                         elif lm is not None:
                             lm_probs = F.softmax(lm.generate(lmout).squeeze(1), dim=-1)
@@ -1157,18 +1327,9 @@ class RNNDecoder(nn.Module):
                         local_scores_attn = torch.log(probs)
                     else:
                         local_scores_attn = probs  # NOTE: already log-scaled
-                    # Generate for the ensemble
+                    # Average over the ensemble
                     if n_models > 1:
-                        for i_e, dec in enumerate(ensmbl_decs):
-                            attn_v_e, _ = dec.generate(ensmbl_cv[i_e],
-                                                       ensmbl_dstates[i_e]['dout_gen'],
-                                                       lmout)
-                            if dec.adaptive_softmax is None:
-                                local_scores_attn += F.log_softmax(dec.output(attn_v_e).squeeze(1), dim=1)
-                            else:
-                                local_scores_attn += dec.adaptive_softmax.log_prob(
-                                    attn_v_e.view(-1, attn_v_e.size(2))).unsqueeze(1)
-                        local_scores_attn /= n_models
+                        local_scores_attn = (local_scores_attn + ensmbl_log_probs[i_beam:i_beam + 1]) / n_models
 
                     # Attention scores
                     scores_attn = beam[i_beam]['score_attn'] + local_scores_attn
@@ -1269,9 +1430,9 @@ class RNNDecoder(nn.Module):
                              'aws': beam[i_beam]['aws'] + [aw],
                              'lm_hxs': lmstate[0][:] if lmstate is not None else None,
                              'lm_cxs': lmstate[1][:] if lmstate is not None else None,
-                             'ensmbl_dstates': ensmbl_dstates,
-                             'ensmbl_cv': ensmbl_cv,
-                             'ensmbl_aws': ensmbl_aws,
+                             'ensmbl_dstates': ensmbl_dstates[i_beam] if n_models > 1 else [],
+                             'ensmbl_cv': ensmbl_cv[i_beam] if n_models > 1 else [],
+                             'ensmbl_aws': ensmbl_aws[i_beam] if n_models > 1 else [],
                              'ctc_state': ctc_states[joint_ids_topk[0, k]] if ctc_log_probs is not None else None,
                              'ctc_score': ctc_scores[joint_ids_topk[0, k]] if ctc_log_probs is not None else None,
                              'cache_ids': beam[i_beam]['cache_ids'] + [idx],
@@ -1354,26 +1515,28 @@ class RNNDecoder(nn.Module):
             eos_flag = [True if complete[n]['hyp_id'][-1] == self.eos else False for n in range(nbest)]
             eos_flags.append(eos_flag)
 
-            if utt_ids is not None:
-                logger.info('Utt-id: %s' % utt_ids[b])
-            if refs_id is not None and self.vocab == idx2token.vocab:
-                logger.info('Ref: %s' % idx2token(refs_id[b]))
-            for k in range(len(complete)):
-                if self.bwd:
-                    logger.info('Hyp: %s' % idx2token(complete[k]['hyp_id'][1:][::-1]))
-                else:
-                    logger.info('Hyp: %s' % idx2token(complete[k]['hyp_id'][1:]))
-                logger.info('log prob (hyp): %.7f' % complete[k]['score'])
-                logger.info('log prob (hyp, att): %.7f' % (complete[k]['score_attn'] * (1 - ctc_weight)))
-                logger.info('log prob (hyp, cp): %.7f' % (complete[k]['score_cp'] * cp_weight))
-                if ctc_weight > 0 and ctc_log_probs is not None:
-                    logger.info('log prob (hyp, ctc): %.7f' % (complete[k]['score_ctc'] * ctc_weight))
-                if lm_weight > 0 and lm is not None:
-                    logger.info('log prob (hyp, lm): %.7f' % (complete[k]['score_lm'] * lm_weight))
-                    if lm_rev is not None:
-                        logger.info('log prob (hyp, lm reverse): %.7f' % (complete[k]['score_lm_rev'] * lm_weight))
-                if n_caches > 0:
-                    logger.info('Cache: %d' % (len(self.fifo_cache_ids) + len(complete[k]['cache_ids'])))
+            # NOTE: skip formatting hypotheses when they are not logged
+            if logger.isEnabledFor(logging.INFO):
+                if utt_ids is not None:
+                    logger.info('Utt-id: %s' % utt_ids[b])
+                if refs_id is not None and self.vocab == idx2token.vocab:
+                    logger.info('Ref: %s' % idx2token(refs_id[b]))
+                for k in range(len(complete)):
+                    if self.bwd:
+                        logger.info('Hyp: %s' % idx2token(complete[k]['hyp_id'][1:][::-1]))
+                    else:
+                        logger.info('Hyp: %s' % idx2token(complete[k]['hyp_id'][1:]))
+                    logger.info('log prob (hyp): %.7f' % complete[k]['score'])
+                    logger.info('log prob (hyp, att): %.7f' % (complete[k]['score_attn'] * (1 - ctc_weight)))
+                    logger.info('log prob (hyp, cp): %.7f' % (complete[k]['score_cp'] * cp_weight))
+                    if ctc_weight > 0 and ctc_log_probs is not None:
+                        logger.info('log prob (hyp, ctc): %.7f' % (complete[k]['score_ctc'] * ctc_weight))
+                    if lm_weight > 0 and lm is not None:
+                        logger.info('log prob (hyp, lm): %.7f' % (complete[k]['score_lm'] * lm_weight))
+                        if lm_rev is not None:
+                            logger.info('log prob (hyp, lm reverse): %.7f' % (complete[k]['score_lm_rev'] * lm_weight))
+                    if n_caches > 0:
+                        logger.info('Cache: %d' % (len(self.fifo_cache_ids) + len(complete[k]['cache_ids'])))
 
         # Concatenate in L dimension
         for b in range(len(aws)):
@@ -1508,6 +1671,67 @@ class RNNDecoder(nn.Module):
         else:
             return nbest_hyps_idx, aws, scores, (cache_lm_attn_hist, cache_idx_hist)
 
+    def ensemble_step(self, ensmbl_decs, ensmbl_eouts, ensmbl_elens, b, ys, beam, lmouts=None):
+        """Run one decoding step of each ensemble member over all hypotheses at once.
+
+        Members with LM fusion take the LM output of the main model as in
+        the per-hypothesis decoding.
+
+        Args:
+            ensmbl_decs (list): list of torch.nn.Module
+            ensmbl_eouts (list): list of FloatTensor
+            ensmbl_elens (list) list of list
+            b (int): index of the utterance in the mini-batch
+            ys (LongTensor): `[n_hyps, 1]`
+            beam (list): A list of length `[n_hyps]`, which contains hypotheses
+            lmouts (FloatTensor): `[n_hyps, 1, lm_n_units]`
+        Returns:
+            log_probs (FloatTensor): `[n_hyps, vocab]`, summed over ensemble members
+            ensmbl_dstates (list): A list of length `[n_hyps]`, which contains decoder states of each member
+            ensmbl_cv (list): A list of length `[n_hyps]`, which contains context vectors of each member
+            ensmbl_aws (list): A list of length `[n_hyps]`, which contains attention weights of each member
+
+        """
+        n_hyps = len(beam)
+        log_probs = []
+        ensmbl_dstates = [[] for _ in range(n_hyps)]
+        ensmbl_cv = [[] for _ in range(n_hyps)]
+        ensmbl_aws = [[] for _ in range(n_hyps)]
+        for i_e, dec in enumerate(ensmbl_decs):
+            # Stack states of all hypotheses
+            dstate_e = [beam[i]['ensmbl_dstates'][i_e]['dstate'] for i in range(n_hyps)]
+            hxs = [torch.cat([d[0][l] for d in dstate_e], dim=0) for l in range(len(dstate_e[0][0]))]
+            cxs = [torch.cat([d[1][l] for d in dstate_e], dim=0) for l in range(len(dstate_e[0][1]))]
+            cv = torch.cat([beam[i]['ensmbl_cv'][i_e] for i in range(n_hyps)], dim=0)
+            aw = None
+            if beam[0]['ensmbl_aws'][i_e] is not None:
+                aw = torch.cat([beam[i]['ensmbl_aws'][i_e] for i in range(n_hyps)], dim=0)
+
+            dstates = dec.recurrency(dec.embed(ys), cv, (hxs, cxs))
+
+            # Encoder-side features are cached per batch size
+            if dec.score.key is not None and dec.score.key.size(0) != n_hyps:
+                dec.score.reset()
+            eouts_e = ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]].expand(n_hyps, -1, -1)
+            cv, aw = dec.score(eouts_e, ensmbl_elens[i_e][b:b + 1] * n_hyps, eouts_e,
+                               dstates['dout_score'], aw)
+            attn_v, _ = dec.generate(cv, dstates['dout_gen'], lmouts)
+            if dec.adaptive_softmax is None:
+                log_probs.append(F.log_softmax(dec.output(attn_v).squeeze(1), dim=1))
+            else:
+                log_probs.append(dec.adaptive_softmax.log_prob(attn_v.view(-1, attn_v.size(2))))
+
+            # Split into hypotheses
+            hxs, cxs = dstates['dstate']
+            for i in range(n_hyps):
+                ensmbl_dstates[i].append({'dout_score': dstates['dout_score'][i:i + 1],
+                                          'dout_gen': dstates['dout_gen'][i:i + 1],
+                                          'dstate': ([h[i:i + 1] for h in hxs], [c[i:i + 1] for c in cxs])})
+                ensmbl_cv[i].append(attn_v[i:i + 1] if dec.input_feeding else cv[i:i + 1])
+                ensmbl_aws[i].append(aw[i:i + 1])
+
+        return torch.stack(log_probs, dim=0).sum(0), ensmbl_dstates, ensmbl_cv, ensmbl_aws
+
     def reset_global_cache(self):
         """Reset global cache when the speaker/session is changed."""
         self.fifo_cache_ids = []
@@ -1517,6 +1741,31 @@ class RNNDecoder(nn.Module):
         self.dict_cache_lm = {}
         self.total_step = 0
 
+    def session_state(self):
+        """Get the state carried over to the next utterance of the session.
+
+        Returns:
+            state (dict): decoder/LM states and caches
+
+        """
+        return {k: getattr(self, k) for k in SESSION_STATE_KEYS}
+
+    def set_session_state(self, state=None):
+        """Restore the state saved by session_state.
+
+        Args:
+            state (dict): None means the beginning of a new session
+
+        """
+        if state is None:
+            self.reset_global_cache()
+            self.prev_spk = ''
+            self.dstates_final = None
+            self.lmstate_final = (None, None)
+        else:
+            for k in SESSION_STATE_KEYS:
+                setattr(self, k, state[k])
+
     def decode_ctc(self, eouts, xlens, beam_width=1, lm=None, lm_weight=0.0):
         """Decoding by the CTC layer in the inference stage.
 
@@ -0,0 +1,311 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""TorchScript-compiled decoder step of RNNDecoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# attention types supported by the compiled step
+ATTN_TYPES = ['add', 'location', 'dot', 'luong_dot', 'luong_general', 'luong_concat']
+
+_cache = {}
+
+
+def _linear(xs, weight, bias):
+    # type: (Tensor, Tensor, Optional[Tensor]) -> Tensor
+    """Same computation as LinearND (without dropout)."""
+    size = xs.size()
+    out = F.linear(xs.contiguous().view(-1, size[-1]), weight, bias)
+    return out.view(size[:-1] + [weight.size(0)])
+
+
+def _get(weights, key):
+    # type: (Dict[str, Tensor], str) -> Optional[Tensor]
+    if key in weights:
+        return weights[key]
+    return None
+
+
+class RNNDecoderStep(nn.Module):
+    """Fused loop of the decoder step (RNN layers, attention and generation).
+
+    The step of RNNDecoder with loop_type='normal' is reimplemented with the
+    same operations in the same order, so that the outputs are numerically
+    identical. This module has no parameters. Those of RNNDecoder are given
+    as a dictionary at every call, which keeps the module shareable among
+    decoders and replicas of DataParallel. The training mode is also given
+    at every call (the mode of this module is not used), since the compiled
+    module is shared by all decoders with the same configuration.
+
+    Args:
+        rnn_type (str): lstm or gru
+        n_units (int): number of units in each RNN layer
+        n_projs (int): number of units in each projection layer
+        n_layers (int): number of RNN layers
+        residual (bool):
+        input_feeding (bool):
+        attn_type (str):
+        sharpening_factor (float):
+        sigmoid_smoothing (bool):
+        conv_kernel_size (int):
+        dropout (float): probability to drop nodes in the RNN layer
+        dropout_att (float): dropout probabilities for attention distributions
+        dropout_emb (float): probability to drop nodes of the embedding layer
+        pad (int): index for padding in the embedding layer
+
+    """
+
+    __constants__ = ['rnn_type', 'n_units', 'n_projs', 'n_layers', 'residual',
+                     'input_feeding', 'attn_type', 'sharpening_factor', 'sigmoid_smoothing',
+                     'conv_kernel_size', 'dropout', 'dropout_att', 'dropout_emb', 'pad']
+
+    def __init__(self, rnn_type, n_units, n_projs, n_layers, residual, input_feeding,
+                 attn_type, sharpening_factor, sigmoid_smoothing, conv_kernel_size,
+                 dropout, dropout_att, dropout_emb, pad):
+
+        super(RNNDecoderStep, self).__init__()
+
+        assert rnn_type in ['lstm', 'gru']
+        assert attn_type in ATTN_TYPES
+        self.rnn_type = rnn_type
+        self.n_units = n_units
+        self.n_projs = n_projs
+        self.n_layers = n_layers
+        self.residual = residual
+        self.input_feeding = input_feeding
+        self.attn_type = attn_type
+        self.sharpening_factor = float(sharpening_factor)
+        self.sigmoid_smoothing = sigmoid_smoothing
+        self.conv_kernel_size = conv_kernel_size
+        self.dropout = dropout
+        self.dropout_att = dropout_att
+        self.dropout_emb = dropout_emb
+        self.pad = pad
+
+    def recurrency(self, y_emb, dec_in, hxs, cxs, weights, training):
+        # type: (Tensor, Tensor, List[Tensor], List[Tensor], Dict[str, Tensor], bool) -> Tuple[Tensor, Tensor, List[Tensor], List[Tensor]]
+        """Same as RNNDecoder.recurrency with loop_type='normal'.
+
+        Args:
+            y_emb (FloatTensor): `[B, emb_dim]`
+            dec_in (FloatTensor): `[B, enc_n_units]`
+            hxs (list): hidden states of each layer
+            cxs (list): cell states of each layer (empty for GRU)
+            weights (dict):
+            training (bool): apply dropout
+        Returns:
+            dout_score (FloatTensor): `[B, dec_n_units]`
+            dout_gen (FloatTensor): `[B, dec_n_units]`
+            hxs (list):
+            cxs (list):
+
+        """
+        hxs_new = []
+        cxs_new = []
+        xs = torch.cat([y_emb, dec_in], dim=-1)
+        dout = xs
+        dout_score = xs
+        for l in range(self.n_layers):
+            prefix = 'rnn.' + str(l) + '.'
+            if self.rnn_type == 'lstm':
+                hx, cx = torch.lstm_cell(xs, [hxs[l], cxs[l]],
+                                         weights[prefix + 'weight_ih'], weights[prefix + 'weight_hh'],
+                                         _get(weights, prefix + 'bias_ih'), _get(weights, prefix + 'bias_hh'))
+                cxs_new.append(cx)
+            else:
+                hx = torch.gru_cell(xs, hxs[l],
+                                    weights[prefix + 'weight_ih'], weights[prefix + 'weight_hh'],
+                                    _get(weights, prefix + 'bias_ih'), _get(weights, prefix + 'bias_hh'))
+            hxs_new.append(hx)
+
+            dout_tmp = hx
+            if self.n_projs > 0:
+                prefix = 'proj.' + str(l) + '.fc.'
+                dout_tmp = torch.tanh(_linear(dout_tmp, weights[prefix + 'weight'],
+                                              _get(weights, prefix + 'bias')))
+            dout_tmp = F.dropout(dout_tmp, self.dropout, training)
+
+            if l == 0:
+                # the bottom layer
+                dout_score = dout_tmp
+                dout = dout_tmp
+            elif self.residual:
+                dout = dout_tmp + dout
+            else:
+                dout = dout_tmp
+            xs = dout
+
+        return dout_score, dout, hxs_new, cxs_new
+
+    def precompute_key(self, key, weights):
+        # type: (Tensor, Dict[str, Tensor]) -> Tensor
+        if self.attn_type in ['add', 'location', 'dot', 'luong_general']:
+            return _linear(key, weights['score.w_key.fc.weight'], _get(weights, 'score.w_key.fc.bias'))
+        return key
+
+    def score(self, key, value, mask, query, aw, weights, training):
+        # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Dict[str, Tensor], bool) -> Tuple[Tensor, Tensor]
+        """Same as AttentionMechanism.forward.
+
+        Args:
+            key (FloatTensor): projected keys by `precompute_key`. `[B, key_len, attn_dim]`
+            value (FloatTensor): `[B, key_len, value_dim]`
+            mask (FloatTensor): `[B, key_len]`
+            query (FloatTensor): `[B, 1, query_dim]`
+            aw (FloatTensor): `[B, key_len, 1]`
+            weights (dict):
+            training (bool): apply dropout
+        Returns:
+            cv (FloatTensor): `[B, 1, value_dim]`
+            aw (FloatTensor): `[B, key_len, 1]`
+
+        """
+        bs = key.size(0)
+        key_len = key.size(1)
+
+        if self.attn_type == 'add':
+            query = query.expand(bs, key_len, query.size(2))
+            e = _linear(torch.tanh(key + _linear(query, weights['score.w_query.fc.weight'], None)),
+                        weights['score.v.fc.weight'], None).squeeze(2)
+        elif self.attn_type == 'location':
+            query = query.expand(bs, key_len, query.size(2))
+            conv_feat = F.conv2d(aw.unsqueeze(3).transpose(3, 1), weights['score.conv.weight'], None,
+                                 [1, 1], [0, self.conv_kernel_size], [1, 1], 1).squeeze(2)
+            conv_feat = conv_feat.transpose(2, 1).contiguous()
+            e = _linear(torch.tanh(key + _linear(query, weights['score.w_query.fc.weight'], None) +
+                                   _linear(conv_feat, weights['score.w_conv.fc.weight'], None)),
+                        weights['score.v.fc.weight'], None).squeeze(2)
+        elif self.attn_type == 'dot':
+            e = torch.bmm(key, _linear(query, weights['score.w_query.fc.weight'], None).transpose(-1, -2)).squeeze(2)
+        elif self.attn_type == 'luong_concat':
+            query = query.expand(bs, key_len, query.size(2))
+            e = _linear(torch.tanh(_linear(torch.cat([key, query], dim=-1), weights['score.w.fc.weight'], None)),
+                        weights['score.v.fc.weight'], None).squeeze(2)
+        else:
+            # luong_dot, luong_general
+            e = torch.bmm(key, query.transpose(-1, -2)).squeeze(2)
+
+        # Compute attention weights, context vector
+        e = e.masked_fill(mask == 0, -1024)
+        if self.sigmoid_smoothing:
+            aw = torch.sigmoid(e) / torch.sigmoid(e).sum(-1).unsqueeze(-1)
+        else:
+            aw = F.softmax(e * self.sharpening_factor, dim=-1)
+        aw = F.dropout(aw, self.dropout_att, training)
+        cv = torch.bmm(aw.unsqueeze(1), value)
+        return cv, aw.unsqueeze(2)
+
+    def generate(self, cv, dout, weights):
+        # type: (Tensor, Tensor, Dict[str, Tensor]) -> Tensor
+        return torch.tanh(_linear(torch.cat([dout, cv], dim=-1),
+                                  weights['output_bn.fc.weight'], _get(weights, 'output_bn.fc.bias')))
+
+    def init_state(self, eouts):
+        # type: (Tensor) -> Tuple[List[Tensor], List[Tensor]]
+        zero_state = eouts.new_zeros((eouts.size(0), self.n_units))
+        hxs = [zero_state for _ in range(self.n_layers)]
+        cxs = [zero_state for _ in range(self.n_layers)] if self.rnn_type == 'lstm' else []
+        return hxs, cxs
+
+    def forward(self, eouts, mask, ys_emb, weights, training):
+        # type: (Tensor, Tensor, Tensor, Dict[str, Tensor], bool) -> Tensor
+        """Teacher-forced decoding.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            mask (FloatTensor): `[B, T]`
+            ys_emb (FloatTensor): embeddings of the input labels. `[B, L, emb_dim]`
+            weights (dict):
+            training (bool): apply dropout
+        Returns:
+            attn_v (FloatTensor): `[B, L, bottleneck_dim]`
+
+        """
+        hxs, cxs = self.init_state(eouts)
+        cv = eouts.new_zeros((eouts.size(0), 1, eouts.size(2)))
+        attn_v = eouts.new_zeros((eouts.size(0), 1, self.n_units))
+        aw = eouts.new_zeros((eouts.size(0), eouts.size(1), 1))
+        key = self.precompute_key(eouts, weights)
+
+        attn_vs = []
+        for t in range(ys_emb.size(1)):
+            dec_in = attn_v if self.input_feeding else cv
+            dout_score, dout_gen, hxs, cxs = self.recurrency(ys_emb[:, t], dec_in.squeeze(1), hxs, cxs,
+                                                             weights, training)
+            cv, aw = self.score(key, eouts, mask, dout_score.unsqueeze(1), aw, weights, training)
+            attn_v = self.generate(cv, dout_gen.unsqueeze(1), weights)
+            attn_vs.append(attn_v)
+        return torch.cat(attn_vs, dim=1)
+
+    def greedy(self, eouts, mask, eos, ylen_max, weights, training):
+        # type: (Tensor, Tensor, int, int, Dict[str, Tensor], bool) -> Tuple[Tensor, Tensor]
+        """Greedy decoding.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            mask (FloatTensor): `[B, T]`
+            eos (int): index for <eos> (<sos> to start decoding)
+            ylen_max (int): maximum sequence length of tokens
+            weights (dict):
+            training (bool): apply dropout
+        Returns:
+            ys (LongTensor): `[B, L]`
+            aws (FloatTensor): `[B, L, T, 1]`
+
+        """
+        bs = eouts.size(0)
+        hxs, cxs = self.init_state(eouts)
+        cv = eouts.new_zeros((bs, 1, eouts.size(2)))
+        attn_v = eouts.new_zeros((bs, 1, self.n_units))
+        aw = eouts.new_zeros((bs, eouts.size(1), 1))
+        key = self.precompute_key(eouts, weights)
+
+        y = eouts.new_zeros((bs, 1)).fill_(eos).long()
+        eos_flags = torch.zeros((bs,), dtype=torch.bool, device=eouts.device)
+        ys = []
+        aws = []
+        for t in range(ylen_max):
+            y_emb = F.dropout(F.embedding(y, weights['embed.embed.weight'], self.pad),
+                              self.dropout_emb, training)
+            dec_in = attn_v if self.input_feeding else cv
+            dout_score, dout_gen, hxs, cxs = self.recurrency(y_emb.squeeze(1), dec_in.squeeze(1), hxs, cxs,
+                                                             weights, training)
+            cv, aw = self.score(key, eouts, mask, dout_score.unsqueeze(1), aw, weights, training)
+            attn_v = self.generate(cv, dout_gen.unsqueeze(1), weights)
+            y = _linear(attn_v, weights['output.fc.weight'], _get(weights, 'output.fc.bias')).detach().argmax(-1)
+            ys.append(y)
+            aws.append(aw)
+
+            # Break if <eos> is outputed in all mini-batch
+            eos_flags = eos_flags | (y.squeeze(1) == eos)
+            if bool(eos_flags.all()):
+                break
+        return torch.cat(ys, dim=1), torch.stack(aws, dim=1)
+
+
+def get_decoder_step(**kwargs):
+    """Compile RNNDecoderStep by TorchScript once per configuration.
+
+    Args:
+        kwargs: arguments of RNNDecoderStep
+    Returns:
+        step (torch.jit.ScriptModule):
+
+    """
+    key = tuple(sorted(kwargs.items()))
+    if key not in _cache:
+        _cache[key] = torch.jit.script(RNNDecoderStep(**kwargs))
+    return _cache[key]
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Vocabulary shortlist for large-vocabulary output layers in beam search."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def shortlist_candidates(ctc_probs, topk, n_frequent, blank, special_ids=()):
+    """Make a per-utterance candidate set from CTC posteriors.
+
+    The candidates are the union of the top-k tokens (except for the blank) in
+    each frame and the `n_frequent` first tokens of the dictionary (sorted by
+    frequency for unit=word by utils/text2dict.py).
+
+    Args:
+        ctc_probs (np.ndarray): CTC posteriors of an utterance. `[T, vocab]`
+        topk (int): number of tokens taken from each frame
+        n_frequent (int): number of frequent tokens always included
+        blank (int): index for <blank>
+        special_ids (list): token IDs always included (e.g., <eos>, <unk>)
+    Returns:
+        ids (np.ndarray): sorted token IDs in the shortlist. `[V']`
+        mass (float): ratio of the non-blank posterior mass covered by the shortlist
+
+    """
+    probs = ctc_probs.copy()
+    probs[:, blank] = 0
+    vocab = probs.shape[1]
+    topk = min(topk, vocab - 1)
+
+    mask = np.zeros(vocab, dtype=bool)
+    mask[:min(n_frequent, vocab)] = True
+    mask[list(special_ids)] = True
+    if topk > 0:
+        mask[np.argpartition(-probs, topk - 1, axis=1)[:, :topk].reshape(-1)] = True
+    mask[blank] = False
+
+    total = probs.sum()
+    mass = float(probs[:, mask].sum() / total) if total > 0 else 1.
+    return np.where(mask)[0], mass
+
+
+class Shortlist(object):
+    """Output layers restricted to a shortlist.
+
+    Weights of the output layers are sliced once per utterance and cached,
+    so that each step only computes logits of the tokens in the shortlist.
+    Probabilities are normalized over the shortlist and the other tokens get
+    zero probabilities.
+
+    Args:
+        ids (np.ndarray): sorted token IDs in the shortlist. `[V']`
+        vocab (int): size of the full vocabulary
+        device_id (int):
+
+    """
+
+    def __init__(self, ids, vocab, device_id=-1):
+        self.ids = torch.from_numpy(ids).long()
+        if device_id >= 0:
+            self.ids = self.ids.cuda(device_id)
+        self.vocab = vocab
+        self._weights = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def supports(linear):
+        """Whether the output layer can be restricted (quantized layers cannot)."""
+        return linear is not None and isinstance(getattr(linear, 'fc', None), nn.Linear)
+
+    def _restrict(self, linear):
+        key = id(linear)
+        if key not in self._weights:
+            fc = linear.fc
+            self._weights[key] = (fc.weight.index_select(0, self.ids),
+                                  fc.bias.index_select(0, self.ids) if fc.bias is not None else None)
+        return self._weights[key]
+
+    def probs(self, linear, xs):
+        """Softmax over the shortlist.
+
+        Args:
+            linear (LinearND): output layer over the full vocabulary
+            xs (FloatTensor): `[B, 1, in_size]`
+        Returns:
+            probs (FloatTensor): `[B, vocab]`
+
+        """
+        weight, bias = self._restrict(linear)
+        probs_sl = F.softmax(F.linear(xs.squeeze(1), weight, bias), dim=-1)
+        probs = probs_sl.new_zeros(probs_sl.size(0), self.vocab)
+        probs[:, self.ids] = probs_sl
+        return probs
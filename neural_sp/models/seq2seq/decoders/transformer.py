@@ -19,6 +19,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from neural_sp.models.criterion import cross_entropy_lsm
+from neural_sp.models.criterion import ctc_loss
 from neural_sp.models.criterion import focal_loss
 from neural_sp.models.criterion import kldiv_lsm_ctc
 from neural_sp.models.modules.embedding import Embedding
@@ -62,6 +63,7 @@ class TransformerDecoder(nn.Module):
         layer_norm_eps (float):
         ctc_weight (float):
         ctc_fc_list (list):
+        ctc_loss_type (str): warpctc or pytorch
         backward (bool): decode in the backward order
         global_weight (float):
         mtl_per_batch (bool):
@@ -90,6 +92,7 @@ class TransformerDecoder(nn.Module):
                  layer_norm_eps=1e-6,
                  ctc_weight=0.0,
                  ctc_fc_list=[],
+                 ctc_loss_type='warpctc',
                  backward=False,
                  global_weight=1.0,
                  mtl_per_batch=False,
@@ -108,6 +111,8 @@ class TransformerDecoder(nn.Module):
         self.lsm_prob = lsm_prob
         self.ctc_weight = ctc_weight
         self.ctc_fc_list = ctc_fc_list
+        self.ctc_loss_type = ctc_loss_type
+        assert ctc_loss_type in ['warpctc', 'pytorch']
         self.backward = backward
         self.global_weight = global_weight
         self.mtl_per_batch = mtl_per_batch
@@ -125,8 +130,9 @@ class TransformerDecoder(nn.Module):
                 self.output_ctc = LinearND(d_model, vocab)
             self.decode_ctc_greedy = GreedyDecoder(blank=blank)
             self.decode_ctc_beam = BeamSearchDecoder(blank=blank)
-            import warpctc_pytorch
-            self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
+            if ctc_loss_type == 'warpctc':
+                import warpctc_pytorch
+                self.warpctc_loss = warpctc_pytorch.CTCLoss(size_average=True)
 
         if ctc_weight < global_weight:
             self.layers = nn.ModuleList(
@@ -211,7 +217,7 @@ class TransformerDecoder(nn.Module):
         # CTC loss
         if self.ctc_weight > 0 and (not self.mtl_per_batch or (self.mtl_per_batch and 'ctc' in task)):
             loss_ctc = self.forward_ctc(eouts, elens, ys)
-            observation['loss_ctc'] = loss_ctc.item()
+            observation['loss_ctc'] = loss_ctc.detach()
             if self.mtl_per_batch:
                 loss += loss_ctc
             else:
@@ -220,7 +226,7 @@ class TransformerDecoder(nn.Module):
         # XE loss
         if self.global_weight - self.ctc_weight > 0 and 'ctc' not in task and 'lmobj' not in task:
             loss_att, acc_att, ppl_att = self.forward_att(eouts, elens, ys)
-            observation['loss_att'] = loss_att.item()
+            observation['loss_att'] = loss_att.detach()
             observation['acc_att'] = acc_att
             observation['ppl_att'] = ppl_att
             if self.mtl_per_batch:
@@ -228,7 +234,7 @@ class TransformerDecoder(nn.Module):
             else:
                 loss += loss_att * (self.global_weight - self.ctc_weight)
 
-        observation['loss'] = loss.item()
+        observation['loss'] = loss.detach()
         return loss, observation
 
     def forward_ctc(self, eouts, elens, ys):
@@ -253,13 +259,16 @@ class TransformerDecoder(nn.Module):
         # NOTE: do not copy to GPUs here
 
         # Compute CTC loss
-        loss = self.warpctc_loss(logits.transpose(1, 0).cpu(),  # time-major
-                                 ys_ctc, elens_ctc, ylens)
-        # NOTE: ctc loss has already been normalized by bs
-        # NOTE: index 0 is reserved for blank in warpctc_pytorch
+        if self.ctc_loss_type == 'pytorch':
+            loss = ctc_loss(logits, ys_ctc, elens_ctc, ylens, blank=self.blank)
+        else:
+            loss = self.warpctc_loss(logits.transpose(1, 0).cpu(),  # time-major
+                                     ys_ctc, elens_ctc, ylens)
+            # NOTE: ctc loss has already been normalized by bs
+            # NOTE: index 0 is reserved for blank in warpctc_pytorch
 
-        if self.device_id >= 0:
-            loss = loss.cuda(self.device_id)
+            if self.device_id >= 0:
+                loss = loss.cuda(self.device_id)
 
         # Label smoothing for CTC
         if self.lsm_prob > 0 and self.ctc_weight == 1:
@@ -278,8 +287,8 @@ class TransformerDecoder(nn.Module):
             ys (list): A list of length `[B]`, which contains a list of size `[L]`
         Returns:
             loss (FloatTensor): `[1]`
-            acc (float):
-            ppl (float):
+            acc (FloatTensor):
+            ppl (FloatTensor):
 
         """
         bs = eouts.size(0)
@@ -326,7 +335,7 @@ class TransformerDecoder(nn.Module):
         else:
             acc = compute_accuracy(self.adaptive_softmax.log_prob(
                 logits.view((-1, logits.size(2)))), ys_out_pad, pad=self.pad)
-        ppl = min(np.exp(loss.item()), np.inf)
+        ppl = torch.exp(loss.detach())
 
         return loss, acc, ppl
 
@@ -22,6 +22,7 @@ from neural_sp.models.modules.linear import LinearND
 from neural_sp.models.seq2seq.encoders.conv import ConvEncoder
 from neural_sp.models.seq2seq.encoders.gated_conv import GatedConvEncoder
 from neural_sp.models.seq2seq.encoders.tds import TDSEncoder
+from neural_sp.models.torch_utils import flatten_parameters
 
 
 class RNNEncoder(nn.Module):
@@ -352,7 +353,7 @@ class RNNEncoder(nn.Module):
                 return eouts
 
         if self.fast_impl:
-            self.rnn.flatten_parameters()
+            flatten_parameters(self.rnn)
             # NOTE: this is necessary for multi-GPUs setting
 
             # Path through RNN
@@ -363,7 +364,7 @@ class RNNEncoder(nn.Module):
         else:
             residual = None
             for l in range(len(self.rnn)):
-                self.rnn[l].flatten_parameters()
+                flatten_parameters(self.rnn[l])
                 # NOTE: this is necessary for multi-GPUs setting
 
                 # Path through RNN
@@ -375,7 +376,7 @@ class RNNEncoder(nn.Module):
                 # Pick up outputs in the sub task before the projection layer
                 if l == self.n_layers_sub1 - 1:
                     if self.task_specific_layer:
-                        self.rnn_sub1.flatten_parameters()
+                        flatten_parameters(self.rnn_sub1)
                         xs_sub1 = pack_padded_sequence(xs, xlens.tolist(), batch_first=True)
                         xs_sub1, _ = self.rnn_sub1(xs_sub1, hx=None)
                         xs_sub1 = pad_packed_sequence(xs_sub1, batch_first=True)[0]
@@ -393,7 +394,7 @@ class RNNEncoder(nn.Module):
 
                 if l == self.n_layers_sub2 - 1:
                     if self.task_specific_layer:
-                        self.rnn_sub2.flatten_parameters()
+                        flatten_parameters(self.rnn_sub2)
                         xs_sub2 = pack_padded_sequence(xs, xlens.tolist(), batch_first=True)
                         xs_sub2, _ = self.rnn_sub2(xs_sub2, hx=None)
                         xs_sub2 = pad_packed_sequence(xs_sub2, batch_first=True)[0]
@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Decode long-form audio by overlapping windows."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import numpy as np
+
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger('decoding')
+
+NEG_INF = -float('inf')
+
+
+def split_windows(n_frames, window, overlap):
+    """Split frames into overlapping windows.
+
+    Args:
+        n_frames (int): total number of frames
+        window (int): number of frames in each window
+        overlap (int): number of frames shared by adjacent windows
+    Returns:
+        windows (list): A list of tuples `(start, end)`
+
+    """
+    assert 0 <= overlap < window
+    shift = window - overlap
+    windows = [(0, min(window, n_frames))]
+    while windows[-1][1] < n_frames:
+        start = windows[-1][0] + shift
+        windows.append((start, min(start + window, n_frames)))
+    return windows
+
+
+def ctc_forced_align(log_probs, hyp, blank=0):
+    """Align tokens to frames by the Viterbi algorithm of CTC.
+
+    Args:
+        log_probs (np.ndarray): `[T, vocab]`
+        hyp (list): token IDs
+        blank (int): index for <blank>
+    Returns:
+        frames (np.ndarray): the first frame where each token is emitted `[L]`.
+            None if the hypothesis cannot be aligned (e.g., longer than T).
+
+    """
+    T, L = len(log_probs), len(hyp)
+    if L == 0:
+        return np.zeros((0,), dtype=np.int64)
+    # extended label sequence: blank, y1, blank, y2, ..., blank
+    labels = np.full((2 * L + 1,), blank, dtype=np.int64)
+    labels[1::2] = hyp
+    S = len(labels)
+    # transitions skipping a blank are allowed between different tokens
+    can_skip = np.zeros((S,), dtype=bool)
+    can_skip[3::2] = labels[3::2] != labels[1:-2:2]
+
+    alpha = np.full((S,), NEG_INF)
+    alpha[:2] = log_probs[0, labels[:2]]
+    backptr = np.zeros((T, S), dtype=np.int8)  # 0: stay, 1: from s-1, 2: from s-2
+    for t in range(1, T):
+        stay = alpha
+        prev1 = np.concatenate([[NEG_INF], alpha[:-1]])
+        prev2 = np.where(can_skip, np.concatenate([[NEG_INF, NEG_INF], alpha[:-2]]), NEG_INF)
+        cands = np.stack([stay, prev1, prev2], axis=0)
+        backptr[t] = cands.argmax(0)
+        alpha = cands.max(0) + log_probs[t, labels]
+
+    # end with the last token or the last blank
+    s = S - 1 if S == 1 or alpha[S - 1] >= alpha[S - 2] else S - 2
+    if alpha[s] == NEG_INF:
+        return None
+    states = np.zeros((T,), dtype=np.int64)
+    for t in range(T - 1, -1, -1):
+        states[t] = s
+        s -= backptr[t, s]
+
+    frames = np.zeros((L,), dtype=np.int64)
+    for l in range(L - 1, -1, -1):
+        frames[l] = np.nonzero(states == 2 * l + 1)[0][0]
+    return frames
+
+
+def attention_align(aw, n_tokens):
+    """Align tokens to frames by the peak of attention weights.
+
+    Args:
+        aw (np.ndarray): `[L, T]` or `[L, T, n_heads]`
+        n_tokens (int):
+    Returns:
+        frames (np.ndarray): `[L]`. None if the shape does not match.
+
+    """
+    if aw is None:
+        return None
+    aw = np.asarray(aw)
+    if aw.ndim == 3:
+        aw = aw.mean(-1)
+    if aw.ndim != 2 or len(aw) < n_tokens:
+        return None
+    # attention of monotonic alignments never moves backward
+    return np.maximum.accumulate(aw[:n_tokens].argmax(-1))
+
+
+class LongFormRecognizer(object):
+    """Decode a long recording with memory bounded by the window size.
+
+    A feature matrix is split into overlapping windows, which are encoded and
+    decoded in mini-batches (greedy, CTC or beam search as configured by the
+    decoding parameters). Each token is placed on the time axis by the CTC
+    forced alignment (or the attention weights without CTC), and the
+    hypotheses of adjacent windows are stitched at the middle of the overlap.
+
+    Args:
+        model (Seq2seq):
+        params (dict): hyper-parameters for decoding
+        idx2token (): converter from index to token
+        window (int): number of input frames in each window
+        overlap (int): number of input frames shared by adjacent windows
+        batch_size (int): number of windows decoded at once
+        task (str): ys* or ys_sub1* or ys_sub2*
+
+    """
+
+    def __init__(self, model, params, idx2token=None, window=2000, overlap=400,
+                 batch_size=8, task='ys'):
+        self.model = model
+        self.params = params
+        self.idx2token = idx2token
+        self.window = window
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.task = task
+
+        # NOTE: encoder outputs cannot be shared when the backward decoder takes flipped inputs
+        self.share_enc_outs = not (model.mtl_per_batch and (
+            params['recog_bwd_attention'] or params['recog_fwd_bwd_attention']))
+        self.use_ctc = getattr(model, 'ctc_weight', 0) > 0 and task.split('.')[0] == 'ys'
+        self.beam_search = params['recog_beam_width'] > 1 or params['recog_fwd_bwd_attention']
+        self.ctc_only = (model.fwd_weight == 0 and model.bwd_weight == 0) or \
+            (model.ctc_weight > 0 and params['recog_ctc_weight'] == 1)
+
+    def _decode_batch(self, xs):
+        """Decode a mini-batch of windows.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+        Returns:
+            hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
+            frames (list): A list of length `[B]`, which contains arrays of size `[L]`
+
+        """
+        enc_outs = self.model.encode_for_decoding(xs, self.task)
+        eouts = enc_outs[self.task]['xs']
+        elens = enc_outs[self.task]['xlens']
+
+        if self.beam_search and not self.ctc_only:
+            # NOTE: beam search supports a single utterance
+            hyps, aws = [], []
+            for b in range(len(xs)):
+                enc_outs_b = {k: {'xs': v['xs'][b:b + 1] if v['xs'] is not None else None,
+                                  'xlens': v['xlens'][b:b + 1] if v['xlens'] is not None else None}
+                              for k, v in enc_outs.items()}
+                hyps_b, aws_b, _ = self.model.decode(
+                    [xs[b]], self.params, self.idx2token, exclude_eos=True, task=self.task,
+                    enc_outs=enc_outs_b if self.share_enc_outs else None)
+                hyps += hyps_b
+                aws += aws_b if aws_b is not None else [None]
+        else:
+            hyps, aws, _ = self.model.decode(
+                xs, self.params, self.idx2token, exclude_eos=True, task=self.task,
+                enc_outs=enc_outs if self.share_enc_outs else None)
+            if aws is None:
+                aws = [None] * len(xs)
+
+        log_probs = None
+        if self.use_ctc:
+            log_probs = tensor2np(self.model.dec_fwd.ctc_log_probs(eouts))
+
+        frames = []
+        for b, (x, hyp) in enumerate(zip(xs, hyps)):
+            hyp = [int(y) for y in hyp if y != self.model.eos]
+            align = None
+            if log_probs is not None:
+                align = ctc_forced_align(log_probs[b, :elens[b]], hyp, self.model.blank)
+            if align is None:
+                align = attention_align(aws[b], len(hyp))
+            if align is None:
+                # place tokens evenly
+                align = (np.arange(len(hyp)) + 0.5) * elens[b] / max(len(hyp), 1)
+            # encoder frames -> input frames
+            frames.append(np.asarray(align, dtype=np.float64) * len(x) / elens[b])
+            hyps[b] = np.array(hyp, dtype=np.int64)
+        return hyps, frames
+
+    def __call__(self, x):
+        """Decode a long feature matrix.
+
+        Args:
+            x (np.ndarray): `[T, input_dim]`
+        Returns:
+            hyp (np.ndarray): token IDs `[L]`
+            frames (np.ndarray): input frame where each token is emitted `[L]`
+
+        """
+        windows = split_windows(len(x), self.window, self.overlap)
+        hyp, frames = [], []
+        for i in range(0, len(windows), self.batch_size):
+            batch_windows = windows[i:i + self.batch_size]
+            hyps_b, frames_b = self._decode_batch([x[s:e] for s, e in batch_windows])
+            for j, (s, e) in enumerate(batch_windows):
+                i_win = i + j
+                # keep tokens between the middles of the overlaps with adjacent windows
+                lower = (s + windows[i_win - 1][1]) / 2 if i_win > 0 else 0
+                upper = (windows[i_win + 1][0] + e) / 2 if i_win < len(windows) - 1 else len(x)
+                t = frames_b[j] + s
+                keep = (lower <= t) & (t < upper)
+                hyp.append(hyps_b[j][keep])
+                frames.append(t[keep])
+        logger.debug('Decoded %d frames by %d windows' % (len(x), len(windows)))
+        return np.concatenate(hyp).astype(np.int64), np.concatenate(frames)
@@ -11,6 +11,7 @@ from __future__ import division
 from __future__ import print_function
 
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import torch
 
@@ -34,10 +35,37 @@ from neural_sp.models.torch_utils import pad_list
 logger = logging.getLogger("training")
 
 
+def split_enc_outs(enc_outs, bs):
+    """Split encoder outputs of a doubled mini-batch into the first and second halves.
+
+    Args:
+        enc_outs (dict): encoder outputs of `2 * bs` utterances
+        bs (int): batch size of each half
+    Returns:
+        enc_outs_first (dict):
+        enc_outs_second (dict):
+
+    """
+    first, second = {}, {}
+    for k, v in enc_outs.items():
+        first[k] = {'xs': v['xs'][:bs] if v['xs'] is not None else None,
+                    'xlens': v['xlens'][:bs] if v['xlens'] is not None else None}
+        second[k] = {'xs': v['xs'][bs:] if v['xs'] is not None else None,
+                     'xlens': v['xlens'][bs:] if v['xlens'] is not None else None}
+    return first, second
+
+
 class Seq2seq(ModelBase):
-    """Attention-based RNN sequence-to-sequence model (including CTC)."""
+    """Attention-based RNN sequence-to-sequence model (including CTC).
+
+    Args:
+        args (Namespace): configuration (see neural_sp/bin/args_asr.py)
+        skip_decoders (list): names of decoders not to be built for inference
+            (dec_bwd, dec_fwd_sub1, dec_fwd_sub2)
 
-    def __init__(self, args):
+    """
+
+    def __init__(self, args, skip_decoders=()):
 
         super(ModelBase, self).__init__()
 
@@ -169,6 +197,10 @@ class Seq2seq(ModelBase):
         if self.bwd_weight > 0:
             directions.append('bwd')
         for dir in directions:
+            # NOTE: the backward decoder is always built if it is the only one
+            if dir == 'bwd' and 'fwd' in directions and 'dec_bwd' in skip_decoders:
+                continue
+
             # Cold fusion
             if args.lm_fusion and dir == 'fwd':
                 lm = RNNLM(args.lm_conf)
@@ -202,6 +234,7 @@ class Seq2seq(ModelBase):
                     ctc_weight=self.ctc_weight if dir == 'fwd' else 0,
                     ctc_fc_list=[int(fc) for fc in args.ctc_fc_list.split(
                         '_')] if args.ctc_fc_list is not None and len(args.ctc_fc_list) > 0 else [],
+                    ctc_loss_type=args.ctc_loss_type,
                     backward=(dir == 'bwd'),
                     global_weight=self.main_weight - self.bwd_weight if dir == 'fwd' else self.bwd_weight,
                     mtl_per_batch=args.mtl_per_batch)
@@ -240,6 +273,7 @@ class Seq2seq(ModelBase):
                     ctc_weight=self.ctc_weight if dir == 'fwd' else 0,
                     ctc_fc_list=[int(fc) for fc in args.ctc_fc_list.split(
                         '_')] if args.ctc_fc_list is not None and len(args.ctc_fc_list) > 0 else [],
+                    ctc_loss_type=args.ctc_loss_type,
                     input_feeding=args.input_feeding,
                     backward=(dir == 'bwd'),
                     # lm=args.lm_conf,
@@ -252,12 +286,13 @@ class Seq2seq(ModelBase):
                     global_weight=self.main_weight - self.bwd_weight if dir == 'fwd' else self.bwd_weight,
                     mtl_per_batch=args.mtl_per_batch,
                     adaptive_softmax=args.adaptive_softmax,
-                    param_init=args.param_init)
+                    param_init=args.param_init,
+                    jit_step=args.dec_jit_step)
             setattr(self, 'dec_' + dir, dec)
 
         # sub task
         for sub in ['sub1', 'sub2']:
-            if getattr(self, sub + '_weight') > 0:
+            if getattr(self, sub + '_weight') > 0 and 'dec_fwd_' + sub not in skip_decoders:
                 if args.dec_type == 'transformer':
                     raise NotImplementedError
                 else:
@@ -295,10 +330,12 @@ class Seq2seq(ModelBase):
                         ctc_weight=getattr(self, 'ctc_weight_' + sub),
                         ctc_fc_list=[int(fc) for fc in getattr(args, 'ctc_fc_list_' + sub).split('_')
                                      ] if getattr(args, 'ctc_fc_list_' + sub) is not None and len(getattr(args, 'ctc_fc_list_' + sub)) > 0 else [],
+                        ctc_loss_type=args.ctc_loss_type,
                         input_feeding=args.input_feeding,
                         global_weight=getattr(self, sub + '_weight'),
                         mtl_per_batch=args.mtl_per_batch,
-                        param_init=args.param_init)
+                        param_init=args.param_init,
+                        jit_step=args.dec_jit_step)
                 setattr(self, 'dec_fwd_' + sub, dec_sub)
 
         if args.input_type == 'text':
@@ -359,7 +396,8 @@ class Seq2seq(ModelBase):
                 utt_ids (list): name of utterances
                 speakers (list): name of speakers
             reporter ():
-            task (str): all or ys* or ys_sub*
+            task (str or tuple): all or ys* or ys_sub*.
+                A tuple of tasks shares the encoder outputs among the tasks.
             is_eval (bool): the history will not be saved.
                 This should be used in inference model for memory efficiency.
         Returns:
@@ -378,24 +416,103 @@ class Seq2seq(ModelBase):
         return loss, reporter
 
     def _forward(self, batch, task, reporter):
+        if isinstance(task, (list, tuple)):
+            return self._forward_shared(batch, task, reporter)
+
         # Encode input features
         if self.input_type == 'speech':
             if self.mtl_per_batch:
                 flip = True if 'bwd' in task else False
-                enc_outs = self.encode(batch['xs'], task, flip=flip)
+                enc_outs = self._encode_batch(batch, task, flip=flip)
             else:
                 flip = True if self.bwd_weight == 1 else False
-                enc_outs = self.encode(batch['xs'], 'all', flip=flip)
+                enc_outs = self._encode_batch(batch, 'all', flip=flip)
         else:
             enc_outs = self.encode(batch['ys_sub1'])
 
+        loss, observation = self._compute_loss(enc_outs, batch, task)
+
+        if reporter is not None:
+            is_eval = not self.training
+            reporter.add(observation, is_eval)
+
+        return loss, reporter
+
+    def _forward_shared(self, batch, tasks, reporter):
+        """Compute losses of multiple tasks on the shared encoder outputs.
+
+        The encoder is run once, and the task losses are weighted and summed
+        so that a single backward pass updates all tasks. The backward decoder
+        takes flipped inputs as in mtl_per_batch training without sharing and
+        in decoding, so they are encoded in the same pass by doubling the batch.
+
+        """
+        # Encode input features
+        enc_outs_bwd = None
+        if self.input_type == 'speech':
+            if 'ys.bwd' in tasks:
+                bs = len(batch['xs'])
+                enc_outs, enc_outs_bwd = split_enc_outs(
+                    self.encode(batch['xs'] + batch['xs'], 'all', flip=[False] * bs + [True] * bs), bs)
+            else:
+                enc_outs = self._encode_batch(batch, 'all')
+        else:
+            enc_outs = self.encode(batch['ys_sub1'])
+
+        loss = 0
+        observation = {}
+        for task in tasks:
+            loss_task, obs_task = self._compute_loss(
+                enc_outs_bwd if task == 'ys.bwd' and enc_outs_bwd is not None else enc_outs, batch, task)
+            loss += loss_task * self.task_weight(task)
+            observation.update((k, v) for k, v in obs_task.items() if v is not None)
+
+        if reporter is not None:
+            is_eval = not self.training
+            reporter.add(observation, is_eval)
+
+        return loss, reporter
+
+    def task_weight(self, task):
+        """Loss weight of each task in mtl_per_batch training with the shared encoder.
+
+        Args:
+            task (str): ys* or ys_sub*
+        Returns:
+            weight (float):
+
+        """
+        dir_sub = task.split('.')[0][2:]  # '' or '_sub1' or '_sub2'
+        if task.endswith('.ctc'):
+            return getattr(self, 'ctc_weight' + dir_sub)
+        elif task.endswith('.lmobj'):
+            return getattr(self, 'dec_fwd' + dir_sub).lmobj_weight
+        elif task == 'ys.bwd':
+            return self.bwd_weight
+        elif task in ['ys', 'ys_sub1', 'ys_sub2']:
+            return getattr(self, 'fwd_weight' + dir_sub)
+        return 1.
+
+    def _encode_batch(self, batch, task, flip=False):
+        """Encode a mini-batch, using the tensors padded by the data loader if possible."""
+        if 'collated' in batch and not flip:
+            return self.encode(batch['collated']['xs'], task, xlens=batch['collated']['xlens'])
+        return self.encode(batch['xs'], task, flip=flip)
+
+    def _labels(self, batch, key):
+        """Labels for the RNN decoders, which also accept the padded tensors."""
+        if 'collated' in batch and key in batch['collated'] and 'transformer' not in self.dec_type:
+            return batch['collated'][key]
+        return batch[key]
+
+    def _compute_loss(self, enc_outs, batch, task):
         observation = {}
         loss = torch.zeros((1,), dtype=torch.float32).cuda(self.device_id)
 
         # for the forward decoder in the main task
         if (self.fwd_weight > 0 or self.ctc_weight > 0) and task in ['all', 'ys', 'ys.ctc', 'ys.lmobj']:
             loss_fwd, obs_fwd = self.dec_fwd(enc_outs['ys']['xs'], enc_outs['ys']
-                                             ['xlens'], batch['ys'], task, batch['ys_hist'])
+                                             ['xlens'], self._labels(batch, 'ys'), task, batch['ys_hist'])
             loss += loss_fwd
             observation['loss.att'] = obs_fwd['loss_att']
             observation['loss.ctc'] = obs_fwd['loss_ctc']
@@ -407,7 +524,8 @@ class Seq2seq(ModelBase):
 
         # for the backward decoder in the main task
         if self.bwd_weight > 0 and task in ['all', 'ys.bwd']:
-            loss_bwd, obs_bwd = self.dec_bwd(enc_outs['ys']['xs'], enc_outs['ys']['xlens'], batch['ys'], task)
+            loss_bwd, obs_bwd = self.dec_bwd(enc_outs['ys']['xs'], enc_outs['ys']['xlens'],
+                                             self._labels(batch, 'ys'), task)
             loss += loss_bwd
             observation['loss.att-bwd'] = obs_bwd['loss_att']
             observation['loss.ctc-bwd'] = obs_bwd['loss_ctc']
@@ -422,7 +540,8 @@ class Seq2seq(ModelBase):
             # for the forward decoder in the sub tasks
             if (getattr(self, 'fwd_weight_' + sub) > 0 or getattr(self, 'ctc_weight_' + sub) > 0) and task in ['all', 'ys_' + sub, 'ys_' + sub + '.ctc', 'ys_' + sub + '.lmobj']:
                 loss_sub, obs_fwd_sub = getattr(self, 'dec_fwd_' + sub)(
-                    enc_outs['ys_' + sub]['xs'], enc_outs['ys_' + sub]['xlens'], batch['ys_' + sub], task)
+                    enc_outs['ys_' + sub]['xs'], enc_outs['ys_' + sub]['xlens'],
+                    self._labels(batch, 'ys_' + sub), task)
                 loss += loss_sub
                 observation['loss.att-' + sub] = obs_fwd_sub['loss_att']
                 observation['loss.ctc-' + sub] = obs_fwd_sub['loss_ctc']
@@ -432,19 +551,20 @@ class Seq2seq(ModelBase):
                 observation['ppl.att-' + sub] = obs_fwd_sub['ppl_att']
                 observation['ppl.lmobj-' + sub] = obs_fwd_sub['ppl_lmobj']
 
-        if reporter is not None:
-            is_eval = not self.training
-            reporter.add(observation, is_eval)
-
-        return loss, reporter
+        return loss, observation
 
-    def encode(self, xs, task='all', flip=False):
+    def encode(self, xs, task='all', flip=False, xlens=None):
         """Encode acoustic or text features.
 
         Args:
-            xs (list): A list of length `[B]`, which contains Tensor of size `[T, input_dim]`
+            xs (list): A list of length `[B]`, which contains Tensor of size `[T, input_dim]`.
+                Acoustic features already stacked, spliced and padded by the data
+                loader can be given as a FloatTensor of size `[B, T, input_dim]`.
             task (str): all or ys* or ys_sub1* or ys_sub2*
-            flip (bool): if True, flip acoustic features in the time-dimension
+            flip (bool or list): if True, flip acoustic features in the time-dimension.
+                A list of length `[B]` specifies whether to flip each utterance.
+                This is not supported for the padded FloatTensor.
+            xlens (list): lengths of the padded FloatTensor
         Returns:
             enc_outs (dict):
 
@@ -455,7 +575,12 @@ class Seq2seq(ModelBase):
                      'ys_sub2': {'xs': None, 'xlens': None}}
             return eouts
         else:
-            if self.input_type == 'speech':
+            if self.input_type == 'speech' and torch.is_tensor(xs):
+                # NOTE: collated in the pinned memory by the data loader
+                if self.device_id >= 0:
+                    xs = xs.cuda(self.device_id, non_blocking=True)
+
+            elif self.input_type == 'speech':
                 # Frame stacking
                 if self.n_stacks > 1:
                     xs = [stack_frame(x, self.n_stacks, self.n_skips)for x in xs]
@@ -466,10 +591,9 @@ class Seq2seq(ModelBase):
 
                 xlens = [len(x) for x in xs]
                 # Flip acoustic features in the reverse order
-                if flip:
-                    xs = [torch.from_numpy(np.flip(x, axis=0).copy()).float().cuda(self.device_id) for x in xs]
-                else:
-                    xs = [np2tensor(x, self.device_id).float() for x in xs]
+                flips = flip if isinstance(flip, list) else [flip] * len(xs)
+                xs = [np2tensor(np.flip(x, axis=0).copy() if f else x, self.device_id).float()
+                      for x, f in zip(xs, flips)]
                 xs = pad_list(xs, 0.0)
 
             elif self.input_type == 'text':
@@ -492,6 +616,53 @@ class Seq2seq(ModelBase):
 
             return enc_outs
 
+    def encode_for_decoding(self, xs, task='all'):
+        """Encode acoustic features in the inference stage.
+
+        The outputs can be shared by multiple decoding passes (e.g., word and
+        character tasks for OOV resolution) by passing them to decode().
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            task (str): all or ys* or ys_sub1* or ys_sub2*
+        Returns:
+            enc_outs (dict):
+
+        """
+        self.eval()
+        with torch.no_grad():
+            return self.encode(xs, task, flip=False)
+
+    def encode_ensemble(self, ensemble_models, xs, task, bwd=False):
+        """Encode acoustic features by ensemble members concurrently.
+
+        Args:
+            ensemble_models (list): list of Seq2seq classes
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            task (str): ys* or ys_sub1* or ys_sub2*
+            bwd (bool): encode for the backward decoder
+        Returns:
+            eouts (list): list of FloatTensor
+            elens (list): list of list
+
+        """
+        if len(ensemble_models) == 0:
+            return [], []
+
+        def _encode(model):
+            # NOTE: grad mode is thread-local
+            with torch.no_grad():
+                flip = model.input_type == 'speech' and model.mtl_per_batch and bwd
+                enc_outs = model.encode(xs, task, flip=flip)
+            return enc_outs[task]['xs'], enc_outs[task]['xlens']
+
+        pool = ThreadPool(len(ensemble_models))
+        try:
+            enc_outs = pool.map(_encode, ensemble_models)
+        finally:
+            pool.close()
+        return [eouts for eouts, _ in enc_outs], [elens for _, elens in enc_outs]
+
     def get_ctc_probs(self, xs, task='ys', temperature=1, topk=None):
         self.eval()
         with torch.no_grad():
@@ -514,7 +685,7 @@ class Seq2seq(ModelBase):
 
     def decode(self, xs, params, idx2token, nbest=1, exclude_eos=False,
                refs_id=None, refs_text=None, utt_ids=None, speakers=None,
-               task='ys', ensemble_models=[]):
+               task='ys', ensemble_models=[], enc_outs=None):
         """Decoding in the inference stage.
 
         Args:
@@ -538,6 +709,7 @@ class Seq2seq(ModelBase):
             speakers (list):
             task (str): ys* or ys_sub1* or ys_sub2*
             ensemble_models (list): list of Seq2seq classes
+            enc_outs (dict): pre-computed encoder outputs (see encode_for_decoding)
         Returns:
             best_hyps_id (list): A list of length `[B]`, which contains arrays of size `[L]`
             aws (list): A list of length `[B]`, which contains arrays of size `[L, T, n_heads]`
@@ -555,8 +727,16 @@ class Seq2seq(ModelBase):
                 raise ValueError(task)
 
             # encode
-            if self.input_type == 'speech' and self.mtl_per_batch and 'bwd' in dir:
+            enc_outs_bwd = None
+            if enc_outs is not None:
+                pass
+            elif self.input_type == 'speech' and self.mtl_per_batch and 'bwd' in dir:
                 enc_outs = self.encode(xs, task, flip=True)
+            elif self.input_type == 'speech' and self.mtl_per_batch and params['recog_fwd_bwd_attention']:
+                # Encode for the forward and backward decoders in a single pass
+                bs = len(xs)
+                enc_outs, enc_outs_bwd = split_enc_outs(
+                    self.encode(xs + xs, task, flip=[False] * bs + [True] * bs), bs)
             else:
                 enc_outs = self.encode(xs, task, flip=False)
 
@@ -601,57 +781,57 @@ class Seq2seq(ModelBase):
                                 lm_bwd = self.lm_bwd
 
                         # ensemble (forward)
-                        ensmbl_eouts_fwd = []
-                        ensmbl_elens_fwd = []
-                        ensmbl_decs_fwd = []
-                        if len(ensemble_models) > 0:
-                            for i_e, model in enumerate(ensemble_models):
-                                enc_outs_e_fwd = model.encode(xs, task, flip=False)
-                                ensmbl_eouts_fwd += [enc_outs_e_fwd[task]['xs']]
-                                ensmbl_elens_fwd += [enc_outs_e_fwd[task]['xlens']]
-                                ensmbl_decs_fwd += [model.dec_fwd]
-                                # NOTE: only support for the main task now
-
-                        nbest_hyps_id_fwd, aws_fwd, scores_fwd, cache_info = self.dec_fwd.beam_search(
-                            enc_outs[task]['xs'], enc_outs[task]['xlens'],
-                            params, idx2token, lm_fwd, lm_bwd, ctc_log_probs,
-                            params['recog_beam_width'], False, refs_id, utt_ids, speakers,
-                            ensmbl_eouts_fwd, ensmbl_elens_fwd, ensmbl_decs_fwd)
+                        ensmbl_eouts_fwd, ensmbl_elens_fwd = self.encode_ensemble(
+                            ensemble_models, xs, task, bwd=False)
+                        ensmbl_decs_fwd = [model.dec_fwd for model in ensemble_models]
+                        # NOTE: only support for the main task now
 
                         # backward decoder
-                        lm_bwd, lm_fwd = None, None
+                        lm_bwd_rev, lm_fwd_rev = None, None
                         if params['recog_lm_weight'] > 0 and hasattr(self, 'lm_bwd') and self.lm_bwd is not None:
-                            lm_bwd = self.lm_bwd
+                            lm_bwd_rev = self.lm_bwd
                             if params['recog_reverse_lm_rescoring'] and hasattr(self, 'lm_fwd') and self.lm_fwd is not None:
-                                lm_fwd = self.lm_fwd
+                                lm_fwd_rev = self.lm_fwd
 
                         # ensemble (backward)
-                        ensmbl_eouts_bwd = []
-                        ensmbl_elens_bwd = []
-                        ensmbl_decs_bwd = []
-                        if len(ensemble_models) > 0:
-                            for i_e, model in enumerate(ensemble_models):
-                                if self.input_type == 'speech' and self.mtl_per_batch:
-                                    enc_outs_e_bwd = model.encode(xs, task, flip=True)
-                                else:
-                                    enc_outs_e_bwd = model.encode(xs, task, flip=False)
-                                ensmbl_eouts_bwd += [enc_outs_e_bwd[task]['xs']]
-                                ensmbl_elens_bwd += [enc_outs_e_bwd[task]['xlens']]
-                                ensmbl_decs_bwd += [model.dec_bwd]
-                                # NOTE: only support for the main task now
-                                # TODO(hirofumi): merge with the forward for the efficiency
-
-                        flip = False
-                        if self.input_type == 'speech' and self.mtl_per_batch:
-                            flip = True
-                            enc_outs_bwd = self.encode(xs, task, flip=True)
+                        if any([model.input_type == 'speech' and model.mtl_per_batch for model in ensemble_models]):
+                            ensmbl_eouts_bwd, ensmbl_elens_bwd = self.encode_ensemble(
+                                ensemble_models, xs, task, bwd=True)
                         else:
+                            ensmbl_eouts_bwd, ensmbl_elens_bwd = ensmbl_eouts_fwd, ensmbl_elens_fwd
+                        ensmbl_decs_bwd = [model.dec_bwd for model in ensemble_models]
+                        # NOTE: only support for the main task now
+
+                        flip = enc_outs_bwd is not None
+                        if not flip:
                             enc_outs_bwd = enc_outs
-                        nbest_hyps_id_bwd, aws_bwd, scores_bwd, _ = self.dec_bwd.beam_search(
-                            enc_outs_bwd[task]['xs'], enc_outs[task]['xlens'],
-                            params, idx2token, lm_bwd, lm_fwd, ctc_log_probs,
-                            params['recog_beam_width'], False, refs_id, utt_ids, speakers,
-                            ensmbl_eouts_bwd, ensmbl_elens_bwd, ensmbl_decs_bwd)
+
+                        # Run both directional beam searches concurrently
+                        # NOTE: encoder outputs and CTC log-probs are shared
+                        def _beam_search_fwd():
+                            with torch.no_grad():
+                                return self.dec_fwd.beam_search(
+                                    enc_outs[task]['xs'], enc_outs[task]['xlens'],
+                                    params, idx2token, lm_fwd, lm_bwd, ctc_log_probs,
+                                    params['recog_beam_width'], False, refs_id, utt_ids, speakers,
+                                    ensmbl_eouts_fwd, ensmbl_elens_fwd, ensmbl_decs_fwd)
+
+                        def _beam_search_bwd():
+                            with torch.no_grad():
+                                return self.dec_bwd.beam_search(
+                                    enc_outs_bwd[task]['xs'], enc_outs[task]['xlens'],
+                                    params, idx2token, lm_bwd_rev, lm_fwd_rev, ctc_log_probs,
+                                    params['recog_beam_width'], False, refs_id, utt_ids, speakers,
+                                    ensmbl_eouts_bwd, ensmbl_elens_bwd, ensmbl_decs_bwd)
+
+                        pool = ThreadPool(2)
+                        try:
+                            result_fwd = pool.apply_async(_beam_search_fwd)
+                            result_bwd = pool.apply_async(_beam_search_bwd)
+                            nbest_hyps_id_fwd, aws_fwd, scores_fwd, cache_info = result_fwd.get()
+                            nbest_hyps_id_bwd, aws_bwd, scores_bwd, _ = result_bwd.get()
+                        finally:
+                            pool.close()
 
                         # forward-backward attention
                         best_hyps_id = fwd_bwd_attention(
@@ -662,19 +842,10 @@ class Seq2seq(ModelBase):
                         aws = None
                     else:
                         # ensemble
-                        ensmbl_eouts = []
-                        ensmbl_elens = []
-                        ensmbl_decs = []
-                        if len(ensemble_models) > 0:
-                            for i_e, model in enumerate(ensemble_models):
-                                if model.input_type == 'speech' and model.mtl_per_batch and 'bwd' in dir:
-                                    enc_outs_e = model.encode(xs, task, flip=True)
-                                else:
-                                    enc_outs_e = model.encode(xs, task, flip=False)
-                                ensmbl_eouts += [enc_outs_e[task]['xs']]
-                                ensmbl_elens += [enc_outs_e[task]['xlens']]
-                                ensmbl_decs += [getattr(model, 'dec_' + dir)]
-                                # NOTE: only support for the main task now
+                        ensmbl_eouts, ensmbl_elens = self.encode_ensemble(
+                            ensemble_models, xs, task, bwd='bwd' in dir)
+                        ensmbl_decs = [getattr(model, 'dec_' + dir) for model in ensemble_models]
+                        # NOTE: only support for the main task now
 
                         lm, lm_rev = None, None
                         if params['recog_lm_weight'] > 0 and hasattr(self, 'lm_' + dir) and getattr(self, 'lm_' + dir) is not None:
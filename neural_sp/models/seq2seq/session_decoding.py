@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Decode multiple sessions in parallel with state carry-over."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger('decoding')
+
+
+def schedule_sessions(sessions, n_slots):
+    """Make mini-batches of utterances from different sessions.
+
+    Each mini-batch has at most one utterance of each session, and utterances
+    of the same session are decoded in the given order. A slot is assigned to
+    a new session when its session runs out of utterances, and longer sessions
+    are assigned first so that few sessions are left at the end.
+
+    Args:
+        sessions (list): session of each utterance (in the onset order per session)
+        n_slots (int): maximum number of sessions decoded at once
+    Returns:
+        batches (list): A list of mini-batches, which contain indices of utterances
+
+    """
+    queues = OrderedDict()
+    for i, s in enumerate(sessions):
+        queues.setdefault(s, []).append(i)
+    waiting = sorted(queues.keys(), key=lambda s: len(queues[s]))  # pop the longest
+    active = []
+    batches = []
+    while len(waiting) > 0 or len(active) > 0:
+        while len(active) < n_slots and len(waiting) > 0:
+            active.append(waiting.pop())
+        batches.append([queues[s].pop(0) for s in active])
+        active = [s for s in active if len(queues[s]) > 0]
+    return batches
+
+
+def select_enc_outs(enc_outs, b):
+    """Select encoder outputs of the b-th utterance in a mini-batch."""
+    return {k: {'xs': v['xs'][b:b + 1, :v['xlens'][b]] if v['xs'] is not None else None,
+                'xlens': v['xlens'][b:b + 1] if v['xlens'] is not None else None}
+            for k, v in enc_outs.items()}
+
+
+class SessionParallelDecoder(object):
+    """Decode utterances of concurrent sessions with state carry-over.
+
+    Decoder/LM states and caches (recog_asr_state_carry_over,
+    recog_lm_state_carry_over and recog_n_caches) are kept in a slot per
+    session instead of the decoder itself, so a mini-batch can hold one
+    utterance of each of `n_slots` sessions. The encoder runs over the whole
+    mini-batch, and the state of each session is restored before decoding its
+    utterance and saved after that. State carry-over is used only in beam search,
+    and greedy decoding always takes the batched decoding path.
+
+    Args:
+        model (Seq2seq):
+        params (dict): hyper-parameters for decoding
+        idx2token (): converter from index to token
+        n_slots (int): maximum number of sessions decoded at once
+        task (str): ys* or ys_sub1* or ys_sub2*
+
+    """
+
+    def __init__(self, model, params, idx2token=None, n_slots=8, task='ys'):
+        self.model = model
+        self.params = dict(params, recog_batch_size=1)  # mini-batches are made here
+        self.idx2token = idx2token
+        self.n_slots = n_slots
+        self.task = task
+
+        if task.split('.')[0] == 'ys':
+            dir = 'bwd' if model.bwd_weight > 0 and params['recog_bwd_attention'] else 'fwd'
+        else:
+            dir = 'fwd_' + task.split('.')[0].split('_')[-1]
+        self.dec = getattr(model, 'dec_' + dir)
+        carry_over = params['recog_asr_state_carry_over'] or params['recog_lm_state_carry_over'] or \
+            params['recog_n_caches'] > 0
+        # NOTE: beam search supports a single utterance
+        self.batched = params['recog_beam_width'] == 1 and not params['recog_fwd_bwd_attention']
+        if carry_over and self.batched:
+            logger.info('State carry-over is ignored in greedy decoding.')
+        self.carry_over = carry_over and not self.batched and hasattr(self.dec, 'session_state')
+        # NOTE: encoder outputs cannot be shared when the backward decoder takes flipped inputs
+        self.share_enc_outs = not (model.mtl_per_batch and (
+            params['recog_bwd_attention'] or params['recog_fwd_bwd_attention']))
+        self.slots = {}
+
+    def _decode_batch(self, xs, sessions, utt_ids):
+        enc_outs = self.model.encode_for_decoding(xs, self.task) if self.share_enc_outs else None
+        if self.batched:
+            return self.model.decode(xs, self.params, self.idx2token, exclude_eos=True,
+                                     utt_ids=utt_ids, speakers=sessions, task=self.task,
+                                     enc_outs=enc_outs)[0]
+
+        hyps = []
+        for b, (x, session) in enumerate(zip(xs, sessions)):
+            if self.carry_over:
+                self.dec.set_session_state(self.slots.get(session))
+            hyps += self.model.decode([x], self.params, self.idx2token, exclude_eos=True,
+                                      utt_ids=[utt_ids[b]] if utt_ids is not None else None,
+                                      speakers=[session], task=self.task,
+                                      enc_outs=select_enc_outs(enc_outs, b) if enc_outs is not None else None)[0]
+            if self.carry_over:
+                self.slots[session] = self.dec.session_state()
+        return hyps
+
+    def __call__(self, xs, sessions, utt_ids=None):
+        """Decode utterances of multiple sessions.
+
+        Args:
+            xs (list): A list of length `[B]`, which contains arrays of size `[T, input_dim]`
+            sessions (list): A list of length `[B]`, session of each utterance.
+                Utterances of each session must be in the onset order.
+            utt_ids (list):
+        Returns:
+            best_hyps_id (list): A list of length `[B]`, which contains arrays of size `[L]`
+
+        """
+        best_hyps_id = [None] * len(xs)
+        last = {s: i for i, s in enumerate(sessions)}
+        for indices in schedule_sessions(sessions, self.n_slots):
+            hyps = self._decode_batch([xs[i] for i in indices],
+                                      [sessions[i] for i in indices],
+                                      [utt_ids[i] for i in indices] if utt_ids is not None else None)
+            for i, hyp in zip(indices, hyps):
+                best_hyps_id[i] = hyp
+            # Release slots of finished sessions
+            for i in indices:
+                if i == last[sessions[i]]:
+                    self.slots.pop(sessions[i], None)
+        return best_hyps_id
@@ -76,13 +76,14 @@ def compute_accuracy(logits, ys_ref, pad):
         ys_ref (LongTensor): `[B, T]`
         pad (int): index for padding
     Returns:
-        acc (float): teacher-forcing accuracy
+        acc (FloatTensor): teacher-forcing accuracy. A scalar on the device of logits,
+            which is not synchronized with the host until it is reduced by Reporter
     """
     pad_pred = logits.view(ys_ref.size(0), ys_ref.size(1), logits.size(-1)).argmax(2)
     mask = ys_ref != pad
     numerator = torch.sum(pad_pred.masked_select(mask) == ys_ref.masked_select(mask))
     denominator = torch.sum(mask)
-    acc = float(numerator) * 100 / float(denominator)
+    acc = numerator.float() * 100 / denominator.float()
     return acc
 
 
@@ -105,3 +106,26 @@ def to_onehot(ys, vocab, ylens=None):
             for t in range(ylens[b]):
                 ys_onehot[b, t, ys[b, t]] = 1
     return ys_onehot
+
+
+def is_quantized(module):
+    """Whether any submodule is replaced by torch.quantization.
+
+    Args:
+        module (torch.nn.Module):
+    Returns:
+        (bool):
+
+    """
+    return any('quantized' in type(m).__module__ for m in module.modules())
+
+
+def flatten_parameters(rnn):
+    """Compact the weights of nn.LSTM/nn.GRU (quantized RNNs have no such method).
+
+    Args:
+        rnn (torch.nn.Module):
+
+    """
+    if hasattr(rnn, 'flatten_parameters'):
+        rnn.flatten_parameters()
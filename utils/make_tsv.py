@@ -24,6 +24,12 @@ parser.add_argument('--feat', type=str, default='', nargs='?',
                     help='feats.scp file')
 parser.add_argument('--utt2num_frames', type=str, nargs='?',
                     help='utt2num_frames file')
+parser.add_argument('--wav', type=str, default='', nargs='?',
+                    help='wav.scp file (for the logmel frontend instead of --feat)')
+parser.add_argument('--n_mels', type=int, default=80, nargs='?',
+                    help='number of mel bins (for the logmel frontend)')
+parser.add_argument('--add_deltas', type=strtobool, default=False, nargs='?',
+                    help='append delta and delta-delta features (for the logmel frontend)')
 parser.add_argument('--utt2spk', type=str, nargs='?',
                     help='utt2spk file')
 parser.add_argument('--dict', type=str,
@@ -64,6 +70,13 @@ def main():
                 utt_id, feat_path = line.strip().split(' ')
                 utt2featpath[utt_id] = feat_path
 
+    if args.wav:
+        from neural_sp.datasets.frontend import wav_n_frames
+        with codecs.open(args.wav, 'r', encoding="utf-8") as f:
+            for line in f:
+                utt_id, wav_path = line.strip().split(' ')
+                utt2featpath[utt_id] = wav_path
+
     utt2num_frames = {}
     if args.utt2num_frames and os.path.isfile(args.utt2num_frames):
         with codecs.open(args.utt2num_frames, 'r', encoding="utf-8") as f:
@@ -113,7 +126,14 @@ def main():
             words.remove('')
 
         text = ' '.join(words)
-        if args.feat:
+        if args.wav:
+            feat_path = utt2featpath[utt_id]
+            xlen = wav_n_frames(feat_path)
+            speaker = utt2spk[utt_id]
+
+            if not os.path.isfile(feat_path):
+                raise ValueError('There is no file: %s' % feat_path)
+        elif args.feat:
             feat_path = utt2featpath[utt_id]
             xlen = utt2num_frames[utt_id]
             speaker = utt2spk[utt_id]
@@ -178,7 +198,9 @@ def main():
         ylen = len(token_ids)
 
         if xdim is None:
-            if args.feat:
+            if args.wav:
+                xdim = args.n_mels * 3 if args.add_deltas else args.n_mels
+            elif args.feat:
                 xdim = kaldi_io.read_mat(feat_path).shape[-1]
             else:
                 xdim = 0